@@ -1,5 +1,8 @@
-from .flow import QflowSystem
-from .config import get_api_key, validate_api_key, get_llm_config
+from .flow import QflowSystem, QflowEngine
+from .config import get_api_key, validate_api_key, get_llm_config, get_model, get_base_url, get_candidate_clusters, get_seed
+from .structured_log import configure_logging, get_logger
+from .transitions import TransitionLibrary
+from .budget import BudgetLimits, SessionBudget
 from .constants import (
     DEFAULT_MODEL,
     USER_PROXY_NAME,
@@ -11,9 +14,19 @@ from .constants import (
 
 __all__ = [
     'QflowSystem',
+    'QflowEngine',
+    'TransitionLibrary',
+    'BudgetLimits',
+    'SessionBudget',
     'get_api_key',
     'validate_api_key',
     'get_llm_config',
+    'get_model',
+    'get_base_url',
+    'get_candidate_clusters',
+    'get_seed',
+    'configure_logging',
+    'get_logger',
     'DEFAULT_MODEL',
     'USER_PROXY_NAME',
     'PLANNER_AGENT_NAME',
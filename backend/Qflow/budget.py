@@ -0,0 +1,139 @@
+import os
+from typing import Any, Dict, List, Optional
+
+##############################
+# --- Per-session budgets --- #
+"""
+Cumulative provider spend of one conversation: input/output tokens, wall
+time and calls, summed by QflowEngine._make_api_call for every call a
+session makes (tokens are estimated at ~4 characters each when a provider
+does not report usage).
+
+Sessions step down as their budget fills up:
+    normal    nothing changes
+    economy   (usage >= QFLOW_BUDGET_ECONOMY_AT) selection sees fewer
+              candidates and a trimmed answer, transitions come from the
+              local library when confident, calls use QFLOW_BUDGET_MODEL
+    minimal   (usage >= 1) selection and transitions are local, the closing
+              is canned; the final analysis still runs, on trimmed answers
+Usage is the larger of tokens / QFLOW_BUDGET_TOKENS and seconds /
+QFLOW_BUDGET_SECONDS; with neither set a session is always normal but its
+spend is still reported. Each turn's JSON progress carries the budget, and
+the caller hands it back with the next turn (--budget), as with used_indices.
+"""
+
+MODES = ("normal", "economy", "minimal")
+DEFAULT_ECONOMY_AT = 0.75
+CHARS_PER_TOKEN = 4
+
+
+def _env_number(name, default, cast=float):
+    try:
+        return cast(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class BudgetLimits:
+    """
+    Per-session limits shared by every session of an engine; 0 = no limit.
+    """
+    __slots__ = ("max_tokens", "max_seconds", "economy_at", "model")
+
+    def __init__(self, max_tokens: int = 0, max_seconds: float = 0.0, economy_at: float = DEFAULT_ECONOMY_AT,
+                 model: str = None):
+        self.max_tokens = max(0, int(max_tokens or 0))
+        self.max_seconds = max(0.0, float(max_seconds or 0.0))
+        self.economy_at = economy_at
+        self.model = model or None
+
+    @classmethod
+    def from_env(cls) -> "BudgetLimits":
+        return cls(_env_number("QFLOW_BUDGET_TOKENS", 0, int), _env_number("QFLOW_BUDGET_SECONDS", 0.0),
+                   _env_number("QFLOW_BUDGET_ECONOMY_AT", DEFAULT_ECONOMY_AT), os.getenv("QFLOW_BUDGET_MODEL"))
+
+
+def estimate_tokens(messages: List[Dict[str, str]] = None, text: str = None) -> int:
+    chars = sum(len(m.get("content") or "") for m in messages or ()) + len(text or "")
+    return -(-chars // CHARS_PER_TOKEN)
+
+
+class SessionBudget:
+    __slots__ = ("limits", "input_tokens", "output_tokens", "seconds", "calls", "estimated_calls")
+
+    def __init__(self, limits: BudgetLimits = None):
+        self.limits = limits or BudgetLimits()
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.seconds = 0.0
+        self.calls = 0
+        self.estimated_calls = 0
+
+    def record(self, seconds: float, input_tokens: Optional[int] = None, output_tokens: Optional[int] = None,
+               messages: List[Dict[str, str]] = None, text: str = None):
+        """
+        Add one provider call; missing token counts are estimated from the
+        messages and the response text.
+        """
+        if input_tokens is None or output_tokens is None:
+            self.estimated_calls += 1
+            if input_tokens is None:
+                input_tokens = estimate_tokens(messages)
+            if output_tokens is None:
+                output_tokens = estimate_tokens(text=text)
+        self.input_tokens += int(input_tokens)
+        self.output_tokens += int(output_tokens)
+        self.seconds += seconds
+        self.calls += 1
+
+    @property
+    def tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def usage(self) -> Optional[float]:
+        """
+        Fraction of the tighter limit used; None without limits.
+        """
+        fractions = []
+        if self.limits.max_tokens:
+            fractions.append(self.tokens / self.limits.max_tokens)
+        if self.limits.max_seconds:
+            fractions.append(self.seconds / self.limits.max_seconds)
+        return max(fractions) if fractions else None
+
+    def mode(self) -> str:
+        usage = self.usage()
+        if usage is None or usage < self.limits.economy_at:
+            return "normal"
+        return "economy" if usage < 1.0 else "minimal"
+
+    def to_dict(self) -> Dict[str, Any]:
+        usage = self.usage()
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "seconds": round(self.seconds, 3),
+            "calls": self.calls,
+            "estimated_calls": self.estimated_calls,
+            "limit_tokens": self.limits.max_tokens or None,
+            "limit_seconds": self.limits.max_seconds or None,
+            "usage": round(usage, 4) if usage is not None else None,
+            "mode": self.mode()
+        }
+
+    def restore(self, data: Dict[str, Any]):
+        """
+        Continue from a to_dict() snapshot handed back by the caller; limits
+        stay this engine's.
+        """
+        if not isinstance(data, dict):
+            return
+        self.input_tokens = int(data.get("input_tokens") or 0)
+        self.output_tokens = int(data.get("output_tokens") or 0)
+        self.seconds = float(data.get("seconds") or 0.0)
+        self.calls = int(data.get("calls") or 0)
+        self.estimated_calls = int(data.get("estimated_calls") or 0)
+
+    def reset(self):
+        self.input_tokens = self.output_tokens = self.calls = self.estimated_calls = 0
+        self.seconds = 0.0
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Build a transition library (see transitions.py) for a question bank: one
+provider call per cluster asks for generic bridges for every answer length
+and tone. Clusters whose answer can't be parsed keep the built-in templates.
+
+Usage (from backend/):
+    python Qflow/build_transitions.py build Qflow/life_narrative_32_questions.xlsx --out transitions.json
+    python Qflow/build_transitions.py classify "I loved it but the move was hard"
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from Qflow.flow import QflowEngine
+from Qflow.structured_log import get_logger
+from Qflow.transitions import LENGTHS, SENTIMENTS, LIBRARY_VERSION, confidence, response_features, valid_template
+
+log = get_logger("build_transitions")
+
+BUILD_PROMPT = f"""
+You are a warm, professional interviewer preparing reusable transitions for a personality assessment conversation.
+You will receive a group of related interview questions. Write short bridges (1-2 sentences) that acknowledge an
+answer and lead into the next question from this group, for each combination of answer length
+({", ".join(LENGTHS)}) and tone ({", ".join(SENTIMENTS)}).
+
+Rules:
+- Never refer to specific details of the answer; the bridge must fit any answer with that length and tone.
+- End every bridge with the literal placeholder {{question}}, which is replaced by the next question verbatim.
+- Be conversational, empathetic and varied; avoid sounding robotic.
+
+Respond ONLY with a JSON object whose keys are "<length>|<tone>" (for example "short|neutral") and whose
+values are lists of {{per_key}} bridges.
+"""
+
+
+def build_library(engine, per_key: int = 3, concurrency: int = 4) -> Dict[str, object]:
+    """
+    One provider call per cluster of the engine's bank; clusters whose call
+    fails or whose answer can't be parsed are skipped and keep using the
+    generic templates.
+    """
+    by_cluster = {}
+    for question in engine.question_bank:
+        by_cluster.setdefault(question.get("cluster_id"), []).append(question["question"])
+
+    def build_cluster(cluster_id):
+        questions = "\n".join(f"- {q}" for q in by_cluster[cluster_id][:5])
+        messages = [
+            {"role": "system", "content": BUILD_PROMPT.replace("{per_key}", str(per_key))},
+            {"role": "user", "content": f"Questions in this group:\n{questions}"}
+        ]
+        try:
+            text = engine._make_api_call(messages, temperature=0.7, call_type="transition_library")
+        except Exception as e:
+            log.error("Cluster failed: %s", e, extra={"fields": {
+                "cluster_id": cluster_id, "error_class": type(e).__name__
+            }})
+            return cluster_id, {}
+        try:
+            parsed = json.loads(text[text.find("{"):text.rfind("}") + 1])
+        except ValueError:
+            parsed = None
+        if not isinstance(parsed, dict):
+            log.warning("Unparseable transitions", extra={"fields": {"cluster_id": cluster_id}})
+            return cluster_id, {}
+        keys = {f"{length}|{sentiment}" for length in LENGTHS for sentiment in SENTIMENTS}
+        return cluster_id, {key: [t for t in values if valid_template(t)]
+                            for key, values in parsed.items() if key in keys and isinstance(values, list)}
+
+    templates = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for cluster_id, by_key in pool.map(build_cluster, list(by_cluster)):
+            by_key = {key: values for key, values in by_key.items() if values}
+            if by_key:
+                templates[f"cluster:{cluster_id}"] = by_key
+    return {"version": LIBRARY_VERSION, "built_at": time.time(), "model": engine.model, "templates": templates}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect a Qflow transition library")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="Generate per-cluster templates for a question bank")
+    build_parser.add_argument("bank", help="Question bank spreadsheet")
+    build_parser.add_argument("--out", required=True, help="Library JSON to write")
+    build_parser.add_argument("--per-key", type=int, default=3, help="Templates per length/tone combination")
+    build_parser.add_argument("--concurrency", type=int, default=4)
+
+    classify_parser = sub.add_parser("classify", help="Show the features and confidence for a response")
+    classify_parser.add_argument("response")
+
+    args = parser.parse_args()
+
+    if args.command == "classify":
+        features = response_features(args.response)
+        print(json.dumps(dict(features, confidence=round(confidence(features), 3))))
+        return 0
+
+    engine = QflowEngine(log_sink=None)
+    if not engine.load_questions_from_excel(args.bank):
+        print(f"Could not load question bank {args.bank}", file=sys.stderr)
+        return 1
+    library = build_library(engine, args.per_key, args.concurrency)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(library, f, indent=2, ensure_ascii=False)
+    print(json.dumps({"clusters": len(library["templates"]), "out": args.out}), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
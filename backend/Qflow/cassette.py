@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from .structured_log import get_logger
+
+###################################
+# --- Provider call cassettes --- #
+"""
+Record/replay of provider calls for deterministic benchmarks and regression
+runs. In record mode every _make_api_call appends the request, the response
+text, token usage and wall-clock latency to a JSONL cassette. In replay mode
+calls are answered from the cassette without touching the network, either
+with the recorded latency or with none.
+
+Requests are matched on a hash of (call_type, model, temperature, messages);
+identical requests are served in the order they were recorded, the last one
+being reused once the others are used up. Together with a fixed seed
+(QFLOW_SEED, see config.get_seed) a recorded conversation replays bit-for-bit.
+
+Selected with:
+    QFLOW_CASSETTE=path/to/calls.jsonl
+    QFLOW_CASSETTE_MODE=record | replay
+    QFLOW_CASSETTE_LATENCY=recorded | zero     (replay only, default recorded)
+"""
+
+log = get_logger("cassette")
+
+MODES = ("record", "replay")
+LATENCY_MODES = ("recorded", "zero")
+
+
+class CassetteMiss(LookupError):
+    """
+    A replayed request that was never recorded.
+    """
+
+
+def request_key(messages: List[Dict[str, str]], model: str, temperature: float, call_type: str) -> str:
+    payload = json.dumps([call_type, model, temperature, messages], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+
+    def __init__(self, path: str, mode: str, latency: str = "recorded"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected one of {MODES}")
+        if latency not in LATENCY_MODES:
+            raise ValueError(f"Unknown cassette latency {latency!r}; expected one of {LATENCY_MODES}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entries: Dict[str, deque] = {}
+        self._file = None
+        if mode == "replay":
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self):
+        count = 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._entries.setdefault(entry["key"], deque()).append(entry)
+                count += 1
+        log.info("Loaded cassette", extra={"fields": {"path": self.path, "calls": count}})
+
+    def record(self, messages, model, temperature, call_type, text, latency_s,
+               input_tokens=None, output_tokens=None):
+        entry = {
+            "key": request_key(messages, model, temperature, call_type),
+            "call_type": call_type,
+            "model": model,
+            "temperature": temperature,
+            "messages": messages,
+            "response": text,
+            "latency_s": latency_s,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens
+        }
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def replay(self, messages, model, temperature, call_type) -> Dict[str, Any]:
+        """
+        The next recorded entry for this request, after sleeping its recorded
+        latency unless latency is "zero". Raises CassetteMiss if there is none.
+        """
+        key = request_key(messages, model, temperature, call_type)
+        with self._lock:
+            pending = self._entries.get(key)
+            if not pending:
+                raise CassetteMiss(f"No recorded {call_type} call for request {key[:12]} in {self.path}")
+            entry = pending.popleft() if len(pending) > 1 else pending[0]
+        if self.latency == "recorded" and entry.get("latency_s"):
+            time.sleep(entry["latency_s"])
+        return entry
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+
+def cassette_from_env() -> Optional[Cassette]:
+    path = os.getenv("QFLOW_CASSETTE")
+    if not path:
+        return None
+    return Cassette(path, os.getenv("QFLOW_CASSETTE_MODE", "replay"),
+                    os.getenv("QFLOW_CASSETTE_LATENCY", "recorded"))
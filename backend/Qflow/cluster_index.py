@@ -0,0 +1,58 @@
+import random
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+#######################################
+# --- Cluster index over the bank --- #
+"""
+Precomputed cluster -> question index mapping for a question bank, used by
+select_next_question to offer the LLM only questions from the least-covered
+clusters instead of every unused question.
+
+A cluster's coverage is the fraction of its questions the session has already
+used. The k clusters with the lowest coverage that still have unused questions
+are offered; ties are broken randomly so singleton-cluster banks (one question
+per cluster) still see a varied candidate set.
+"""
+
+
+class ClusterIndex:
+    __slots__ = ("cluster_of", "members")
+
+    def __init__(self, question_bank: List[Dict[str, Any]]):
+        self.cluster_of: List[Hashable] = []
+        members: Dict[Hashable, List[int]] = {}
+        for idx, question in enumerate(question_bank):
+            cluster_id = question.get("cluster_id", idx)
+            self.cluster_of.append(cluster_id)
+            members.setdefault(cluster_id, []).append(idx)
+        self.members: Dict[Hashable, Tuple[int, ...]] = {c: tuple(m) for c, m in members.items()}
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def coverage(self, used: Iterable[int]) -> Dict[Hashable, float]:
+        """
+        Fraction of each cluster's questions already used this session.
+        """
+        counts = dict.fromkeys(self.members, 0)
+        for idx in used:
+            if 0 <= idx < len(self.cluster_of):
+                counts[self.cluster_of[idx]] += 1
+        return {c: counts[c] / len(m) for c, m in self.members.items()}
+
+    def candidates(self, unused: Iterable[int], used: Iterable[int], k: int,
+                   rng: Optional[random.Random] = None) -> List[int]:
+        """
+        Unused question indices from the k least-covered clusters, in bank order.
+        """
+        rng = rng or random
+        open_clusters: Dict[Hashable, List[int]] = {}
+        for idx in unused:
+            if 0 <= idx < len(self.cluster_of):
+                open_clusters.setdefault(self.cluster_of[idx], []).append(idx)
+        if len(open_clusters) <= k:
+            return sorted(idx for members in open_clusters.values() for idx in members)
+
+        coverage = self.coverage(used)
+        ranked = sorted(open_clusters, key=lambda c: (coverage[c], rng.random()))
+        return sorted(idx for c in ranked[:k] for idx in open_clusters[c])
@@ -1,6 +1,9 @@
 import os
 from dotenv import load_dotenv
-from .constants import DEFAULT_MODEL
+from .constants import DEFAULT_MODEL, DEFAULT_CANDIDATE_CLUSTERS, DEFAULT_SEED
+from .structured_log import get_logger
+
+log = get_logger("config")
 
 
 
@@ -45,7 +48,72 @@ def get_api_key(api_key_input: str = None) -> str:
     if env_api_key:
         return env_api_key
 
-    print("Warning: API key not found via input argument, .env file, or environment variables.")
+    # stderr, not stdout: the CLIs' stdout is the JSON the Node routes parse
+    log.warning("API key not found via input argument, .env file, or environment variables")
+    return None
+
+
+
+#################################
+# --- get model / base url  --- #
+"""
+Optional overrides for the model and the provider endpoint, e.g. to point
+QflowSystem at a local OpenAI/Anthropic-compatible server for benchmarks.
+"""
+def get_model(model_input: str = None) -> str:
+
+    if model_input:
+        return model_input
+    return os.getenv("LLM_MODEL") or DEFAULT_MODEL
+
+
+def get_base_url(base_url_input: str = None) -> str:
+
+    if base_url_input:
+        return base_url_input
+    return os.getenv("LLM_BASE_URL") or None
+
+
+
+
+##################################
+# --- get candidate clusters --- #
+"""
+How many of the least-covered clusters select_next_question offers the LLM;
+0 disables pruning and offers every unused question.
+"""
+def get_candidate_clusters(candidate_clusters_input: int = None) -> int:
+
+    if candidate_clusters_input is not None:
+        return max(0, int(candidate_clusters_input))
+    try:
+        return max(0, int(os.getenv("QFLOW_CANDIDATE_CLUSTERS", DEFAULT_CANDIDATE_CLUSTERS)))
+    except ValueError:
+        return DEFAULT_CANDIDATE_CLUSTERS
+
+
+
+####################
+# --- get seed --- #
+"""
+Seed for QflowSystem's random choices (starting question, fallbacks, cluster
+tie-breaks). QFLOW_SEED sets it; with a provider-call cassette configured
+(QFLOW_CASSETTE) it defaults to DEFAULT_SEED so replays are reproducible.
+None means unseeded, as before.
+"""
+def get_seed(seed_input: int = None):
+
+    if seed_input is not None:
+        return int(seed_input)
+    env_seed = os.getenv("QFLOW_SEED")
+    if env_seed:
+        try:
+            return int(env_seed)
+        except ValueError:
+            # Logged to stderr: stdout carries the JSON the Node routes parse
+            log.warning("Ignoring non-integer QFLOW_SEED=%r", env_seed)
+    if os.getenv("QFLOW_CASSETTE"):
+        return DEFAULT_SEED
     return None
 
 
@@ -14,6 +14,10 @@ TERMINATION_MSG = "TERMINATE"
 DEFAULT_SEED = 42
 DEFAULT_TEMPERATURE = 0.0
 
+# Question selection: clusters offered to the LLM per turn (0 = every unused question).
+# Opt-in: on banks with one question per cluster, pruning only hides questions
+DEFAULT_CANDIDATE_CLUSTERS = 0
+
 # Default dummy agent config for flexible initialization
 DEFAULT_DUMMY_AGENT_CONFIG = [
     {"name": "Dummy_Agent", "system_prompt": "You are a helpful assistant.", "is_terminating": True}
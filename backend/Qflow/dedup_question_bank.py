@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection for Qflow question banks.
+
+Questions are reduced to word 3-gram shingles and MinHash signatures
+(num_perm universal hashes, computed with NumPy). Locality-sensitive hashing
+splits each signature into bands; only questions sharing a band bucket are
+compared, and those candidates are confirmed with the exact Jaccard
+similarity of their shingle sets. Work grows with the number of questions and
+true near-duplicates rather than with every pair, so banks of tens of
+thousands of candidates stay fast.
+
+Duplicates are grouped transitively (union-find). The first question of a
+group in bank order is kept; the others are flagged, and `collapse` writes the
+bank without them. `check` flags questions of a new bank that duplicate an
+existing one, e.g. before merging a generate_question_bank.py run.
+
+Usage (from backend/):
+    python Qflow/dedup_question_bank.py report bank.xlsx
+    python Qflow/dedup_question_bank.py collapse bank.xlsx deduped.xlsx --threshold 0.7
+    python Qflow/dedup_question_bank.py check new_bank.xlsx --against Qflow/life_narrative_32_questions.xlsx
+"""
+
+import os
+import re
+import sys
+import json
+import zlib
+import argparse
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import numpy as np
+import pandas as pd
+
+from Qflow.constants import TERMINATION_MSG
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_THRESHOLD = 0.6
+SHINGLE_SIZE = 3
+
+# Universal hashing (a*x + b) mod P; a, b < P and x < P keep every product in uint64
+_PRIME = np.uint64((1 << 31) - 1)
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> frozenset:
+    """
+    Word n-grams of the normalized question; questions shorter than `size`
+    words fall back to their words.
+    """
+    words = _WORD.findall(str(text).replace(TERMINATION_MSG, "").lower())
+    if len(words) < size:
+        return frozenset(words)
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def lsh_bands(num_perm: int, threshold: float):
+    """
+    (bands, rows) with bands * rows == num_perm whose S-curve midpoint
+    (1/bands)^(1/rows) is the highest one at or below the threshold.
+    Candidates are confirmed with exact Jaccard, so erring low only costs
+    comparisons while erring high misses duplicates.
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    midpoint = lambda br: (1.0 / br[0]) ** (1.0 / br[1])
+    below = [br for br in options if midpoint(br) <= threshold]
+    if not below:
+        return min(options, key=midpoint)
+    return max(below, key=midpoint)
+
+
+class MinHashIndex:
+    """
+    LSH index of question shingle sets. add() questions under a key, then
+    query() a text or duplicate_pairs() over everything added.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, threshold: float = DEFAULT_THRESHOLD, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        self._a = rng.integers(1, int(_PRIME), num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), num_perm, dtype=np.uint64)
+        self.keys = []
+        self.shingle_sets = []
+        self._buckets = [{} for _ in range(self.bands)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def signature(self, shingle_set: frozenset) -> np.ndarray:
+        if not shingle_set:
+            return np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+        x %= _PRIME
+        return ((self._a[:, None] * x[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, key, text: str):
+        position = len(self.keys)
+        shingle_set = shingles(text)
+        self.keys.append(key)
+        self.shingle_sets.append(shingle_set)
+        for band, band_key in enumerate(self._band_keys(self.signature(shingle_set))):
+            self._buckets[band].setdefault(band_key, []).append(position)
+
+    def query(self, text: str):
+        """
+        [(key, similarity)] of indexed questions at or above the threshold,
+        most similar first.
+        """
+        shingle_set = shingles(text)
+        candidates = set()
+        for band, band_key in enumerate(self._band_keys(self.signature(shingle_set))):
+            candidates.update(self._buckets[band].get(band_key, ()))
+        matches = [(self.keys[i], jaccard(shingle_set, self.shingle_sets[i])) for i in candidates]
+        return sorted((m for m in matches if m[1] >= self.threshold), key=lambda m: -m[1])
+
+    def duplicate_pairs(self):
+        """
+        (i, j, similarity) with i < j for every confirmed pair among the
+        added questions, by position.
+        """
+        seen = set()
+        pairs = []
+        for buckets in self._buckets:
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                for x, i in enumerate(members):
+                    for j in members[x + 1:]:
+                        if (i, j) in seen:
+                            continue
+                        seen.add((i, j))
+                        similarity = jaccard(self.shingle_sets[i], self.shingle_sets[j])
+                        if similarity >= self.threshold:
+                            pairs.append((i, j, similarity))
+        return sorted(pairs)
+
+
+def duplicate_groups(n: int, pairs) -> list:
+    """
+    Connected components (size > 1) of the pair graph, each sorted by
+    position so the first member is the one kept.
+    """
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j, _ in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def load_bank(path: str, question_column: str = "Final_Question") -> pd.DataFrame:
+    """
+    Rows with a question; attrs["cluster_column"] names the column the
+    report groups by (load_questions_from_excel reads question_id as the
+    cluster when there is no cluster_id).
+    """
+    df = pd.read_csv(path) if path.endswith(".csv") else pd.read_excel(path)
+    if question_column not in df.columns:
+        raise ValueError(f"{path} has no {question_column!r} column")
+    df = df[df[question_column].notna()].reset_index(drop=True)
+    df.attrs["cluster_column"] = next((c for c in ("cluster_id", "question_id") if c in df.columns), None)
+    return df
+
+
+def find_duplicates(df: pd.DataFrame, question_column: str = "Final_Question",
+                    num_perm: int = DEFAULT_NUM_PERM, threshold: float = DEFAULT_THRESHOLD):
+    """
+    Index a bank and return (groups, pairs, duplicate_rows): duplicate_rows
+    maps each flagged row to the row it duplicates.
+    """
+    index = MinHashIndex(num_perm, threshold)
+    for row, text in enumerate(df[question_column]):
+        index.add(row, text)
+    pairs = index.duplicate_pairs()
+    groups = duplicate_groups(len(df), pairs)
+    duplicate_rows = {member: group[0] for group in groups for member in group[1:]}
+    return groups, pairs, duplicate_rows
+
+
+def cluster_report(df: pd.DataFrame, duplicate_rows: dict) -> list:
+    """
+    Per cluster: questions, flagged duplicates, and how many of those
+    duplicate a question kept in another cluster.
+    """
+    cluster_column = df.attrs.get("cluster_column")
+    clusters = df[cluster_column].tolist() if cluster_column else [None] * len(df)
+    report = {}
+    for row, cluster in enumerate(clusters):
+        entry = report.setdefault(cluster, {"cluster_id": cluster, "questions": 0, "duplicates": 0, "cross_cluster": 0})
+        entry["questions"] += 1
+        if row in duplicate_rows:
+            entry["duplicates"] += 1
+            if clusters[duplicate_rows[row]] != cluster:
+                entry["cross_cluster"] += 1
+    return [_jsonable(entry) for entry in report.values()]
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinHash/LSH near-duplicate detection for question banks")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Jaccard similarity of word 3-grams")
+    parser.add_argument("--num-perm", type=int, default=DEFAULT_NUM_PERM)
+    parser.add_argument("--question-column", default="Final_Question")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = sub.add_parser("report", help="Flag near-duplicates, with a per-cluster report")
+    report_parser.add_argument("bank")
+    report_parser.add_argument("--pairs", action="store_true", help="Include every duplicate pair")
+
+    collapse_parser = sub.add_parser("collapse", help="Write the bank without flagged duplicates")
+    collapse_parser.add_argument("bank")
+    collapse_parser.add_argument("destination")
+
+    check_parser = sub.add_parser("check", help="Flag questions that duplicate an existing bank")
+    check_parser.add_argument("bank")
+    check_parser.add_argument("--against", required=True, help="Existing question bank")
+
+    args = parser.parse_args()
+
+    try:
+        df = load_bank(args.bank, args.question_column)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {args.bank}: {e}", file=sys.stderr)
+        return 1
+
+    if args.command == "check":
+        try:
+            existing = load_bank(args.against, args.question_column)
+        except (OSError, ValueError) as e:
+            print(f"Could not read {args.against}: {e}", file=sys.stderr)
+            return 1
+        index = MinHashIndex(args.num_perm, args.threshold)
+        for row, text in enumerate(existing[args.question_column]):
+            index.add(row, text)
+        flagged = []
+        for row, text in enumerate(df[args.question_column]):
+            matches = index.query(text)
+            if matches:
+                match_row, similarity = matches[0]
+                flagged.append({"row": row, "question": text, "matches_row": match_row,
+                                "matches": existing[args.question_column][match_row],
+                                "similarity": round(similarity, 3)})
+        print(json.dumps({"questions": len(df), "flagged": len(flagged), "duplicates": flagged}, indent=2))
+        return 0
+
+    groups, pairs, duplicate_rows = find_duplicates(df, args.question_column, args.num_perm, args.threshold)
+
+    if args.command == "collapse":
+        kept = df.drop(index=sorted(duplicate_rows)).reset_index(drop=True)
+        if args.destination.endswith(".csv"):
+            kept.to_csv(args.destination, index=False)
+        else:
+            kept.to_excel(args.destination, index=False)
+        print(json.dumps({"questions": len(df), "removed": len(duplicate_rows), "written": len(kept)}))
+        return 0
+
+    result = {
+        "questions": len(df),
+        "duplicates": len(duplicate_rows),
+        "groups": [[int(row) for row in group] for group in groups],
+        "clusters": cluster_report(df, duplicate_rows)
+    }
+    if args.pairs:
+        result["pairs"] = [{"rows": [i, j], "similarity": round(s, 3)} for i, j, s in pairs]
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
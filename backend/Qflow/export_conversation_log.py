@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Offline export of an append-only conversation log (see log_sink.py) to the
+Excel layout save_conversation_log used to write, or to Parquet.
+
+Usage:
+    python Qflow/export_conversation_log.py logs/conversations.jsonl out.xlsx
+    python Qflow/export_conversation_log.py logs/conversations.db out.parquet --session <id>
+"""
+
+import sys
+import os
+import argparse
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import pandas as pd
+
+from Qflow.log_sink import read_entries, COLUMNS
+
+
+def export_log(source: str, destination: str, session_id: str = None) -> int:
+    """
+    Write the entries of `source` (optionally one session) to `destination`;
+    the format follows its extension. Returns the number of rows written.
+    """
+    entries = (e for e in read_entries(source) if session_id is None or e.get("session_id") == session_id)
+    df = pd.DataFrame.from_records(entries, columns=list(COLUMNS))
+    if not df.empty:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+
+    if destination.endswith(".parquet"):
+        df.to_parquet(destination, index=False)
+    elif destination.endswith((".xlsx", ".xls")):
+        df.to_excel(destination, index=False)
+    elif destination.endswith(".csv"):
+        df.to_csv(destination, index=False)
+    else:
+        raise ValueError(f"Unsupported output format: {destination}")
+    return len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a Qflow conversation log to Excel/Parquet")
+    parser.add_argument("source", help="JSONL or SQLite conversation log")
+    parser.add_argument("destination", help="Output file (.xlsx, .parquet or .csv)")
+    parser.add_argument("--session", help="Only export this session_id")
+    args = parser.parse_args()
+
+    try:
+        rows = export_log(args.source, args.destination, args.session)
+    except (OSError, ValueError, ImportError) as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Exported {rows} interaction(s) to {args.destination}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
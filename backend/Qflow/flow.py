@@ -4,139 +4,244 @@ import openai
 import anthropic
 import pandas as pd
 from datetime import datetime
-from .config import get_api_key, get_llm_config
+from .config import get_api_key, get_llm_config, get_model, get_base_url, get_candidate_clusters, get_seed
 from .constants import DEFAULT_MODEL, DEFAULT_SEED, DEFAULT_TEMPERATURE
 import random
 from typing import List, Dict, Optional, Any
-import sys
+from types import MappingProxyType
+import time
+import uuid
 
 from .constants import TERMINATION_MSG
+from . import metrics
+from .structured_log import get_logger
+from .log_sink import LogSink, sink_from_env
+from .cluster_index import ClusterIndex
+from .cassette import Cassette, cassette_from_env
+from .transitions import TransitionLibrary, transitions_from_env
+from .local_backend import get_local_backend, is_local_model, local_call_types
+from .budget import BudgetLimits, SessionBudget
+from .tracing import span, traced, current_span, SPAN_KIND_CLIENT
+
+log = get_logger("flow")
+
+# Budget economy mode: fewer candidates and a shorter answer in the selection prompt
+ECONOMY_CANDIDATES = 10
+ECONOMY_RESPONSE_WORDS = 120
+# Templates for sessions over budget when the engine has no transition library
+_BUDGET_TRANSITIONS = TransitionLibrary()
+
+
+def _note_fallback(source: str, reason: str):
+    """
+    Record that a canned/random fallback replaced a provider answer.
+    """
+    current_span().set_attributes({"qflow.fallback": True, "qflow.fallback_reason": reason})
+    metrics.record_fallback(source, reason)
+
 
 #############################
-# --- QflowSystem class --- #
+# --- QflowEngine class --- #
 """
-QflowSystem for managing conversational question flows with specific function structure.
-
-Functions:
-1. start_greeting() - Initial greeting and readiness check
-2. detect_user_reply() - Handle yes/no responses
-3. get_user_input() - Accept user input
-4. select_next_question() - AI-powered question selection via Claude/OpenAI API
-5. generate_ai_reply() - AI-generated transitions via Claude/OpenAI API
-6. track_questions() - Track used/unused questions
-7. end_conversation() - AI-generated closing
+Resources shared by every session in a process: configuration, the provider
+client and the question bank with its cluster index. Read-only once the bank
+is loaded, so one engine can back thousands of QflowSystem sessions.
 """
 
-class QflowSystem:
+class QflowEngine:
     
-    def __init__(self):
+    def __init__(self, model: str = None, base_url: str = None, log_sink: LogSink = None,
+                 candidate_clusters: int = None, cassette: Cassette = None, seed: int = None,
+                 transitions: TransitionLibrary = None, budget_limits: BudgetLimits = None):
         self.api_key = get_api_key()
-        self.model = DEFAULT_MODEL
-        self.question_bank = []
-        self.used_questions = set()
-        self.conversation_log = []
+        self.model = get_model(model)
+        self.base_url = get_base_url(base_url)
+        self.candidate_clusters = get_candidate_clusters(candidate_clusters)
+        self.log_sink = log_sink if log_sink is not None else sink_from_env()
+        self.cassette = cassette if cassette is not None else cassette_from_env()
+        self.seed = get_seed(seed)
+        self.transitions = transitions if transitions is not None else transitions_from_env()
+        self.budget_limits = budget_limits if budget_limits is not None else BudgetLimits.from_env()
+        self.question_bank = ()
+        self.cluster_index = None
+        self.all_questions_mask = 0
+        self.local_backend = None
+        self.local_call_types = frozenset()
+        
+        if self.cassette is not None and self.cassette.replaying:
+            # Replayed calls never reach a provider, so no client (or API key) is needed
+            model_lower = self.model.lower()
+            self.client_type = ("local" if is_local_model(self.model)
+                                else "anthropic" if "claude" in model_lower or "anthropic" in model_lower else "openai")
+            self.client = None
+        else:
+            with span("qflow.client_init", model=self.model):
+                self._init_client()
         
-        # Determine which client to use based on model
+
+
+
+    #############################
+    # --- Initialize client --- #
+    """
+    Determine which client to use based on model.
+    """
+    def _init_client(self):
         model_lower = self.model.lower()
         
+        if is_local_model(self.model):
+            # On-box model for every call; LLM_MODEL=local:<path.gguf> or QFLOW_LOCAL_MODEL
+            self.client_type = "local"
+            self.client = get_local_backend(self.model.partition(":")[2] or None)
+            log.info("Initialized local client", extra={"fields": {"model": self.client.model_name}})
+            return
+        
+        # A hosted model can still send its cheap call types to a local one
+        self.local_call_types = local_call_types()
+        if self.local_call_types:
+            self.local_backend = get_local_backend()
+        
         if "claude" in model_lower or "anthropic" in model_lower:
             # Use Anthropic client for Claude models
             self.client_type = "anthropic"
             try:
-                self.client = anthropic.Anthropic(api_key=self.api_key)
-                print(f"Initialized Anthropic client for model: {self.model}", file=sys.stderr)
+                self.client = anthropic.Anthropic(api_key=self.api_key, base_url=self.base_url)
+                log.info("Initialized Anthropic client", extra={"fields": {"model": self.model}})
             except Exception as e:
-                print(f"Error initializing Anthropic client: {e}", file=sys.stderr)
+                log.error("Error initializing Anthropic client: %s", e)
                 raise ValueError(f"Failed to initialize Anthropic client: {e}")
         elif "gpt" in model_lower or "openai" in model_lower:
             # Use OpenAI client for GPT models  
             self.client_type = "openai"
             try:
                 openai.api_key = self.api_key
-                self.client = openai.OpenAI(api_key=self.api_key)
-                print(f"Initialized OpenAI client for model: {self.model}", file=sys.stderr)
+                self.client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url)
+                log.info("Initialized OpenAI client", extra={"fields": {"model": self.model}})
             except Exception as e:
-                print(f"Error initializing OpenAI client: {e}", file=sys.stderr)
+                log.error("Error initializing OpenAI client: %s", e)
                 raise ValueError(f"Failed to initialize OpenAI client: {e}")
         else:
             # Warn about unknown model but default to OpenAI
-            print(f"Warning: Unknown model type '{self.model}'. Defaulting to OpenAI client.", file=sys.stderr)
+            log.warning("Unknown model type %r, defaulting to OpenAI client", self.model)
             self.client_type = "openai"
             try:
                 openai.api_key = self.api_key
-                self.client = openai.OpenAI(api_key=self.api_key)
-                print(f"Defaulting to OpenAI client for model: {self.model}", file=sys.stderr)
+                self.client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url)
+                log.info("Defaulted to OpenAI client", extra={"fields": {"model": self.model}})
             except Exception as e:
-                print(f"Error initializing OpenAI client: {e}", file=sys.stderr)
+                log.error("Error initializing OpenAI client: %s", e)
                 raise ValueError(f"Failed to initialize OpenAI client: {e}")
-        
-        # Question management
-        self.unused_questions = set()
-        self.current_question_index = None
-        
-        # Conversation state
-        self.conversation_started = False
-        self.user_ready = False
-        
+
 
     #####################################
     # --- Universal API call method --- #
     """
-    Make API calls that work with both OpenAI and Anthropic clients.
+    Make API calls that work with OpenAI, Anthropic and local clients.
+    The call is charged to budget when given; model overrides the hosted
+    model for this call only (a session's cheaper budget model).
     """
-    def _make_api_call(self, messages: List[Dict[str, str]], temperature: float = 0.7) -> str:
-        try:
-            if self.client_type == "anthropic":
-                # Convert messages format for Claude
-                system_message = ""
-                user_messages = []
-                
-                for msg in messages:
-                    if msg["role"] == "system":
-                        system_message = msg["content"]
-                    else:
-                        user_messages.append(msg)
-                
-                # Make Claude API call
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=2048,  # Increased for better response quality
-                    temperature=temperature,
-                    system=system_message,
-                    messages=user_messages
-                )
-                
-                return response.content[0].text.strip()
-                
-            else:
-                # OpenAI API call
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    temperature=temperature,
-                    messages=messages
-                )
-                
-                return response.choices[0].message.content.strip()
-                
-        except Exception as e:
-            print(f"API call error: {e}", file=sys.stderr)
-            raise e
+    def _make_api_call(self, messages: List[Dict[str, str]], temperature: float = 0.7, call_type: str = "other",
+                       budget: SessionBudget = None, model: str = None) -> str:
+        # Call types routed to the local model are reported under its name
+        routed_local = self.local_backend is not None and call_type in self.local_call_types
+        request_model = model or self.model
+        model_label = self.local_backend.model_name if routed_local else request_model
+        with span("llm.call", kind=SPAN_KIND_CLIENT, **{
+            "gen_ai.system": "local" if routed_local else self.client_type,
+            "gen_ai.request.model": model_label,
+            "gen_ai.request.temperature": temperature,
+            "qflow.call_type": call_type
+        }) as call_span:
+            started = time.perf_counter()
+            input_tokens = output_tokens = None
+            try:
+                if self.cassette is not None and self.cassette.replaying:
+                    entry = self.cassette.replay(messages, request_model, temperature, call_type)
+                    input_tokens = entry.get("input_tokens")
+                    output_tokens = entry.get("output_tokens")
+                    text = entry["response"]
+                    
+                elif self.client_type == "local" or routed_local:
+                    backend = self.local_backend if routed_local else self.client
+                    text, input_tokens, output_tokens = backend.complete(messages, temperature)
+                    
+                elif self.client_type == "anthropic":
+                    # Convert messages format for Claude
+                    system_message = ""
+                    user_messages = []
+                    
+                    for msg in messages:
+                        if msg["role"] == "system":
+                            system_message = msg["content"]
+                        else:
+                            user_messages.append(msg)
+                    
+                    # Make Claude API call
+                    response = self.client.messages.create(
+                        model=request_model,
+                        max_tokens=2048,  # Increased for better response quality
+                        temperature=temperature,
+                        system=system_message,
+                        messages=user_messages
+                    )
+                    
+                    usage = getattr(response, "usage", None)
+                    input_tokens = getattr(usage, "input_tokens", None)
+                    output_tokens = getattr(usage, "output_tokens", None)
+                    text = response.content[0].text.strip()
+                    
+                else:
+                    # OpenAI API call
+                    response = self.client.chat.completions.create(
+                        model=request_model,
+                        temperature=temperature,
+                        messages=messages
+                    )
+                    
+                    usage = getattr(response, "usage", None)
+                    input_tokens = getattr(usage, "prompt_tokens", None)
+                    output_tokens = getattr(usage, "completion_tokens", None)
+                    text = response.choices[0].message.content.strip()
+                    
+            except Exception as e:
+                log.warning("API call error: %s", e, extra={"fields": {"call_type": call_type, "error_class": type(e).__name__}})
+                elapsed = time.perf_counter() - started
+                metrics.observe_llm_call(call_type, model_label, elapsed, error=e)
+                if budget is not None:
+                    # Failed calls still cost the session their wall time
+                    budget.record(elapsed, 0, 0)
+                raise e
+
+            elapsed = time.perf_counter() - started
+            metrics.observe_llm_call(call_type, model_label, elapsed, input_tokens, output_tokens)
+            if budget is not None:
+                budget.record(elapsed, input_tokens, output_tokens, messages, text)
+            if self.cassette is not None and not self.cassette.replaying:
+                self.cassette.record(messages, request_model, temperature, call_type, text, elapsed,
+                                     input_tokens, output_tokens)
+            call_span.set_attributes({
+                "gen_ai.usage.input_tokens": input_tokens,
+                "gen_ai.usage.output_tokens": output_tokens
+            })
+            return text
+
+
 
 
     #####################################
     # --- Load questions from excel --- #
     """
-    Load questions and their cluster_id from an Excel file.
+    Load questions and their cluster_id from an Excel file into the shared bank.
     """
+    @traced("qflow.load_questions")
     def load_questions_from_excel(self, file_path: str, question_column: str = "Final_Question", id_column: str = "question_id") -> bool:
         try:
-            print(f"Reading Excel file: {file_path}", file=sys.stderr)
+            log.debug("Reading Excel file %s", file_path)
             df = pd.read_excel(file_path)
-            print(f"Excel columns: {df.columns.tolist()}", file=sys.stderr)
             
             if question_column not in df.columns or id_column not in df.columns:
-                print(f"Error: Required columns ('{question_column}', '{id_column}') not found.", file=sys.stderr)
-                print(f"Available columns: {df.columns.tolist()}", file=sys.stderr)
+                log.error("Required columns (%r, %r) not found", question_column, id_column,
+                          extra={"fields": {"columns": [str(c) for c in df.columns]}})
                 return False
             
             # Create a list of question objects
@@ -155,24 +260,207 @@ class QflowSystem:
                         "cluster_id": int(cluster_id) if str(cluster_id).isdigit() else index
                     })
             
-            print(f"Cleaned questions count: {len(question_data)}", file=sys.stderr)
-            if len(question_data) > 0:
-                print(f"First question: {question_data[0]['question']}", file=sys.stderr)
             
-            self.question_bank = question_data
-            self.used_questions = set()
-            self.unused_questions = set(range(len(self.question_bank)))
+            self.set_question_bank(question_data)
             
-            print(f"Final question bank size: {len(self.question_bank)}", file=sys.stderr)
-            print(f"Unused questions set size: {len(self.unused_questions)}", file=sys.stderr)
+            current_span().set_attributes({
+                "qflow.file": os.path.basename(file_path),
+                "qflow.questions": len(question_data),
+                "qflow.clusters": len(self.cluster_index)
+            })
+            log.info("Question bank loaded", extra={"fields": {"questions": len(self.question_bank)}})
             
             return len(self.question_bank) > 0
                 
         except Exception as e:
-            print(f"Error loading questions: {e}", file=sys.stderr)
-            import traceback
-            print(traceback.format_exc(), file=sys.stderr)
+            log.exception("Error loading questions: %s", e)
             return False
+
+
+    ###########################
+    # --- Set question bank --- #
+    """
+    Freeze the given questions as the shared bank and rebuild the cluster index.
+    """
+    def set_question_bank(self, question_data: List[Dict[str, Any]]):
+        
+        self.question_bank = tuple(MappingProxyType(dict(q)) for q in question_data)
+        self.cluster_index = ClusterIndex(self.question_bank)
+        self.all_questions_mask = (1 << len(self.question_bank)) - 1
+
+
+    #######################
+    # --- New session --- #
+    """
+    A fresh per-session QflowSystem backed by this engine.
+    """
+    def new_session(self, session_id: str = None) -> "QflowSystem":
+        
+        return QflowSystem(engine=self, session_id=session_id)
+
+
+
+
+def _mask_indices(mask: int) -> List[int]:
+    """
+    Set bit positions of a used-questions mask, ascending.
+    """
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
+def _trim_words(text: str, limit: int) -> str:
+    words = (text or "").split()
+    return text if len(words) <= limit else " ".join(words[:limit]) + " ..."
+
+
+def _indices_mask(indices) -> int:
+    mask = 0
+    for idx in indices:
+        mask |= 1 << idx
+    return mask
+
+
+
+
+#############################
+# --- QflowSystem class --- #
+"""
+QflowSystem for managing conversational question flows with specific function structure.
+One instance per conversation; the client and question bank live on a shared
+QflowEngine, and the per-session state is kept in slots (used questions as
+a bit mask) so a worker can hold many live sessions.
+
+Functions:
+1. start_greeting() - Initial greeting and readiness check
+2. detect_user_reply() - Handle yes/no responses
+3. get_user_input() - Accept user input
+4. select_next_question() - AI-powered question selection via Claude/OpenAI API or a local model
+5. generate_ai_reply() - AI-generated transitions via Claude/OpenAI API or a local model
+6. track_questions() - Track used/unused questions
+7. end_conversation() - AI-generated closing
+"""
+
+class QflowSystem:
+    __slots__ = ("engine", "_used_mask", "_session_id", "current_question_index",
+                 "conversation_log", "conversation_started", "user_ready", "rng", "budget")
+    
+    def __init__(self, model: str = None, base_url: str = None, log_sink: LogSink = None,
+                 candidate_clusters: int = None, engine: QflowEngine = None, session_id: str = None,
+                 cassette: Cassette = None, seed: int = None, transitions: TransitionLibrary = None,
+                 budget_limits: BudgetLimits = None):
+        # Without an engine the session gets a private one, configured like a shared one
+        if engine is None:
+            engine = QflowEngine(model, base_url, log_sink, candidate_clusters, cassette=cassette, seed=seed,
+                                 transitions=transitions, budget_limits=budget_limits)
+        self.engine = engine
+        self._used_mask = 0
+        self._session_id = session_id
+        self.current_question_index = None
+        self.conversation_log = []
+        self.conversation_started = False
+        self.user_ready = False
+        # Seeded sessions get their own generator so replays are reproducible;
+        # unseeded ones share the module-level one
+        self.rng = random.Random(self.engine.seed) if self.engine.seed is not None else random
+        self.budget = SessionBudget(self.engine.budget_limits)
+
+
+    ##############################
+    # --- Shared engine state --- #
+    @property
+    def question_bank(self):
+        return self.engine.question_bank
+
+    @property
+    def cluster_index(self):
+        return self.engine.cluster_index
+
+    @property
+    def candidate_clusters(self):
+        return self.engine.candidate_clusters
+
+    @property
+    def model(self):
+        return self.engine.model
+
+    @property
+    def client(self):
+        return self.engine.client
+
+    @property
+    def client_type(self):
+        return self.engine.client_type
+
+    @property
+    def log_sink(self):
+        return self.engine.log_sink
+
+    def _make_api_call(self, messages: List[Dict[str, str]], temperature: float = 0.7, call_type: str = "other") -> str:
+        # Past the economy threshold, hosted calls go to the cheaper budget model if one is set
+        model = self.engine.budget_limits.model if self.budget.mode() != "normal" else None
+        return self.engine._make_api_call(messages, temperature=temperature, call_type=call_type,
+                                          budget=self.budget, model=model)
+
+
+    ###############################
+    # --- Per-session state  --- #
+    """
+    used_questions / unused_questions read as frozensets derived from the mask;
+    assign a new collection to change them.
+    """
+    @property
+    def session_id(self) -> str:
+        if self._session_id is None:
+            self._session_id = uuid.uuid4().hex
+        return self._session_id
+
+    @session_id.setter
+    def session_id(self, value: str):
+        self._session_id = value
+
+    @property
+    def used_questions(self) -> frozenset:
+        return frozenset(_mask_indices(self._used_mask))
+
+    @used_questions.setter
+    def used_questions(self, indices):
+        self._used_mask = _indices_mask(indices) & self.engine.all_questions_mask
+
+    @property
+    def unused_questions(self) -> frozenset:
+        return frozenset(_mask_indices(self.engine.all_questions_mask & ~self._used_mask))
+
+    @unused_questions.setter
+    def unused_questions(self, indices):
+        self._used_mask = self.engine.all_questions_mask & ~_indices_mask(indices)
+
+    def is_used(self, question_index: int) -> bool:
+        return bool(self._used_mask >> question_index & 1)
+
+    @property
+    def used_count(self) -> int:
+        return bin(self._used_mask).count("1")
+
+    @property
+    def unused_count(self) -> int:
+        return len(self.engine.question_bank) - self.used_count
+
+
+    #####################################
+    # --- Load questions from excel --- #
+    """
+    Load the bank into this session's engine and start the session afresh.
+    With a shared engine, load once on the engine instead.
+    """
+    def load_questions_from_excel(self, file_path: str, question_column: str = "Final_Question", id_column: str = "question_id") -> bool:
+        loaded = self.engine.load_questions_from_excel(file_path, question_column, id_column)
+        self._used_mask = 0
+        return loaded
     
 
 
@@ -198,9 +486,11 @@ class QflowSystem:
     Returns: {"action": "start"/"end", "question": "...", "message": "..."}
     """
     def detect_user_reply(self, user_input: str) -> Dict[str, Any]:
-        print(f"Detecting user reply for input: {user_input}", file=sys.stderr)
-        print(f"Current question bank size: {len(self.question_bank)}", file=sys.stderr)
-        print(f"Unused questions: {self.unused_questions}", file=sys.stderr)
+        log.debug("Detecting user reply", extra={"fields": {
+            "input_chars": len(user_input),
+            "bank_size": len(self.question_bank),
+            "unused": self.unused_count
+        }})
         
         user_input_clean = user_input.strip().lower()
         
@@ -210,13 +500,13 @@ class QflowSystem:
         
         if any(response in user_input_clean for response in yes_responses):
             # User is ready - select random starting question
-            if not self.unused_questions:
-                print("No unused questions available", file=sys.stderr)
+            if not self.unused_count:
+                log.warning("No unused questions available")
                 return {"action": "end", "message": "No questions available."}
             
             # Select random starting question
-            question_idx = random.choice(list(self.unused_questions))
-            print(f"Selected question index: {question_idx}", file=sys.stderr)
+            question_idx = self.rng.choice(sorted(self.unused_questions))
+            log.debug("Selected starting question %d", question_idx)
             self.current_question_index = question_idx
             # Don't mark as used yet - wait until user answers
             self.conversation_started = True
@@ -265,19 +555,42 @@ class QflowSystem:
     Select the next question based on user input using AI API (OpenAI/Claude).
     Returns: {"question": "...", "question_index": int, "reasoning": "...", "finished": bool}
     """
+    @traced("qflow.select_next_question")
     def select_next_question(self, user_response: str) -> Dict[str, Any]:
-        print(f"[DEBUG] Used questions before selection: {self.used_questions}", file=sys.stderr)
-        print(f"[DEBUG] Unused questions before selection: {self.unused_questions}", file=sys.stderr)
-        if not self.unused_questions:
+        log.debug("Selecting next question", extra={"fields": {"used": self.used_count, "unused": self.unused_count}})
+        if not self.unused_count:
             return {"finished": True, "message": "All questions completed!"}
         
-        # Prepare available questions for AI
+        # Prepare available questions for AI: only the least-covered clusters' unused questions
+        candidates = self.candidate_questions()
+        budget_mode = self.budget.mode()
+        current_span().set_attributes({"qflow.budget_mode": budget_mode})
+        if budget_mode == "minimal" and candidates:
+            # Out of budget: pick locally instead of asking the provider
+            _note_fallback("select_next_question", "budget_exhausted")
+            selected_idx = self.rng.choice(candidates)
+            self.current_question_index = selected_idx
+            return {
+                "question": self.question_bank[selected_idx]['question'],
+                "question_index": selected_idx,
+                "reasoning": "Local selection: session budget exhausted",
+                "finished": False
+            }
+        if budget_mode == "economy":
+            # Near the budget: a shorter prompt with fewer candidates and a trimmed answer
+            if len(candidates) > ECONOMY_CANDIDATES:
+                candidates = sorted(self.rng.sample(candidates, ECONOMY_CANDIDATES))
+            user_response = _trim_words(user_response, ECONOMY_RESPONSE_WORDS)
         available_questions = []
-        for idx in self.unused_questions:
+        for idx in candidates:
             # Each item in question_bank is now a dict
             available_questions.append(f"{idx}: {self.question_bank[idx]['question']}")
         
         available_questions_text = "\n".join(available_questions)
+        current_span().set_attributes({
+            "qflow.candidates": len(available_questions),
+            "qflow.unused": self.unused_count
+        })
         
         # Previous question context
         previous_question = ""
@@ -325,7 +638,7 @@ class QflowSystem:
             ]
             
             # Parse AI response
-            ai_response = self._make_api_call(messages, temperature=0.7)
+            ai_response = self._make_api_call(messages, temperature=0.7, call_type="select_question")
             
             # Clean JSON response
             if ai_response.startswith("```json"):
@@ -338,7 +651,7 @@ class QflowSystem:
             reasoning = selection_data["reasoning"]
             
             # Validate selection
-            if selected_idx in self.unused_questions:
+            if 0 <= selected_idx < len(self.question_bank) and not self.is_used(selected_idx):
                 # Don't mark as used yet - wait until user answers
                 # Just track which question is currently being asked
                 self.current_question_index = selected_idx
@@ -351,7 +664,8 @@ class QflowSystem:
                 }
             else:
                 # Fallback to random selection if AI selected invalid question
-                fallback_idx = random.choice(list(self.unused_questions))
+                _note_fallback("select_next_question", "invalid_selection")
+                fallback_idx = self.rng.choice(candidates)
                 # Don't mark as used yet - wait until user answers
                 self.current_question_index = fallback_idx
                 
@@ -364,8 +678,9 @@ class QflowSystem:
                 
         except Exception as e:
             # Fallback to random selection on API error
-            if self.unused_questions:
-                fallback_idx = random.choice(list(self.unused_questions))
+            _note_fallback("select_next_question", type(e).__name__)
+            if candidates:
+                fallback_idx = self.rng.choice(candidates)
                 # Don't mark as used yet - wait until user answers
                 self.current_question_index = fallback_idx
                 
@@ -381,13 +696,55 @@ class QflowSystem:
 
 
 
+    ###############################
+    # --- Candidate questions --- #
+    """
+    Unused question indices offered for the next selection: those in the
+    least-covered clusters (see ClusterIndex), or all of them when pruning is off.
+    """
+    def candidate_questions(self) -> List[int]:
+        
+        if not self.candidate_clusters or self.cluster_index is None:
+            return sorted(self.unused_questions)
+        return self.cluster_index.candidates(_mask_indices(self.engine.all_questions_mask & ~self._used_mask),
+                                             _mask_indices(self._used_mask), self.candidate_clusters, rng=self.rng)
+    
+
+
+
     #############################
     # --- Generate AI reply --- #
     """
     Generate AI reply based on user input to improve user experience.
+    With a transition library on the engine, confident transitions are filled
+    in locally and only the rest go to the provider. Sessions near their
+    budget use the library (built-in templates if none) even without one on
+    the engine; exhausted sessions never reach the provider.
     Returns the AI-generated transition/reply.
     """
+    @traced("qflow.generate_ai_reply")
     def generate_ai_reply(self, user_response: str, next_question: str = "") -> str:
+        
+        budget_mode = self.budget.mode()
+        transitions = self.engine.transitions
+        if transitions is None and budget_mode != "normal":
+            transitions = _BUDGET_TRANSITIONS
+        if transitions is not None and next_question:
+            started = time.perf_counter()
+            idx = self.current_question_index
+            cluster_id = self.question_bank[idx].get("cluster_id") if idx is not None and 0 <= idx < len(self.question_bank) else None
+            # Out of budget, any template beats a provider call
+            local_reply = transitions.render(user_response, next_question, idx, cluster_id, self.rng,
+                                             min_confidence=0.0 if budget_mode == "minimal" else None)
+            if local_reply is not None:
+                metrics.record_transition("local", time.perf_counter() - started)
+                current_span().set_attributes({"qflow.transition_source": "local"})
+                return local_reply
+        if budget_mode == "minimal":
+            _note_fallback("generate_ai_reply", "budget_exhausted")
+            return self._canned_reply(next_question)
+        if budget_mode == "economy":
+            user_response = _trim_words(user_response, ECONOMY_RESPONSE_WORDS)
        
         try:
             # Determine if this is a transition or acknowledgment
@@ -422,25 +779,31 @@ class QflowSystem:
                 }
             ]
             
-            ai_reply = self._make_api_call(messages, temperature=0.7)
+            ai_reply = self._make_api_call(messages, temperature=0.7, call_type="transition")
+            if transitions is not None and next_question:
+                metrics.record_transition("llm")
             return ai_reply
             
         except Exception as e:
             # Fallback responses
-            if next_question:
-                fallback_replies = [
-                    "Thank you for sharing that insight. Let me ask you about another situation.",
-                    "I appreciate your perspective on that. Here's another question I'm curious about.",
-                    "That's helpful to understand. Let me explore another dimension with you."
-                ]
-            else:
-                fallback_replies = [
-                    "Thank you for sharing that with me.",
-                    "I appreciate your thoughtful response.",
-                    "That gives me good insight into your approach."
-                ]
-            
-            return random.choice(fallback_replies)
+            _note_fallback("generate_ai_reply", type(e).__name__)
+            return self._canned_reply(next_question)
+
+    def _canned_reply(self, next_question: str = "") -> str:
+        if next_question:
+            fallback_replies = [
+                "Thank you for sharing that insight. Let me ask you about another situation.",
+                "I appreciate your perspective on that. Here's another question I'm curious about.",
+                "That's helpful to understand. Let me explore another dimension with you."
+            ]
+        else:
+            fallback_replies = [
+                "Thank you for sharing that with me.",
+                "I appreciate your thoughtful response.",
+                "That gives me good insight into your approach."
+            ]
+        
+        return self.rng.choice(fallback_replies)
     
 
 
@@ -453,15 +816,15 @@ class QflowSystem:
     def track_questions(self) -> Dict[str, Any]:
         
         total_questions = len(self.question_bank)
-        used_count = len(self.used_questions)
-        unused_count = len(self.unused_questions)
+        used_count = self.used_count
+        unused_count = total_questions - used_count
         
         return {
             "total_questions": total_questions,
             "used_questions": used_count,
             "unused_questions": unused_count,
-            "used_question_indices": list(self.used_questions),
-            "unused_question_indices": list(self.unused_questions),
+            "used_question_indices": sorted(self.used_questions),
+            "unused_question_indices": sorted(self.unused_questions),
             "progress_percentage": (used_count / total_questions * 100) if total_questions > 0 else 0,
             "all_questions_used": unused_count == 0
         }
@@ -474,13 +837,12 @@ class QflowSystem:
     """
     def mark_current_question_as_used(self) -> bool:
         result = False
-        if self.current_question_index is not None and self.current_question_index in self.unused_questions:
-            self.unused_questions.remove(self.current_question_index)
-            self.used_questions.add(self.current_question_index)
-            print(f"Marked question {self.current_question_index} as used", file=sys.stderr)
+        idx = self.current_question_index
+        if idx is not None and 0 <= idx < len(self.question_bank) and not self.is_used(idx):
+            self._used_mask |= 1 << idx
+            log.debug("Marked question %d as used", idx)
             result = True
-        print(f"[DEBUG] Used questions after marking: {self.used_questions}", file=sys.stderr)
-        print(f"[DEBUG] Unused questions after marking: {self.unused_questions}", file=sys.stderr)
+        log.debug("Question usage", extra={"fields": {"used": self.used_count, "unused": self.unused_count}})
         return result
 
     ############################
@@ -489,8 +851,14 @@ class QflowSystem:
     End the conversation with AI-generated thank you message.
     Returns the closing message.
     """
+    @traced("qflow.end_conversation")
     def end_conversation(self) -> str:
         
+        if self.budget.mode() == "minimal":
+            _note_fallback("end_conversation", "budget_exhausted")
+            self.conversation_started = False
+            return self._canned_closing()
+        
         try:
             # Get conversation statistics for context
             stats = self.track_questions()
@@ -513,7 +881,7 @@ class QflowSystem:
                 }
             ]
             
-            closing_message = self._make_api_call(messages, temperature=0.7)
+            closing_message = self._make_api_call(messages, temperature=0.7, call_type="closing")
             
             # Mark conversation as ended
             self.conversation_started = False
@@ -522,11 +890,14 @@ class QflowSystem:
             
         except Exception as e:
             # Fallback closing message
-            stats = self.track_questions()
-            if stats['all_questions_used']:
-                return "Thank you so much for taking the time to answer all the questions! Your thoughtful responses provide valuable insights into your personality and work style. I really appreciate your participation and openness throughout our conversation."
-            else:
-                return f"Thank you for participating in our conversation! You've shared valuable insights through your responses. I appreciate your time and thoughtfulness."
+            _note_fallback("end_conversation", type(e).__name__)
+            return self._canned_closing()
+
+    def _canned_closing(self) -> str:
+        if not self.unused_count:
+            return "Thank you so much for taking the time to answer all the questions! Your thoughtful responses provide valuable insights into your personality and work style. I really appreciate your participation and openness throughout our conversation."
+        else:
+            return f"Thank you for participating in our conversation! You've shared valuable insights through your responses. I appreciate your time and thoughtfulness."
     
 
 
@@ -537,17 +908,29 @@ class QflowSystem:
     ############################
     # --- Log interaction  --- #
     """
-    Log the interaction for conversation history.
+    Log the interaction for conversation history. With a log sink configured the
+    entry is also appended to durable storage right away.
     """
     def log_interaction(self, question: str, response: str, question_index: int, transition: str = ""):
         
-        self.conversation_log.append({
+        cluster_id = None
+        if question_index is not None and 0 <= question_index < len(self.question_bank):
+            cluster_id = self.question_bank[question_index].get("cluster_id")
+        entry = {
+            "session_id": self.session_id,
             "question_index": question_index,
+            "cluster_id": cluster_id,
             "question": question,
             "user_response": response,
             "ai_transition": transition,
-            "timestamp": pd.Timestamp.now()
-        })
+            "timestamp": datetime.now().isoformat(timespec="milliseconds")
+        }
+        self.conversation_log.append(entry)
+        if self.log_sink is not None:
+            try:
+                self.log_sink.append(entry)
+            except Exception as e:
+                log.error("Error appending to conversation log: %s", e)
     
 
 
@@ -571,13 +954,15 @@ class QflowSystem:
     """
     def reset_conversation(self):
         
-        if self.question_bank:
-            self.used_questions = set()
-            self.unused_questions = set(range(len(self.question_bank)))
+        self._used_mask = 0
         self.current_question_index = None
         self.conversation_started = False
         self.conversation_log = []
+        self.session_id = uuid.uuid4().hex
         self.user_ready = False
+        self.budget.reset()
+        if self.engine.seed is not None:
+            self.rng.seed(self.engine.seed)
     
 
 
@@ -585,7 +970,8 @@ class QflowSystem:
     ##################################
     # --- Save conversation log  --- #
     """
-    Save conversation log to Excel file.
+    Save this session's in-memory log to an Excel file. For logs written by a
+    sink, use export_conversation_log.py instead.
     """
     def save_conversation_log(self, output_file_path: str):
        
@@ -594,9 +980,10 @@ class QflowSystem:
                 return False
                 
             df = pd.DataFrame(self.conversation_log)
+            df["timestamp"] = pd.to_datetime(df["timestamp"])
             df.to_excel(output_file_path, index=False)
             return True
             
         except Exception as e:
-            print(f"Error saving conversation log: {e}")
+            log.error("Error saving conversation log: %s", e)
             return False 
\ No newline at end of file
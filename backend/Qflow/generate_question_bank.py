@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Generate a Qflow question bank with the generate -> review -> refine prompts
+in constants.py.
+
+Two inputs are supported:
+  * a cluster spreadsheet (cluster_id, included_facets, facet_and_item_details),
+    e.g. MJ_cluster_based_generated_questions.xlsx;
+  * facet definitions (JSON {"facet": "definition"} or a spreadsheet with
+    facet/definition columns), for which the planner first picks
+    --num-questions facet combinations that together cover every facet.
+
+Each cluster then runs generator -> reviewer -> refiner on its own thread
+(at most --concurrency clusters in flight). Every stage's output is cached in
+SQLite under a hash of everything that produced it (stage, model, prompt and
+the upstream output), so a rerun only calls the provider for clusters whose
+input or upstream output changed. The output spreadsheet has the columns of
+the existing banks plus question_id, so QflowSystem.load_questions_from_excel
+loads it as is.
+
+Provider settings come from LLM_MODEL / LLM_BASE_URL / API_KEY as for the
+conversation; QFLOW_CASSETTE record/replay applies too.
+
+Usage (from backend/):
+    python Qflow/generate_question_bank.py clusters.xlsx bank.xlsx
+    python Qflow/generate_question_bank.py facets.json bank.xlsx --num-questions 20 --concurrency 8
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import pandas as pd
+
+from Qflow.flow import QflowEngine
+from Qflow.structured_log import get_logger
+from Qflow.constants import (
+    DEFAULT_GENERATOR_PROMPT,
+    DEFAULT_GENERATOR_PROMPT_DEF,
+    DEFAULT_PLANNER_PROMPT,
+    DEFAULT_REFINER_PROMPT,
+    DEFAULT_REVIEWER_PROMPT,
+    DEFAULT_TEMPERATURE,
+    TERMINATION_MSG
+)
+
+log = get_logger("question_bank")
+
+DEFAULT_CACHE = os.path.join(current_dir, ".question_bank_cache.db")
+DEFAULT_CONCURRENCY = 4
+PERFECT_MARKER = "the question is perfect"
+
+OUTPUT_COLUMNS = [
+    "cluster_id", "question_id", "included_facets", "facet_and_item_details",
+    "Cluster_Generator_Output", "Cluster_Reviewer_Output", "Cluster_Refiner_Output", "Final_Question"
+]
+
+
+class StageCache:
+    """
+    Stage outputs keyed by a hash of their inputs; safe to share between the
+    cluster threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS stage_cache (key TEXT PRIMARY KEY, stage TEXT, output TEXT, created REAL)"
+        )
+        self.conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT output FROM stage_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, stage, output):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO stage_cache (key, stage, output, created) VALUES (?, ?, ?, ?)",
+                              (key, stage, output, time.time()))
+
+    def close(self):
+        self.conn.close()
+
+
+class QuestionBankPipeline:
+    """
+    Runs the planner and the per-cluster generate/review/refine chain against
+    one QflowEngine, through a StageCache.
+    """
+
+    def __init__(self, engine: QflowEngine, cache: StageCache, concurrency: int = DEFAULT_CONCURRENCY,
+                 temperature: float = DEFAULT_TEMPERATURE):
+        self.engine = engine
+        self.cache = cache
+        self.concurrency = max(1, concurrency)
+        self.temperature = temperature
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "cache_hits": 0, "refine_skipped": 0, "failed": 0}
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _stage(self, stage: str, system_prompt: str, user_content: str) -> str:
+        """
+        One cached LLM call: the key covers the stage, model, temperature and
+        both messages, so any upstream change misses the cache.
+        """
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ]
+        payload = json.dumps([stage, self.engine.model, self.temperature, messages], ensure_ascii=False)
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count("cache_hits")
+            return cached
+
+        output = self.engine._make_api_call(messages, temperature=self.temperature, call_type=f"bank_{stage}")
+        self._count("calls")
+        self.cache.put(key, stage, output)
+        return output
+
+
+    ###################
+    # --- Planner --- #
+    """
+    Ask for num_questions facet combinations covering every facet; unknown
+    names are dropped and facets the plan left out are reported.
+    """
+    def plan(self, definitions: dict, num_questions: int) -> list:
+        facet_list = "\n".join(f"- {facet}: {definition}" for facet, definition in definitions.items())
+        output = self._stage("planner", DEFAULT_PLANNER_PROMPT.format(num_questions=num_questions),
+                             f"Available facets and their definitions:\n{facet_list}")
+
+        # Tolerate code fences or prose around the JSON object
+        text = output.strip()
+        try:
+            combinations = json.loads(text[text.find("{"):text.rfind("}") + 1])["planned_facet_combinations"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Planner returned no usable facet combinations: {e}") from e
+
+        clusters = []
+        for combination in combinations:
+            facets = [facet for facet in combination if facet in definitions]
+            unknown = [facet for facet in combination if facet not in definitions]
+            if unknown:
+                log.warning("Planner used unknown facets", extra={"fields": {"facets": unknown}})
+            if not facets:
+                continue
+            clusters.append({
+                "cluster_id": len(clusters),
+                "included_facets": ", ".join(facets),
+                "facet_and_item_details": "\n".join(f"{facet}: {definitions[facet]}" for facet in facets)
+            })
+
+        covered = {facet for cluster in clusters for facet in cluster["included_facets"].split(", ")}
+        missing = [facet for facet in definitions if facet not in covered]
+        if missing:
+            log.warning("Plan leaves facets uncovered", extra={"fields": {"facets": missing}})
+        return clusters
+
+
+    #####################################
+    # --- Generate / review / refine --- #
+    """
+    Run the three stages for one cluster. A critique that calls the question
+    perfect skips the refiner, which would only echo it back.
+    """
+    def run_cluster(self, cluster: dict, from_definitions: bool = False) -> dict:
+        facets = cluster["included_facets"]
+        details = cluster["facet_and_item_details"]
+        if from_definitions:
+            generator_prompt = DEFAULT_GENERATOR_PROMPT_DEF
+            context = f"Facets for this question:\n{facets}\n\nFacet definitions:\n{details}"
+        else:
+            generator_prompt = DEFAULT_GENERATOR_PROMPT
+            context = f"Cluster Facets:\n{facets}\n\nRelated Measurement Items:\n{details}"
+
+        generated = self._stage("generator", generator_prompt, context)
+        critique = self._stage("reviewer", DEFAULT_REVIEWER_PROMPT,
+                               f"{context}\n\nGenerated Interview Question:\n{generated}")
+
+        if PERFECT_MARKER in critique.lower() and len(critique) < 200:
+            refined = generated
+            self._count("refine_skipped")
+        else:
+            refined = self._stage("refiner", DEFAULT_REFINER_PROMPT,
+                                  f"{context}\n\nOriginal Question:\n{generated}\n\nCritique:\n{critique}")
+
+        final = refined.replace(TERMINATION_MSG, "").strip()
+        return {
+            "cluster_id": cluster["cluster_id"],
+            "question_id": cluster["cluster_id"],
+            "included_facets": facets,
+            "facet_and_item_details": details,
+            "Cluster_Generator_Output": generated,
+            "Cluster_Reviewer_Output": critique,
+            "Cluster_Refiner_Output": refined,
+            "Final_Question": final
+        }
+
+    def run(self, clusters: list, from_definitions: bool = False) -> list:
+        """
+        All clusters with bounded parallelism; rows come back in cluster
+        order. A failed cluster is logged and left out, and its completed
+        stages stay cached for the next run.
+        """
+        rows = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(self.run_cluster, cluster, from_definitions): cluster["cluster_id"]
+                       for cluster in clusters}
+            for future in as_completed(futures):
+                cluster_id = futures[future]
+                try:
+                    rows[cluster_id] = future.result()
+                except Exception as e:
+                    self._count("failed")
+                    log.error("Cluster failed: %s", e, extra={"fields": {
+                        "cluster_id": cluster_id, "error_class": type(e).__name__
+                    }})
+        return [rows[cluster["cluster_id"]] for cluster in clusters if cluster["cluster_id"] in rows]
+
+
+def _read_table(path: str) -> pd.DataFrame:
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    return pd.read_excel(path)
+
+
+def load_input(path: str):
+    """
+    (clusters, definitions): clusters for a cluster spreadsheet, definitions
+    ({facet: definition}) for a definitions file; the other is None.
+    """
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return None, {str(k): str(v) for k, v in json.load(f).items()}
+
+    df = _read_table(path)
+    if {"facet", "definition"}.issubset(df.columns):
+        df = df.dropna(subset=["facet", "definition"])
+        return None, {str(row.facet).strip(): str(row.definition).strip() for row in df.itertuples()}
+
+    required = {"cluster_id", "included_facets", "facet_and_item_details"}
+    if not required.issubset(df.columns):
+        raise ValueError(f"{path} needs columns {sorted(required)} or facet/definition")
+    clusters = [
+        {
+            "cluster_id": int(row.cluster_id),
+            "included_facets": str(row.included_facets).strip(),
+            "facet_and_item_details": str(row.facet_and_item_details).strip()
+        }
+        for row in df.dropna(subset=list(required)).itertuples()
+    ]
+    return clusters, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a question bank with the generate/review/refine pipeline")
+    parser.add_argument("source", help="Cluster spreadsheet, or facet definitions (.json / facet,definition columns)")
+    parser.add_argument("destination", help="Output question bank (.xlsx or .csv)")
+    parser.add_argument("--num-questions", type=int, default=None,
+                        help="Questions to plan from definitions (default: one per four facets)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Clusters processed in parallel")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="Stage cache database")
+    parser.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE)
+    args = parser.parse_args()
+
+    try:
+        clusters, definitions = load_input(args.source)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {args.source}: {e}", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    cache = StageCache(args.cache)
+    try:
+        pipeline = QuestionBankPipeline(QflowEngine(), cache, args.concurrency, args.temperature)
+        if definitions is not None:
+            num_questions = args.num_questions or max(1, -(-len(definitions) // 4))
+            clusters = pipeline.plan(definitions, num_questions)
+        rows = pipeline.run(clusters, from_definitions=definitions is not None)
+    except ValueError as e:
+        print(f"Generation failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        cache.close()
+
+    df = pd.DataFrame.from_records(rows, columns=OUTPUT_COLUMNS)
+    if args.destination.endswith(".csv"):
+        df.to_csv(args.destination, index=False)
+    else:
+        df.to_excel(args.destination, index=False)
+
+    summary = dict(pipeline.stats, clusters=len(clusters), written=len(rows),
+                   seconds=round(time.perf_counter() - started, 3))
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if pipeline.stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,53 +10,156 @@ parent_dir = os.path.dirname(current_dir)
 if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
-def get_question_text(question_index):
-    try:
-        # Load questions from Excel file
-        questions_file = os.path.join(current_dir, "MJ_cluster_based_generated_questions.xlsx")
-        
-        if not os.path.exists(questions_file):
-            print(json.dumps({"error": f"Questions file not found at {questions_file}"}))
-            sys.exit(1)
-        
-        df = pd.read_excel(questions_file)
-        
-        if 'Final_Question' not in df.columns:
-            print(json.dumps({"error": "Final_Question column not found in Excel file"}))
-            sys.exit(1)
-        
-        # Get question at the specified index
-        if question_index < 0 or question_index >= len(df):
-            print(json.dumps({"error": f"Question index {question_index} out of range"}))
-            sys.exit(1)
-        
-        question_text = df.iloc[question_index]['Final_Question']
-        
-        # Clean the question text
+try:
+    from .constants import TERMINATION_MSG
+except ImportError:
+    # Run as a script: import the sibling module rather than the whole Qflow
+    # package, which would pull in the LLM client libraries
+    from constants import TERMINATION_MSG
+
+QUESTIONS_FILE = os.path.join(current_dir, "MJ_cluster_based_generated_questions.xlsx")
+
+_question_texts = None
+
+def load_question_texts():
+    """
+    Read the Final_Question column once per process; cleaned text per row,
+    None for empty rows.
+    """
+    global _question_texts
+    if _question_texts is not None:
+        return _question_texts
+
+    if not os.path.exists(QUESTIONS_FILE):
+        raise FileNotFoundError(f"Questions file not found at {QUESTIONS_FILE}")
+
+    df = pd.read_excel(QUESTIONS_FILE)
+    if 'Final_Question' not in df.columns:
+        raise KeyError("Final_Question column not found in Excel file")
+
+    texts = []
+    for question_text in df['Final_Question']:
         if pd.notna(question_text):
             cleaned_question = str(question_text).strip()
             # Remove termination message if present
-            from .constants import TERMINATION_MSG
             if TERMINATION_MSG in cleaned_question:
                 cleaned_question = cleaned_question.replace(TERMINATION_MSG, "").strip()
-            
-            print(json.dumps({"question": cleaned_question}))
-            return True
+            texts.append(cleaned_question)
+        else:
+            texts.append(None)
+    _question_texts = texts
+    return texts
+
+def lookup_question(texts, question_index):
+    """
+    {"question": ...} or {"error": ...} for one index.
+    """
+    if question_index < 0 or question_index >= len(texts):
+        return {"error": f"Question index {question_index} out of range"}
+    if texts[question_index] is None:
+        return {"error": f"Question at index {question_index} is empty"}
+    return {"question": texts[question_index]}
+
+def lookup_questions(texts, indices=None):
+    """
+    JSON map for many indices (all of them when indices is None):
+    {"questions": {"<index>": text}, "errors": {"<index>": message}}
+    """
+    if indices is None:
+        indices = range(len(texts))
+    questions, errors = {}, {}
+    for question_index in indices:
+        result = lookup_question(texts, question_index)
+        if "question" in result:
+            questions[str(question_index)] = result["question"]
         else:
-            print(json.dumps({"error": f"Question at index {question_index} is empty"}))
-            sys.exit(1)
-            
+            errors[str(question_index)] = result["error"]
+    response = {"questions": questions}
+    if errors:
+        response["errors"] = errors
+    return response
+
+def get_question_text(question_index):
+    try:
+        result = lookup_question(load_question_texts(), question_index)
+    except Exception as e:
+        result = {"error": f"Error getting question text: {e}"}
+
+    print(json.dumps(result))
+    if "error" in result:
+        sys.exit(1)
+    return True
+
+def get_question_texts(indices=None):
+    try:
+        result = lookup_questions(load_question_texts(), indices)
     except Exception as e:
         print(json.dumps({"error": f"Error getting question text: {e}"}))
         sys.exit(1)
 
+    print(json.dumps(result))
+    return True
+
+def serve(stdin=sys.stdin, stdout=sys.stdout):
+    """
+    Resident mode: keep the bank in memory and answer one JSON line per request
+    line. Requests are {"index": n}, {"indices": [...]} or {"all": true}; an
+    "id" field is echoed back.
+    """
+    try:
+        texts = load_question_texts()
+    except Exception as e:
+        stdout.write(json.dumps({"error": f"Error getting question text: {e}"}) + "\n")
+        stdout.flush()
+        return False
+
+    for line in stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if request.get("all"):
+                response = lookup_questions(texts)
+            elif "indices" in request:
+                response = lookup_questions(texts, [int(i) for i in request["indices"]])
+            elif "index" in request:
+                response = lookup_question(texts, int(request["index"]))
+            else:
+                response = {"error": "Expected 'index', 'indices' or 'all'"}
+            if "id" in request:
+                response["id"] = request["id"]
+        except (ValueError, TypeError, AttributeError) as e:
+            response = {"error": f"Invalid request: {e}"}
+        stdout.write(json.dumps(response) + "\n")
+        stdout.flush()
+    return True
+
+def parse_indices(value):
+    """
+    Accept "1,2,3" or a JSON list.
+    """
+    value = value.strip()
+    if value.startswith("["):
+        return [int(i) for i in json.loads(value)]
+    return [int(i) for i in value.split(",") if i.strip()]
+
 def main():
     parser = argparse.ArgumentParser(description='Get question text by index')
-    parser.add_argument('--index', type=int, required=True, help='Question index')
-    
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--index', type=int, help='Question index')
+    mode.add_argument('--indices', type=parse_indices, help='Comma-separated or JSON list of indices')
+    mode.add_argument('--all', action='store_true', help='Return every question')
+    mode.add_argument('--serve', action='store_true', help='Answer JSON-line lookups on stdin')
+
     args = parser.parse_args()
-    
-    get_question_text(args.index)
+
+    if args.serve:
+        return serve()
+    if args.all:
+        return get_question_texts()
+    if args.indices is not None:
+        return get_question_texts(args.indices)
+    return get_question_text(args.index)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,183 @@
+import os
+import json
+import queue
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .structured_log import get_logger
+
+#################################
+# --- Local CPU inference --- #
+"""
+A third provider next to Anthropic and OpenAI: a small quantized instruction
+model (GGUF, through llama-cpp-python) running on this machine's CPU.
+
+The model is loaded once per process and owned by one dispatcher thread
+(llama.cpp contexts are not thread-safe). Concurrent calls queue up and are
+taken in micro-batches: identical deterministic requests are answered once,
+and the rest run grouped by system prompt, so llama.cpp's prompt cache
+reuses the shared prefix (the selection and transition prompts are long and
+fixed) instead of re-evaluating it for every call.
+
+Selected with:
+    LLM_MODEL=local | local:/models/model.gguf   every call runs locally
+    QFLOW_LOCAL_MODEL=/models/model.gguf         with a hosted LLM_MODEL, run only
+    QFLOW_LOCAL_CALL_TYPES=select_question,transition   these call types locally
+    QFLOW_LOCAL_THREADS=4                        CPU threads (default: all cores)
+    QFLOW_LOCAL_CTX=4096                         context window
+    QFLOW_LOCAL_MAX_TOKENS=512                   completion limit per call
+    QFLOW_LOCAL_MAX_BATCH=8                      requests taken per dispatch
+llama-cpp-python is only imported when a local model is configured.
+"""
+
+log = get_logger("local_backend")
+
+DEFAULT_CALL_TYPES = ("select_question", "transition")
+DEFAULT_CTX = 4096
+DEFAULT_MAX_TOKENS = 512
+DEFAULT_MAX_BATCH = 8
+
+
+class LlamaCppRunner:
+    """
+    One llama.cpp model with a RAM prompt cache. Not thread-safe; only the
+    LocalBackend dispatcher calls it.
+    """
+
+    def __init__(self, model_path: str, threads: int = None, n_ctx: int = DEFAULT_CTX):
+        try:
+            from llama_cpp import Llama, LlamaRAMCache
+        except ImportError as e:
+            raise ImportError("Local inference needs llama-cpp-python (pip install llama-cpp-python)") from e
+        self.model_name = os.path.basename(model_path)
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=threads or os.cpu_count(), verbose=False)
+        self.llm.set_cache(LlamaRAMCache())
+
+    def generate(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> Tuple[str, int, int]:
+        response = self.llm.create_chat_completion(messages=messages, temperature=temperature, max_tokens=max_tokens)
+        usage = response.get("usage") or {}
+        return (response["choices"][0]["message"]["content"].strip(),
+                usage.get("prompt_tokens"), usage.get("completion_tokens"))
+
+
+class _Request:
+    __slots__ = ("messages", "temperature", "max_tokens", "done", "result", "error")
+
+    def __init__(self, messages, temperature, max_tokens):
+        self.messages = messages
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LocalBackend:
+    """
+    Thread-safe front for a runner: complete() blocks until the dispatcher
+    thread has answered the request.
+    """
+
+    def __init__(self, runner, max_tokens: int = DEFAULT_MAX_TOKENS, max_batch: int = DEFAULT_MAX_BATCH):
+        self.runner = runner
+        self.model_name = getattr(runner, "model_name", "local")
+        self.max_tokens = max_tokens
+        self.max_batch = max(1, max_batch)
+        self.stats = {"requests": 0, "generated": 0, "batches": 0, "deduplicated": 0}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._dispatch, name="qflow-local-llm", daemon=True)
+        self._thread.start()
+
+    def complete(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                 max_tokens: int = None) -> Tuple[str, Optional[int], Optional[int]]:
+        """
+        (text, input_tokens, output_tokens) for one chat request.
+        """
+        request = _Request(messages, temperature, max_tokens or self.max_tokens)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[_Request]):
+        self.stats["batches"] += 1
+        self.stats["requests"] += len(batch)
+
+        # Identical temperature-0 requests get one generation
+        groups = {}
+        for request in batch:
+            key = (json.dumps(request.messages, sort_keys=True), request.max_tokens) if request.temperature == 0 else id(request)
+            groups.setdefault(key, []).append(request)
+        self.stats["deduplicated"] += len(batch) - len(groups)
+
+        # Shared system prompts back to back keep the prompt cache warm
+        ordered = sorted(groups.values(), key=lambda requests: _system_prompt(requests[0].messages))
+        for requests in ordered:
+            first = requests[0]
+            try:
+                result, error = self.runner.generate(first.messages, first.temperature, first.max_tokens), None
+                self.stats["generated"] += 1
+            except Exception as e:
+                result, error = None, e
+            for request in requests:
+                request.result, request.error = result, error
+                request.done.set()
+
+
+def _system_prompt(messages: List[Dict[str, str]]) -> str:
+    return next((m["content"] for m in messages if m.get("role") == "system"), "")
+
+
+_backends: Dict[str, LocalBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_local_backend(model_path: str = None) -> LocalBackend:
+    """
+    The process-wide backend for model_path (default QFLOW_LOCAL_MODEL),
+    loading the model on first use.
+    """
+    model_path = model_path or os.getenv("QFLOW_LOCAL_MODEL")
+    if not model_path:
+        raise ValueError("No local model configured: set QFLOW_LOCAL_MODEL or LLM_MODEL=local:<path.gguf>")
+    with _backends_lock:
+        backend = _backends.get(model_path)
+        if backend is None:
+            threads = int(os.getenv("QFLOW_LOCAL_THREADS", 0)) or None
+            runner = LlamaCppRunner(model_path, threads, int(os.getenv("QFLOW_LOCAL_CTX", DEFAULT_CTX)))
+            backend = _backends[model_path] = LocalBackend(
+                runner,
+                int(os.getenv("QFLOW_LOCAL_MAX_TOKENS", DEFAULT_MAX_TOKENS)),
+                int(os.getenv("QFLOW_LOCAL_MAX_BATCH", DEFAULT_MAX_BATCH))
+            )
+            log.info("Loaded local model", extra={"fields": {"model": runner.model_name, "threads": threads or os.cpu_count()}})
+        return backend
+
+
+def is_local_model(model: str) -> bool:
+    model_lower = (model or "").lower()
+    return model_lower == "local" or model_lower.startswith("local:")
+
+
+def local_call_types() -> frozenset:
+    """
+    Call types a hosted engine sends to the local model: none unless
+    QFLOW_LOCAL_MODEL is set.
+    """
+    if not os.getenv("QFLOW_LOCAL_MODEL"):
+        return frozenset()
+    configured = os.getenv("QFLOW_LOCAL_CALL_TYPES")
+    if configured is None:
+        return frozenset(DEFAULT_CALL_TYPES)
+    return frozenset(t.strip() for t in configured.split(",") if t.strip())
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .structured_log import get_logger
+
+#########################################
+# --- Append-only conversation logs --- #
+"""
+Pluggable sinks for QflowSystem.log_interaction. Each interaction is appended
+as it happens, so per-turn cost is O(1) and a crash loses at most the last
+un-synced batch; Excel/Parquet files are produced offline by
+export_conversation_log.py.
+
+Selected with QFLOW_CONVERSATION_LOG:
+    jsonl:/path/to/log.jsonl     one JSON object per line (default for *.jsonl)
+    sqlite:/path/to/log.db       rows in a conversation_log table (default for *.db)
+QFLOW_CONVERSATION_LOG_FSYNC=32 sets how many entries are batched per fsync;
+pending entries are flushed at least once a second either way.
+Unset means no sink: interactions only stay in memory, as before.
+"""
+
+log = get_logger("log_sink")
+
+DEFAULT_FSYNC_EVERY = 32
+DEFAULT_FSYNC_INTERVAL = 1.0  # seconds
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+
+COLUMNS = ("session_id", "question_index", "cluster_id", "question", "user_response", "ai_transition", "timestamp")
+
+
+class LogSink:
+    """
+    Base class: append() one entry, flush() pending writes to stable storage.
+    """
+
+    def append(self, entry: Dict[str, Any]):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class _IntervalFlusher:
+    """
+    Daemon thread flushing a sink every `interval` seconds, so a batch never
+    waits on the next append of an idle writer (a pool worker between turns).
+    """
+
+    def __init__(self, sink: LogSink, interval: float):
+        self._sink = sink
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="qflow-log-flush", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self._sink.flush()
+            except (OSError, sqlite3.Error) as e:
+                log.error("Periodic conversation log flush failed: %s", e)
+
+    def stop(self):
+        self._stop.set()
+
+
+class JsonlLogSink(LogSink):
+    """
+    Every entry reaches the OS immediately (survives a process crash); fsync is
+    batched every `fsync_every` entries, and a background flusher syncs what
+    is pending every `fsync_interval` seconds.
+    """
+
+    def __init__(self, path: str, fsync_every: int = DEFAULT_FSYNC_EVERY,
+                 fsync_interval: float = DEFAULT_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._pending = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._flusher = _IntervalFlusher(self, fsync_interval) if self.fsync_every > 1 and fsync_interval > 0 else None
+
+    def append(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed and self._pending:
+                self._file.flush()
+                self._sync()
+
+    def close(self):
+        if self._flusher is not None:
+            self._flusher.stop()
+        self.flush()
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+class SqliteLogSink(LogSink):
+    """
+    Rows in a WAL-mode SQLite table. Entries are buffered and written in one
+    short BEGIN IMMEDIATE transaction per `fsync_every` entries (or every
+    `fsync_interval` seconds, from a background flusher), so the commit is
+    amortised without a transaction, and its write lock, outliving the call
+    that opened it.
+    """
+
+    def __init__(self, path: str, fsync_every: int = DEFAULT_FSYNC_EVERY,
+                 fsync_interval: float = DEFAULT_FSYNC_INTERVAL, table: str = "conversation_log",
+                 busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS):
+        self.path = path
+        self.table = table
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # Other writers on the same file (more workers) wait for the lock instead of failing
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, question_index INTEGER, cluster_id TEXT, "
+            "question TEXT, user_response TEXT, ai_transition TEXT, timestamp TEXT)"
+        )
+        self._insert = (f"INSERT INTO {table} ({', '.join(COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in COLUMNS)})")
+        self._flusher = _IntervalFlusher(self, fsync_interval) if self.fsync_every > 1 and fsync_interval > 0 else None
+
+    def append(self, entry: Dict[str, Any]):
+        with self._lock:
+            self._buffer.append(tuple(entry.get(c) for c in COLUMNS))
+            if len(self._buffer) >= self.fsync_every:
+                self._commit()
+
+    def _commit(self):
+        """
+        Write the buffered rows in one transaction. On failure it is rolled
+        back and the rows stay buffered for the next flush.
+        """
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(self._insert, self._buffer)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            log.error("Could not write %d conversation log rows: %s", len(self._buffer), e)
+            raise
+        self._buffer = []
+
+    def flush(self):
+        with self._lock:
+            if self._buffer:
+                self._commit()
+
+    def close(self):
+        if self._flusher is not None:
+            self._flusher.stop()
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+def open_sink(spec: str, fsync_every: int = DEFAULT_FSYNC_EVERY) -> LogSink:
+    """
+    Build a sink from "jsonl:<path>", "sqlite:<path>" or a bare path whose
+    extension picks the format (.db/.sqlite/.sqlite3 means SQLite).
+    """
+    kind, sep, path = spec.partition(":")
+    if not sep or kind not in ("jsonl", "sqlite"):
+        path = spec
+        kind = "sqlite" if path.endswith((".db", ".sqlite", ".sqlite3")) else "jsonl"
+    if kind == "sqlite":
+        return SqliteLogSink(path, fsync_every=fsync_every)
+    return JsonlLogSink(path, fsync_every=fsync_every)
+
+
+_env_sink: Optional[LogSink] = None
+_env_sink_lock = threading.Lock()
+
+
+def sink_from_env() -> Optional[LogSink]:
+    """
+    Process-wide sink configured by QFLOW_CONVERSATION_LOG, flushed at exit.
+    """
+    global _env_sink
+    spec = os.getenv("QFLOW_CONVERSATION_LOG")
+    if not spec:
+        return None
+    with _env_sink_lock:
+        if _env_sink is None:
+            try:
+                fsync_every = int(os.getenv("QFLOW_CONVERSATION_LOG_FSYNC", DEFAULT_FSYNC_EVERY))
+                _env_sink = open_sink(spec, fsync_every=fsync_every)
+                atexit.register(_env_sink.close)
+            except (OSError, sqlite3.Error, ValueError) as e:
+                log.error("Could not open conversation log %s: %s", spec, e)
+                return None
+        return _env_sink
+
+
+def read_entries(path: str, table: str = "conversation_log") -> Iterator[Dict[str, Any]]:
+    """
+    Stream entries back from a JSONL or SQLite log, oldest first.
+    """
+    for _, entry in read_entries_from(path, 0, table):
+        yield entry
+
+
+def read_entries_from(path: str, position: int = 0,
+                      table: str = "conversation_log") -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Entries after `position`, each paired with the position to resume from:
+    a byte offset for JSONL, a row id for SQLite. A torn last line in a JSONL
+    file (crash mid-write) is left for the next run.
+    """
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(f"SELECT id, {', '.join(COLUMNS)} FROM {table} WHERE id > ? ORDER BY id", (position,))
+            for row in cursor:
+                yield row[0], dict(zip(COLUMNS, row[1:]))
+        finally:
+            conn.close()
+        return
+
+    with open(path, "rb") as f:
+        f.seek(position)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            position += len(line)
+            if not line.strip():
+                continue
+            try:
+                yield position, json.loads(line)
+            except ValueError:
+                log.warning("Skipping unreadable line ending at byte %d in %s", position, path)
@@ -0,0 +1,253 @@
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .structured_log import get_logger
+
+##############################################
+# --- Provider call and fallback metrics --- #
+"""
+In-process metrics for provider calls: latency histograms per call type and
+model, input/output token counters, error counters by exception class and
+fallback counters for the canned/random fallback branches, and how many
+transitions were served from the local library instead of the provider.
+
+Two export paths:
+- long-lived workers serve Prometheus text format over HTTP
+  (start_http_server / QFLOW_METRICS_PORT): qflow_pool.py worker i listens
+  on QFLOW_METRICS_PORT + i, the analysis_jobs.py worker on
+  QFLOW_ANALYSIS_METRICS_PORT;
+- one-shot CLI runs attach summary() as a "metrics" JSON block to their
+  output when QFLOW_METRICS=summary.
+"""
+
+log = get_logger("metrics")
+
+# Provider calls range from sub-second selections to minute-long analyses
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Upper bucket bound containing the q-th observation (coarse, as in
+        Prometheus). None when it falls past the last finite bucket.
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        running = 0
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            if running >= target:
+                return bound
+        return None
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency: Dict[Tuple[str, str], Histogram] = {}
+            self.tokens: Dict[Tuple[str, str, str], int] = {}
+            self.errors: Dict[Tuple[str, str, str], int] = {}
+            self.fallbacks: Dict[Tuple[str, str], int] = {}
+            self.transitions: Dict[str, int] = {"local": 0, "llm": 0}
+            self.local_transition_seconds = 0.0
+
+    def observe_llm_call(self, call_type: str, model: str, seconds: float,
+                         input_tokens: Optional[int] = None, output_tokens: Optional[int] = None,
+                         error: Optional[BaseException] = None):
+        with self._lock:
+            key = (call_type, model)
+            hist = self.latency.get(key)
+            if hist is None:
+                hist = self.latency[key] = Histogram()
+            hist.observe(seconds)
+            for direction, n in (("input", input_tokens), ("output", output_tokens)):
+                if n:
+                    token_key = (call_type, model, direction)
+                    self.tokens[token_key] = self.tokens.get(token_key, 0) + int(n)
+            if error is not None:
+                error_key = (call_type, model, type(error).__name__)
+                self.errors[error_key] = self.errors.get(error_key, 0) + 1
+
+    def record_fallback(self, source: str, reason: str):
+        with self._lock:
+            key = (source, reason)
+            self.fallbacks[key] = self.fallbacks.get(key, 0) + 1
+
+    def record_transition(self, source: str, seconds: float = 0.0):
+        """
+        A transition served "local"ly (from the library) or by the "llm".
+        """
+        with self._lock:
+            self.transitions[source] = self.transitions.get(source, 0) + 1
+            if source == "local":
+                self.local_transition_seconds += seconds
+
+    def _transition_summary(self) -> Dict[str, Any]:
+        # Saved time is estimated from provider transitions observed in this process
+        local, llm = self.transitions["local"], self.transitions["llm"]
+        provider = [hist for (call_type, _), hist in self.latency.items() if call_type == "transition"]
+        provider_calls = sum(hist.count for hist in provider)
+        provider_mean = sum(hist.total for hist in provider) / provider_calls if provider_calls else None
+        saved = None
+        if provider_mean is not None:
+            saved = round(local * provider_mean - self.local_transition_seconds, 4)
+        return {
+            "local": local,
+            "llm": llm,
+            "local_share": round(local / (local + llm), 4) if local + llm else None,
+            "local_seconds": round(self.local_transition_seconds, 6),
+            "estimated_seconds_saved": saved
+        }
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            lines.append("# HELP qflow_llm_call_duration_seconds Provider call latency.")
+            lines.append("# TYPE qflow_llm_call_duration_seconds histogram")
+            for (call_type, model), hist in sorted(self.latency.items()):
+                labels = f'call_type="{_escape(call_type)}",model="{_escape(model)}"'
+                running = 0
+                for bound, n in zip(hist.buckets, hist.counts):
+                    running += n
+                    lines.append(f'qflow_llm_call_duration_seconds_bucket{{{labels},le="{bound}"}} {running}')
+                lines.append(f'qflow_llm_call_duration_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"qflow_llm_call_duration_seconds_sum{{{labels}}} {hist.total}")
+                lines.append(f"qflow_llm_call_duration_seconds_count{{{labels}}} {hist.count}")
+
+            lines.append("# HELP qflow_llm_tokens_total Tokens reported by the provider.")
+            lines.append("# TYPE qflow_llm_tokens_total counter")
+            for (call_type, model, direction), n in sorted(self.tokens.items()):
+                lines.append(f'qflow_llm_tokens_total{{call_type="{_escape(call_type)}",model="{_escape(model)}",direction="{direction}"}} {n}')
+
+            lines.append("# HELP qflow_llm_errors_total Failed provider calls by exception class.")
+            lines.append("# TYPE qflow_llm_errors_total counter")
+            for (call_type, model, error_class), n in sorted(self.errors.items()):
+                lines.append(f'qflow_llm_errors_total{{call_type="{_escape(call_type)}",model="{_escape(model)}",error_class="{_escape(error_class)}"}} {n}')
+
+            lines.append("# HELP qflow_fallbacks_total Times a canned or random fallback was used.")
+            lines.append("# TYPE qflow_fallbacks_total counter")
+            for (source, reason), n in sorted(self.fallbacks.items()):
+                lines.append(f'qflow_fallbacks_total{{source="{_escape(source)}",reason="{_escape(reason)}"}} {n}')
+
+            lines.append("# HELP qflow_transitions_total Transitions by source (local library or provider).")
+            lines.append("# TYPE qflow_transitions_total counter")
+            for source, n in sorted(self.transitions.items()):
+                lines.append(f'qflow_transitions_total{{source="{_escape(source)}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = {}
+            for (call_type, model), hist in self.latency.items():
+                calls.setdefault(call_type, {})[model] = {
+                    "count": hist.count,
+                    "total_seconds": round(hist.total, 4),
+                    "p50_le_seconds": hist.quantile(0.5),
+                    "p95_le_seconds": hist.quantile(0.95)
+                }
+            tokens = {}
+            for (call_type, _, direction), n in self.tokens.items():
+                tokens.setdefault(call_type, {"input": 0, "output": 0})[direction] += n
+            errors = {}
+            for (call_type, _, error_class), n in self.errors.items():
+                errors[f"{call_type}:{error_class}"] = errors.get(f"{call_type}:{error_class}", 0) + n
+            fallbacks = {}
+            for (source, _), n in self.fallbacks.items():
+                fallbacks[source] = fallbacks.get(source, 0) + n
+            return {"calls": calls, "tokens": tokens, "errors": errors, "fallbacks": fallbacks,
+                    "transitions": self._transition_summary()}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = MetricsRegistry()
+
+observe_llm_call = REGISTRY.observe_llm_call
+record_fallback = REGISTRY.record_fallback
+record_transition = REGISTRY.record_transition
+render_prometheus = REGISTRY.render_prometheus
+summary = REGISTRY.summary
+
+
+def summary_enabled() -> bool:
+    return os.getenv("QFLOW_METRICS", "").lower() == "summary"
+
+
+def attach_summary(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add the metrics summary block to a one-shot JSON result when enabled.
+    """
+    if summary_enabled() and isinstance(payload, dict):
+        payload["metrics"] = summary()
+    return payload
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serve GET /metrics in Prometheus text format from a daemon thread.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info("Serving Prometheus metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+def start_http_server_from_env(offset: int = 0, variable: str = "QFLOW_METRICS_PORT") -> Optional[ThreadingHTTPServer]:
+    """
+    Long-lived workers call this at startup; the port is the variable's value
+    plus offset (a pool worker's slot). A port that can't be bound is logged,
+    not fatal: the worker still serves requests.
+    """
+    port = os.getenv(variable)
+    if not port:
+        return None
+    try:
+        return start_http_server(int(port) + offset)
+    except (OSError, ValueError) as e:
+        log.error("Could not serve metrics on %s+%d: %s", port, offset, e)
+        return None
@@ -10,269 +10,313 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 try:
-    from Qflow import QflowSystem
+    from Qflow import QflowSystem, QflowEngine
+    from Qflow.tracing import trace, span, traced
+    from Qflow import metrics
+    from Qflow.structured_log import get_logger
 except ImportError as e:
-    print(f"Error importing QflowSystem: {e}")
-    print(f"Current sys.path: {sys.path}")
-    print(f"Current directory: {current_dir}")
-    print(f"Parent directory: {parent_dir}")
+    print(f"Error importing QflowSystem: {e}", file=sys.stderr)
+    print(f"Current sys.path: {sys.path}", file=sys.stderr)
+    print(f"Current directory: {current_dir}", file=sys.stderr)
+    print(f"Parent directory: {parent_dir}", file=sys.stderr)
     sys.exit(1)
 
+log = get_logger("conversation")
+
+QUESTIONS_FILE = os.path.join(current_dir, "life_narrative_32_questions.xlsx")
+
+_engine = None
+
+def get_engine():
+    """
+    Process-wide QflowEngine with the question bank loaded; every session
+    prepared in this process shares its client and bank.
+    Returns (engine, error) like prepare_session.
+    """
+    global _engine
+    if _engine is not None:
+        return _engine, None
+    if not os.path.exists(QUESTIONS_FILE):
+        return None, {"error": f"Questions file not found at {QUESTIONS_FILE}"}
+    engine = QflowEngine()
+    if not engine.load_questions_from_excel(QUESTIONS_FILE):
+        return None, {"error": "Failed to load questions from Excel file."}
+    _engine = engine
+    return engine, None
+
 def start_conversation():
+    with trace("qflow.start"):
+        return _start_conversation()
+
+def _start_conversation():
     try:
-        print("Initializing QflowSystem for 32 Life Narrative Questions...", file=sys.stderr)
         qflow = QflowSystem()
         
         # Load questions from Excel file
-        questions_file = os.path.join(current_dir, "life_narrative_32_questions.xlsx")
-        print(f"Looking for questions file at: {questions_file}", file=sys.stderr)
-        
-        if not os.path.exists(questions_file):
-            print(f"Error: Questions file not found at {questions_file}", file=sys.stderr)
+        if not os.path.exists(QUESTIONS_FILE):
+            log.error("Questions file not found at %s", QUESTIONS_FILE)
             return False
         
-        print("Loading questions from Excel file...", file=sys.stderr)
-        if not qflow.load_questions_from_excel(questions_file):
-            print("Error: Failed to load questions from Excel file.", file=sys.stderr)
+        if not qflow.load_questions_from_excel(QUESTIONS_FILE):
+            log.error("Failed to load questions from Excel file")
             return False
         
-        print(f"Successfully loaded {len(qflow.question_bank)} questions.", file=sys.stderr)
-        print(f"First few questions: {qflow.question_bank[:3]}", file=sys.stderr)
-        print(f"Unused questions set size: {len(qflow.unused_questions)}", file=sys.stderr)
-        
         greeting = qflow.start_greeting()
         print(greeting)
         return True
     except Exception as e:
-        print(f"Error in start_conversation: {e}", file=sys.stderr)
-        import traceback
-        print(traceback.format_exc(), file=sys.stderr)
+        log.exception("Error in start_conversation: %s", e)
         return False
 
-def process_response(user_response, used_indices=None, current_question_index=None):
+@traced("qflow.prepare_session")
+def prepare_session(used_indices=None, current_question_index=None, session_id=None, budget=None):
+    """
+    Build a QflowSystem with the question bank loaded and the session state
+    (including the budget spent so far, as reported in the last progress)
+    restored. Returns (qflow, error); error is a JSON-ready dict on failure.
+    """
+    engine, error = get_engine()
+    if error is not None:
+        return None, error
+    qflow = engine.new_session(session_id or None)
+
+    # Restore state from arguments if provided
+    if used_indices is not None:
+        try:
+            if isinstance(used_indices, str):
+                used_indices = json.loads(used_indices)
+            qflow.used_questions = [int(i) for i in used_indices]
+        except Exception as e:
+            log.warning("Error restoring used_indices: %s", e)
+    
+    if current_question_index is not None:
+        qflow.current_question_index = current_question_index
+
+    if budget is not None:
+        try:
+            if isinstance(budget, str):
+                budget = json.loads(budget)
+            qflow.budget.restore(budget)
+        except Exception as e:
+            log.warning("Error restoring budget: %s", e)
+
+    log.debug("Session restored", extra={"fields": {
+        "questions": len(qflow.question_bank),
+        "used": len(qflow.used_questions),
+        "current_question_index": qflow.current_question_index,
+        "budget_mode": qflow.budget.mode()
+    }})
+    return qflow, None
+
+def process_response(user_response, used_indices=None, current_question_index=None, session_id=None, budget=None):
     try:
-        print(f"=== PYTHON DEBUG ===", file=sys.stderr)
-        print(f"Received user_response: {user_response}", file=sys.stderr)
-        print(f"Received used_indices: {used_indices}", file=sys.stderr)
-        print(f"Received current_question_index: {current_question_index}", file=sys.stderr)
-        
-        qflow = QflowSystem()
-        # Load questions from Excel file
-        questions_file = os.path.join(current_dir, "life_narrative_32_questions.xlsx")
-        if not os.path.exists(questions_file):
-            print(json.dumps({"error": f"Questions file not found at {questions_file}"}))
-            return False
-        if not qflow.load_questions_from_excel(questions_file):
-            print(json.dumps({"error": "Failed to load questions from Excel file."}))
-            return False
+        with trace("qflow.turn", **{"qflow.command": "respond"}) as turn_span:
+            qflow, error = prepare_session(used_indices, current_question_index, session_id, budget)
+            if error is not None:
+                print(json.dumps(error))
+                return False
 
-        # Restore state from arguments if provided
-        if used_indices is not None:
-            try:
-                if isinstance(used_indices, str):
-                    used_indices = json.loads(used_indices)
-                qflow.used_questions = set(used_indices)
-                qflow.unused_questions = set(range(len(qflow.question_bank))) - qflow.used_questions
-                print(f"Restored used_questions: {qflow.used_questions}", file=sys.stderr)
-                print(f"Restored unused_questions: {qflow.unused_questions}", file=sys.stderr)
-            except Exception as e:
-                print(f"Error restoring used_indices: {e}", file=sys.stderr)
+            response_data = advance_conversation(qflow, user_response)
+            turn_span.set_attributes({
+                "qflow.question_index": response_data.get("question_index"),
+                "qflow.finished": bool(response_data.get("finished"))
+            })
+            with span("qflow.emit_json"):
+                print(json.dumps(metrics.attach_summary(response_data)))
+            return True
         
-        if current_question_index is not None:
-            qflow.current_question_index = current_question_index
-            print(f"Restored current_question_index: {qflow.current_question_index}", file=sys.stderr)
+    except Exception as e:
+        log.exception("Error in process_response: %s", e)
+        print(json.dumps({"error": str(e)}))
+        return False
 
-        print(f"Total questions loaded: {len(qflow.question_bank)}", file=sys.stderr)
-        print(f"Initial unused_questions: {qflow.unused_questions}", file=sys.stderr)
-        print(f"Initial used_questions: {qflow.used_questions}", file=sys.stderr)
+@traced("qflow.advance_conversation")
+def advance_conversation(qflow, user_response):
+    """
+    Advance a prepared session by one user turn and return the response data
+    (message, progress, cluster_id, question_index, ...) as a dict. The
+    progress carries the session budget, to be passed back next turn.
+    """
+    response_data = _advance_conversation(qflow, user_response)
+    if response_data is not None and "progress" in response_data:
+        response_data["progress"]["budget"] = qflow.budget.to_dict()
+    return response_data
 
-        # Check if this is the first response (greeting response)
-        if user_response.strip().lower() in ["yes", "y", "yeah", "yep", "sure", "ok", "okay", "ready", "let's go", "let's start"]:
-            # User is ready to start - detect user reply
-            detection_result = qflow.detect_user_reply(user_response)
+def _advance_conversation(qflow, user_response):
+    # Check if this is the first response (greeting response)
+    if user_response.strip().lower() in ["yes", "y", "yeah", "yep", "sure", "ok", "okay", "ready", "let's go", "let's start"]:
+        # User is ready to start - detect user reply
+        detection_result = qflow.detect_user_reply(user_response)
+        
+        if detection_result["action"] == "end":
+            return {
+                "message": detection_result["message"],
+                "progress": {
+                    "used_questions": len(qflow.used_questions),
+                    "total_questions": len(qflow.question_bank),
+                    "used_question_indices": sorted(qflow.used_questions)
+                },
+                "question_index": None
+            }
+        elif detection_result["action"] == "clarify":
+            return {
+                "message": detection_result["message"],
+                "progress": {
+                    "used_questions": len(qflow.used_questions),
+                    "total_questions": len(qflow.question_bank),
+                    "used_question_indices": sorted(qflow.used_questions)
+                },
+                "question_index": None
+            }
+        
+        # If we get here, user is ready to start
+        if detection_result["action"] == "start":
+            current_question = detection_result["question"]
+            current_question_index = detection_result["question_index"]
             
-            if detection_result["action"] == "end":
-                print(json.dumps({
-                    "message": detection_result["message"],
-                    "progress": {
-                        "used_questions": len(qflow.used_questions),
-                        "total_questions": len(qflow.question_bank),
-                        "used_question_indices": list(qflow.used_questions)
-                    },
-                    "question_index": None
-                }))
-                return True
-            elif detection_result["action"] == "clarify":
-                print(json.dumps({
-                    "message": detection_result["message"],
-                    "progress": {
-                        "used_questions": len(qflow.used_questions),
-                        "total_questions": len(qflow.question_bank),
-                        "used_question_indices": list(qflow.used_questions)
-                    },
-                    "question_index": None
-                }))
-                return True
+            # Set the current question index but DON'T mark as used yet
+            # It will be marked as used when the user answers it
+            qflow.current_question_index = current_question_index
             
-            # If we get here, user is ready to start
-            if detection_result["action"] == "start":
-                current_question = detection_result["question"]
-                current_question_index = detection_result["question_index"]
-                
-                print(f"Selected first question index: {current_question_index}", file=sys.stderr)
-                print(f"Selected question: {current_question}", file=sys.stderr)
-                
-                # Set the current question index but DON'T mark as used yet
-                # It will be marked as used when the user answers it
-                qflow.current_question_index = current_question_index
-                
-                # Get cluster_id for the selected question
-                next_question_data = qflow.question_bank[current_question_index]
-                cluster_id = next_question_data.get('cluster_id', current_question_index)
-                print(f"Selected cluster_id: {cluster_id}", file=sys.stderr)
-                
-                message = f"Great! Let's begin with the first question.\n\nQuestion 1 of 32:\n{current_question}"
-                
-                progress = qflow.track_questions()
-                response_data = {
-                    "message": message,
-                    "progress": {
-                        "used_questions": progress["used_questions"],
-                        "total_questions": progress["total_questions"],
-                        "used_question_indices": list(qflow.used_questions)
-                    },
-                    "cluster_id": cluster_id,
-                    "question_index": current_question_index
-                }
-                
-                print(f"Final response data: {response_data}", file=sys.stderr)
-                print(f"=== END PYTHON DEBUG ===", file=sys.stderr)
-                
-                print(json.dumps(response_data))
-                return True
-        else:
-            # User is answering a question - mark the current question as used
-            print(f"[DEBUG] About to mark as used: current_question_index={qflow.current_question_index}", file=sys.stderr)
-            print(f"[DEBUG] Unused before marking: {qflow.unused_questions}", file=sys.stderr)
+            # Get cluster_id for the selected question
+            next_question_data = qflow.question_bank[current_question_index]
+            cluster_id = next_question_data.get('cluster_id', current_question_index)
             
-            # If current_question_index is None, this might be the first question after greeting
-            # In this case, we need to select the first question and then mark it as used
-            if qflow.current_question_index is None:
-                print("No current question index provided - selecting first question", file=sys.stderr)
-                # Select the first question
-                next_question_result = qflow.select_next_question(user_response)
-                next_question = next_question_result["question"]
-                next_question_index = next_question_result["question_index"]
-                qflow.current_question_index = next_question_index
-                print(f"Selected first question index: {next_question_index}", file=sys.stderr)
-                
-                # Mark it as used since user is answering it
-                qflow.mark_current_question_as_used()
-                print(f"Marked question {qflow.current_question_index} as used after user answered", file=sys.stderr)
-                
-                # Calculate progress immediately after marking as used
-                progress = qflow.track_questions()
-                # Select the next question for the user
-                next_question_result = qflow.select_next_question(user_response)
-                # Check if all questions are finished
-                if next_question_result.get("finished"):
-                    # Get the last answered question's cluster_id
-                    last_answered_index = max(qflow.used_questions) if qflow.used_questions else None
-                    last_answer_cluster_id = None
-                    if last_answered_index is not None:
-                        last_answer_cluster_id = qflow.question_bank[last_answered_index].get('cluster_id', last_answered_index)
-                    print(json.dumps({
-                        "message": "🎉 Congratulations! You've completed all 32 questions. Your life story responses have been saved and will be analyzed to provide insights into your personality traits. Thank you for sharing your experiences!",
-                        "progress": progress,
-                        "cluster_id": None,
-                        "question_index": None,
-                        "finished": True,
-                        "last_answer_cluster_id": last_answer_cluster_id
-                    }))
-                    return True
-                next_question = next_question_result["question"]
-                next_question_index = next_question_result["question_index"]
-                qflow.current_question_index = next_question_index
-                next_question_data = qflow.question_bank[next_question_index]
-                cluster_id = next_question_data.get('cluster_id', next_question_index)
-                message = qflow.generate_ai_reply(user_response, next_question)
-                
-                # Add question number to message
-                question_number = len(qflow.used_questions) + 1
-                message = f"{message}\n\nQuestion {question_number} of 32:\n{next_question}"
-                
-                response_data = {
-                    "message": message,
+            message = f"Great! Let's begin with the first question.\n\nQuestion 1 of 32:\n{current_question}"
+            
+            progress = qflow.track_questions()
+            response_data = {
+                "message": message,
+                "progress": {
+                    "used_questions": progress["used_questions"],
+                    "total_questions": progress["total_questions"],
+                    "used_question_indices": sorted(qflow.used_questions)
+                },
+                "cluster_id": cluster_id,
+                "question_index": current_question_index
+            }
+            
+            log.debug("Turn complete", extra={"fields": {"question_index": response_data["question_index"], "cluster_id": cluster_id}})
+            
+            return response_data
+    else:
+        # User is answering a question - mark the current question as used
+        # If current_question_index is None, this might be the first question after greeting
+        # In this case, we need to select the first question and then mark it as used
+        if qflow.current_question_index is None:
+            log.debug("No current question index provided, selecting first question")
+            # Select the first question
+            next_question_result = qflow.select_next_question(user_response)
+            next_question = next_question_result["question"]
+            next_question_index = next_question_result["question_index"]
+            qflow.current_question_index = next_question_index
+            
+            # Mark it as used since user is answering it
+            qflow.mark_current_question_as_used()
+            answered_index = qflow.current_question_index
+            
+            # Calculate progress immediately after marking as used
+            progress = qflow.track_questions()
+            # Select the next question for the user
+            next_question_result = qflow.select_next_question(user_response)
+            # Check if all questions are finished
+            if next_question_result.get("finished"):
+                # Get the last answered question's cluster_id
+                last_answered_index = max(qflow.used_questions) if qflow.used_questions else None
+                last_answer_cluster_id = None
+                if last_answered_index is not None:
+                    last_answer_cluster_id = qflow.question_bank[last_answered_index].get('cluster_id', last_answered_index)
+                _log_answer(qflow, answered_index, user_response)
+                return {
+                    "message": "🎉 Congratulations! You've completed all 32 questions. Your life story responses have been saved and will be analyzed to provide insights into your personality traits. Thank you for sharing your experiences!",
                     "progress": progress,
-                    "cluster_id": cluster_id,
-                    "question_index": next_question_index
+                    "cluster_id": None,
+                    "question_index": None,
+                    "finished": True,
+                    "last_answer_cluster_id": last_answer_cluster_id
                 }
-                
-                print(f"Final response data: {response_data}", file=sys.stderr)
-                print(f"=== END PYTHON DEBUG ===", file=sys.stderr)
-                
-                print(json.dumps(response_data))
-                return True
-            else:
-                # Normal flow - mark current question as used and select next
-                qflow.mark_current_question_as_used()
-                print(f"Marked question {qflow.current_question_index} as used after user answered", file=sys.stderr)
-                
-                # Calculate progress immediately after marking as used
-                progress = qflow.track_questions()
-                
-                # Select the next question for the user
-                next_question_result = qflow.select_next_question(user_response)
-                
-                # Check if all questions are finished
-                if next_question_result.get("finished"):
-                    # Get the last answered question's cluster_id
-                    last_answered_index = max(qflow.used_questions) if qflow.used_questions else None
-                    last_answer_cluster_id = None
-                    if last_answered_index is not None:
-                        last_answer_cluster_id = qflow.question_bank[last_answered_index].get('cluster_id', last_answered_index)
-                    print(json.dumps({
-                        "message": "🎉 Congratulations! You've completed all 32 questions. Your life story responses have been saved and will be analyzed to provide insights into your personality traits. Thank you for sharing your experiences!",
-                        "progress": progress,
-                        "cluster_id": None,
-                        "question_index": None,
-                        "finished": True,
-                        "last_answer_cluster_id": last_answer_cluster_id
-                    }))
-                    return True
-                
-                next_question = next_question_result["question"]
-                next_question_index = next_question_result["question_index"]
-                qflow.current_question_index = next_question_index
-                next_question_data = qflow.question_bank[next_question_index]
-                cluster_id = next_question_data.get('cluster_id', next_question_index)
-                
-                # Generate AI response
-                message = qflow.generate_ai_reply(user_response, next_question)
-                
-                # Add question number to message
-                question_number = len(qflow.used_questions) + 1
-                message = f"{message}\n\nQuestion {question_number} of 32:\n{next_question}"
-                
-                response_data = {
-                    "message": message,
+            next_question = next_question_result["question"]
+            next_question_index = next_question_result["question_index"]
+            qflow.current_question_index = next_question_index
+            next_question_data = qflow.question_bank[next_question_index]
+            cluster_id = next_question_data.get('cluster_id', next_question_index)
+            message = qflow.generate_ai_reply(user_response, next_question)
+            
+            # Add question number to message
+            question_number = len(qflow.used_questions) + 1
+            message = f"{message}\n\nQuestion {question_number} of 32:\n{next_question}"
+            
+            response_data = {
+                "message": message,
+                "progress": progress,
+                "cluster_id": cluster_id,
+                "question_index": next_question_index
+            }
+            
+            log.debug("Turn complete", extra={"fields": {"question_index": response_data["question_index"], "cluster_id": cluster_id}})
+            _log_answer(qflow, answered_index, user_response, message)
+            
+            return response_data
+        else:
+            # Normal flow - mark current question as used and select next
+            qflow.mark_current_question_as_used()
+            answered_index = qflow.current_question_index
+            
+            # Calculate progress immediately after marking as used
+            progress = qflow.track_questions()
+            
+            # Select the next question for the user
+            next_question_result = qflow.select_next_question(user_response)
+            
+            # Check if all questions are finished
+            if next_question_result.get("finished"):
+                # Get the last answered question's cluster_id
+                last_answered_index = max(qflow.used_questions) if qflow.used_questions else None
+                last_answer_cluster_id = None
+                if last_answered_index is not None:
+                    last_answer_cluster_id = qflow.question_bank[last_answered_index].get('cluster_id', last_answered_index)
+                _log_answer(qflow, answered_index, user_response)
+                return {
+                    "message": "🎉 Congratulations! You've completed all 32 questions. Your life story responses have been saved and will be analyzed to provide insights into your personality traits. Thank you for sharing your experiences!",
                     "progress": progress,
-                    "cluster_id": cluster_id,
-                    "question_index": next_question_index
+                    "cluster_id": None,
+                    "question_index": None,
+                    "finished": True,
+                    "last_answer_cluster_id": last_answer_cluster_id
                 }
-                
-                print(f"Final response data: {response_data}", file=sys.stderr)
-                print(f"=== END PYTHON DEBUG ===", file=sys.stderr)
-                
-                print(json.dumps(response_data))
-                return True
-        
-    except Exception as e:
-        print(f"Error in process_response: {e}", file=sys.stderr)
-        import traceback
-        print(traceback.format_exc(), file=sys.stderr)
-        print(json.dumps({"error": str(e)}))
-        return False
+            
+            next_question = next_question_result["question"]
+            next_question_index = next_question_result["question_index"]
+            qflow.current_question_index = next_question_index
+            next_question_data = qflow.question_bank[next_question_index]
+            cluster_id = next_question_data.get('cluster_id', next_question_index)
+            
+            # Generate AI response
+            message = qflow.generate_ai_reply(user_response, next_question)
+            
+            # Add question number to message
+            question_number = len(qflow.used_questions) + 1
+            message = f"{message}\n\nQuestion {question_number} of 32:\n{next_question}"
+            
+            response_data = {
+                "message": message,
+                "progress": progress,
+                "cluster_id": cluster_id,
+                "question_index": next_question_index
+            }
+            
+            log.debug("Turn complete", extra={"fields": {"question_index": response_data["question_index"], "cluster_id": cluster_id}})
+            _log_answer(qflow, answered_index, user_response, message)
+            
+            return response_data
+
+def _log_answer(qflow, answered_index, user_response, transition=""):
+    """
+    Append the answered question to the session's conversation log (and its sink).
+    """
+    if answered_index is None or not 0 <= answered_index < len(qflow.question_bank):
+        return
+    qflow.log_interaction(qflow.question_bank[answered_index]["question"], user_response, answered_index, transition)
 
 def main():
     parser = argparse.ArgumentParser(description='Life Narrative Chatbot using Qflow')
@@ -280,15 +324,17 @@ def main():
     parser.add_argument('--respond', help='User response to process')
     parser.add_argument('--used_indices', help='JSON string of used question indices')
     parser.add_argument('--current_question_index', type=int, help='Current question index')
+    parser.add_argument('--session_id', help='Session id recorded in the conversation log')
+    parser.add_argument('--budget', help='JSON budget from the previous turn\'s progress')
     
     args = parser.parse_args()
     
     if args.start:
         return start_conversation()
     elif args.respond:
-        return process_response(args.respond, args.used_indices, args.current_question_index)
+        return process_response(args.respond, args.used_indices, args.current_question_index, args.session_id, args.budget)
     else:
-        print("Usage: python qflow_conversation.py --start | --respond <response> [--used_indices <indices>] [--current_question_index <index>]")
+        print("Usage: python qflow_conversation.py --start | --respond <response> [--used_indices <indices>] [--current_question_index <index>] [--session_id <id>] [--budget <json>]")
         return False
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import random
+import logging
+
+######################################
+# --- Leveled structured logging --- #
+"""
+JSON-lines logging for the Qflow package, written to stderr.
+
+Production mode is the default: only WARNING and above are emitted, so a
+turn's stderr stays constant-size whatever the bank size. Environment:
+    QFLOW_LOG_MODE=production|debug   default level WARNING / DEBUG
+    QFLOW_LOG_LEVEL=INFO              explicit level, overrides the mode
+    QFLOW_LOG_SAMPLE=0.1              keep this fraction of DEBUG/INFO records
+
+Call sites pass structured fields through `extra={"fields": {...}}` and use
+%-style arguments, so nothing is formatted unless the record is emitted.
+Keep fields scalar (counts, indices), never whole sets or response dicts.
+"""
+
+ROOT_LOGGER = "qflow"
+_configured = False
+
+
+class JsonLinesFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a random fraction of records below WARNING; warnings and errors always pass.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def _level_from_env() -> int:
+    level = os.getenv("QFLOW_LOG_LEVEL")
+    if level:
+        resolved = logging.getLevelName(level.upper())
+        return resolved if isinstance(resolved, int) else logging.WARNING
+    return logging.DEBUG if os.getenv("QFLOW_LOG_MODE", "production").lower() == "debug" else logging.WARNING
+
+
+def configure_logging(level: int = None, sample_rate: float = None, stream=None):
+    """
+    Install the JSON-lines handler on the "qflow" logger. Safe to call repeatedly;
+    explicit arguments reconfigure an existing setup.
+    """
+    global _configured
+    logger = logging.getLogger(ROOT_LOGGER)
+    if _configured and level is None and sample_rate is None and stream is None:
+        return logger
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonLinesFormatter())
+    if sample_rate is None:
+        sample_rate = float(os.getenv("QFLOW_LOG_SAMPLE", "1"))
+    if sample_rate < 1:
+        handler.addFilter(SamplingFilter(sample_rate))
+
+    logger.addHandler(handler)
+    logger.setLevel(level if level is not None else _level_from_env())
+    logger.propagate = False
+    _configured = True
+    return logger
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger under the "qflow" namespace, configured from the environment on first use.
+    """
+    configure_logging()
+    if name == ROOT_LOGGER or name.startswith(ROOT_LOGGER + "."):
+        return logging.getLogger(name)
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
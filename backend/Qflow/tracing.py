@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from .structured_log import get_logger
+
+########################################
+# --- Lightweight per-turn tracing --- #
+"""
+Nested timing spans for a Qflow turn, exported as one OpenTelemetry
+(OTLP/JSON) trace record per turn.
+
+Tracing is off unless an exporter is configured:
+    QFLOW_TRACE_FILE=/path/to/traces.jsonl   append one record per line
+    QFLOW_TRACE_FD=3                          write records to an inherited fd
+When off, span() returns a shared no-op span, so instrumentation costs one
+context-variable lookup per call site.
+
+The active trace and the current span are context variables, so concurrent
+turns in one process (threads of an analysis worker) keep separate traces.
+Work handed to another thread joins the turn's trace only if it runs in a
+copy of the caller's context:
+    executor.submit(contextvars.copy_context().run, fn, *args)
+
+Usage:
+    with trace("qflow.turn", **attributes):
+        with span("qflow.select_next_question") as s:
+            s.set_attribute("qflow.candidates", 31)
+"""
+
+log = get_logger("tracing")
+
+SERVICE_NAME = "qflow"
+
+# OTLP enum values
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "kind", "start_ns", "end_ns", "attributes", "error", "_t0")
+
+    def __init__(self, name: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.error = None
+        self.start_ns = time.time_ns()
+        self._t0 = time.perf_counter_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def finish(self):
+        # Wall-clock start plus a monotonic duration, so NTP steps can't yield negative spans
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._t0)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or self.start_ns) - self.start_ns) / 1e6
+
+    def to_otlp(self, trace_id: str) -> Dict[str, Any]:
+        record = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK}
+        }
+        if self.parent_id:
+            record["parentSpanId"] = self.parent_id
+        return record
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """
+    All spans of one turn. Spans may be opened from several threads running
+    in copies of the turn's context, so the span list is locked.
+    """
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self.root = self.open(name, None, SPAN_KIND_INTERNAL, attributes)
+
+    def open(self, name: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]) -> Span:
+        s = Span(name, parent_id, kind, attributes)
+        with self._lock:
+            self.spans.append(s)
+        return s
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}}
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "Qflow.tracing"},
+                    "spans": [s.to_otlp(self.trace_id) for s in self.spans]
+                }]
+            }]
+        }
+
+
+_active_trace: contextvars.ContextVar = contextvars.ContextVar("qflow_active_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("qflow_current_span", default=None)
+
+
+def _exporter_target():
+    path = os.getenv("QFLOW_TRACE_FILE")
+    if path:
+        return ("file", path)
+    fd = os.getenv("QFLOW_TRACE_FD")
+    if fd and fd.isdigit():
+        return ("fd", int(fd))
+    return None
+
+
+def tracing_enabled() -> bool:
+    return _exporter_target() is not None
+
+
+def export(record: Dict[str, Any]):
+    target = _exporter_target()
+    if target is None:
+        return
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    try:
+        if target[0] == "file":
+            with open(target[1], "a", encoding="utf-8") as f:
+                f.write(line)
+        else:
+            os.write(target[1], line.encode("utf-8"))
+    except OSError as e:
+        log.warning("Trace export failed: %s", e)
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """
+    Root span of a turn. On exit the whole trace is exported as one record.
+    Nested trace() calls behave like span().
+    """
+    if _active_trace.get() is not None or not tracing_enabled():
+        with span(name, **attributes) as s:
+            yield s
+        return
+
+    active = Trace(name, attributes)
+    root = active.root
+    trace_token = _active_trace.set(active)
+    span_token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        root.finish()
+        _current_span.reset(span_token)
+        _active_trace.reset(trace_token)
+        export(active.to_otlp())
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """
+    Child span of the current span; a no-op outside of an active trace.
+    """
+    active = _active_trace.get()
+    if active is None:
+        yield NOOP_SPAN
+        return
+
+    parent = _current_span.get() or active.root
+    s = active.open(name, parent.span_id, kind, attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.finish()
+        _current_span.reset(token)
+
+
+def current_span():
+    """
+    The innermost open span, or a no-op span when not tracing.
+    """
+    active = _active_trace.get()
+    if active is None:
+        return NOOP_SPAN
+    return _current_span.get() or active.root
+
+
+def traced(name: str):
+    """
+    Decorator: run the function inside span(name) while a trace is active.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active_trace.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
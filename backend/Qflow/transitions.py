@@ -0,0 +1,202 @@
+import os
+import re
+import json
+from typing import Dict, List, Optional
+
+from .structured_log import get_logger
+
+###################################
+# --- Local transition library --- #
+"""
+Precomputed transitions so most turns skip the generate_ai_reply provider
+call. A library maps a scope (one question, one cluster, or "*") and coarse
+response features (length bucket, sentiment) to bridge templates ending with
+{question}; QflowSystem.generate_ai_reply fills one in locally and only calls
+the provider when the response looks like it needs a tailored answer (the
+user asked something back, mixed or strongly negative feelings in a long
+answer) or nothing matches.
+
+The library is built offline by build_transitions.py (one provider call per
+cluster of a bank) and selected with:
+    QFLOW_TRANSITIONS=transitions.json | builtin   (builtin: the generic templates below only)
+    QFLOW_TRANSITION_MIN_CONFIDENCE=0.6
+Turns served locally, provider-generated transitions and the estimated
+latency saved are reported in the metrics summary under "transitions".
+"""
+
+log = get_logger("transitions")
+
+LENGTHS = ("short", "medium", "long")
+SENTIMENTS = ("negative", "neutral", "positive")
+SHORT_WORDS = 12
+LONG_WORDS = 80
+DEFAULT_MIN_CONFIDENCE = 0.6
+LIBRARY_VERSION = 1
+
+_WORD = re.compile(r"[a-z']+")
+_NEGATORS = frozenset({"not", "no", "never", "don't", "didn't", "wasn't", "isn't", "couldn't", "wouldn't", "hardly"})
+_POSITIVE = frozenset("""
+    love loved loving enjoy enjoyed enjoying happy happier happiest glad great good wonderful amazing fun
+    proud grateful thankful excited exciting fond favorite favourite best calm peaceful supportive close
+    warm kind lucky fortunate beautiful fantastic rewarding inspiring inspired hopeful confident safe
+""".split())
+_NEGATIVE = frozenset("""
+    hate hated sad sadness angry anger upset hard difficult tough painful hurt hurting lonely alone afraid
+    scared fear anxious anxiety stress stressful stressed worst bad terrible awful lost loss died death
+    divorce abuse abused bullied struggle struggled struggling regret ashamed depressed depression cried
+    miss missed grief sick illness frustrated frustrating disappointed
+""".split())
+
+# Generic bridges, used for every question unless a built library has more
+# specific ones. "{question}" is replaced with the next question verbatim.
+BUILTIN_TEMPLATES = {
+    "short|negative": [
+        "Thank you for sharing that, I know it isn't always easy. {question}",
+        "I appreciate you telling me that. {question}"
+    ],
+    "short|neutral": [
+        "Thanks for that. {question}",
+        "Got it, thank you. {question}",
+        "Thank you. Let's keep going. {question}"
+    ],
+    "short|positive": [
+        "That's lovely to hear. {question}",
+        "I'm glad to hear that. {question}"
+    ],
+    "medium|negative": [
+        "Thank you for being so open about something that sounds difficult. {question}",
+        "That sounds like it was hard, and I appreciate you sharing it with me. {question}"
+    ],
+    "medium|neutral": [
+        "Thank you, that gives me a clearer picture of you. {question}",
+        "That's helpful to understand. Let me ask you about something a little different. {question}",
+        "I appreciate the detail there. {question}"
+    ],
+    "medium|positive": [
+        "It sounds like that meant a lot to you, thank you for sharing it. {question}",
+        "I can hear how much that matters to you. {question}"
+    ],
+    "long|negative": [
+        "Thank you for trusting me with all of that; it clearly shaped you. {question}",
+        "I really appreciate how openly you've described that, it sounds like a lot to carry. {question}"
+    ],
+    "long|neutral": [
+        "Thank you for such a thoughtful and detailed answer. {question}",
+        "There's a lot in what you've shared, and it helps me understand you better. {question}"
+    ],
+    "long|positive": [
+        "Thank you for such a rich answer, it's clear how much those experiences mean to you. {question}",
+        "I really enjoyed hearing about that, thank you for going into so much detail. {question}"
+    ]
+}
+
+
+def response_features(user_response: str) -> Dict[str, object]:
+    """
+    Length bucket, lexicon sentiment (with one-word negation) and the
+    signals that lower confidence in a canned reply.
+    """
+    text = user_response.lower()
+    words = _WORD.findall(text)
+    positive = negative = 0
+    for i, word in enumerate(words):
+        polarity = (word in _POSITIVE) - (word in _NEGATIVE)
+        if polarity and i and words[i - 1] in _NEGATORS:
+            polarity = -polarity
+        if polarity > 0:
+            positive += 1
+        elif polarity < 0:
+            negative += 1
+
+    score = (positive - negative) / max(1, positive + negative)
+    sentiment = "positive" if score > 0.3 else "negative" if score < -0.3 else "neutral"
+    length = "short" if len(words) < SHORT_WORDS else "long" if len(words) >= LONG_WORDS else "medium"
+    return {
+        "length": length,
+        "sentiment": sentiment,
+        "words": len(words),
+        "positive": positive,
+        "negative": negative,
+        "asks_question": "?" in user_response
+    }
+
+
+def confidence(features: Dict[str, object]) -> float:
+    """
+    How safely a canned bridge fits this response, 0-1.
+    """
+    if features["asks_question"]:
+        return 0.2
+    value = 1.0
+    positive, negative = features["positive"], features["negative"]
+    if positive and negative:
+        # Mixed feelings are where a generic bridge reads as tone-deaf
+        value -= 0.3 + 0.5 * min(positive, negative) / max(positive, negative)
+    if features["sentiment"] == "negative" and features["length"] != "short" and negative >= 3:
+        # A heavy disclosure deserves a reply that engages with it
+        value -= 0.5
+    return max(0.0, value)
+
+
+class TransitionLibrary:
+    """
+    Read-only templates by scope ("question:<index>", "cluster:<id>", "*")
+    and feature key ("<length>|<sentiment>"); shared through QflowEngine.
+    """
+
+    def __init__(self, templates: Dict[str, Dict[str, List[str]]] = None,
+                 min_confidence: float = DEFAULT_MIN_CONFIDENCE):
+        self.templates = {"*": {key: list(values) for key, values in BUILTIN_TEMPLATES.items()}}
+        for scope, by_key in (templates or {}).items():
+            for key, values in by_key.items():
+                valid = [t for t in values if valid_template(t)]
+                if valid:
+                    self.templates.setdefault(scope, {}).setdefault(key, []).extend(valid)
+        self.min_confidence = min_confidence
+
+    @classmethod
+    def load(cls, path: str, min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> "TransitionLibrary":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != LIBRARY_VERSION:
+            raise ValueError(f"Unsupported transition library version {data.get('version')!r} in {path}")
+        library = cls(data.get("templates"), min_confidence)
+        log.info("Loaded transition library", extra={"fields": {
+            "path": path, "scopes": len(library.templates)
+        }})
+        return library
+
+    def render(self, user_response: str, next_question: str, question_index: Optional[int] = None,
+               cluster_id=None, rng=None, min_confidence: float = None) -> Optional[str]:
+        """
+        A filled-in transition ending with next_question, or None when
+        confidence is below min_confidence (the library's unless given) and
+        the provider should write it.
+        """
+        features = response_features(user_response)
+        if confidence(features) < (self.min_confidence if min_confidence is None else min_confidence):
+            return None
+        key = f"{features['length']}|{features['sentiment']}"
+        for scope in (f"question:{question_index}", f"cluster:{cluster_id}", "*"):
+            candidates = self.templates.get(scope, {}).get(key)
+            if candidates:
+                template = rng.choice(candidates) if rng is not None else candidates[0]
+                return template.replace("{question}", next_question)
+        return None
+
+
+def valid_template(template) -> bool:
+    """
+    A template ends with {question} and has no other placeholder.
+    """
+    return isinstance(template, str) and template.rstrip().endswith("{question}") and template.count("{") == 1
+
+
+def transitions_from_env() -> Optional[TransitionLibrary]:
+    source = os.getenv("QFLOW_TRANSITIONS")
+    if not source:
+        return None
+    min_confidence = float(os.getenv("QFLOW_TRANSITION_MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE))
+    if source == "builtin":
+        return TransitionLibrary(min_confidence=min_confidence)
+    return TransitionLibrary.load(source, min_confidence)
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Durable queue for personality analyses.
+
+The results request enqueues the session's responses and returns at once;
+`analysis_jobs.py worker` leases queued jobs, runs analyze_personality on a
+shared QflowEngine with configurable concurrency, and stores each result.
+
+Jobs live in one SQLite table (default: analysis_jobs.db next to
+indivar.db), one job per session:
+    queued   waiting, or waiting out a retry backoff (available_at)
+    running  leased by a worker until lease_expires; the worker renews the
+             lease while the analysis runs, so a lease only lapses when the
+             worker died, and the job is then picked up again
+    done     result stored
+    dead     max_attempts used up; last_error and the last (sample-score)
+             result are kept, and `retry` requeues it
+An analysis that falls back to sample scores (provider unavailable) counts
+as a failed attempt.
+
+Usage (from backend/):
+    echo '{"sessionId": ..., "responses": [...]}' | python analysis_jobs.py enqueue
+    python analysis_jobs.py worker --concurrency 4 --metrics-port 9410
+    python analysis_jobs.py status --session <sessionId>
+    python analysis_jobs.py stats
+    python analysis_jobs.py retry --all-dead
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import socket
+import sqlite3
+import argparse
+import threading
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+JOBS_PATH = os.getenv("QFLOW_ANALYSIS_JOBS") or os.path.join(current_dir, "..", "analysis_jobs.db")
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_POLL_SECONDS = 1.0
+RETRY_BACKOFF_SECONDS = 30.0
+
+STATUSES = ("queued", "running", "done", "dead")
+
+
+class JobQueue:
+    """
+    The analysis_jobs table. Connections are per thread; state transitions
+    that pick a job run in IMMEDIATE transactions, so several worker
+    processes can share one file.
+    """
+
+    def __init__(self, path=JOBS_PATH, retry_backoff=RETRY_BACKOFF_SECONDS):
+        self.path = path
+        self.retry_backoff = retry_backoff
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT UNIQUE, user_id TEXT, payload TEXT, "
+            "status TEXT, attempts INTEGER DEFAULT 0, max_attempts INTEGER, available_at REAL, "
+            "lease_owner TEXT, lease_expires REAL, last_error TEXT, result TEXT, "
+            "created_at REAL, updated_at REAL, finished_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS analysis_jobs_ready ON analysis_jobs (status, available_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def enqueue(self, payload, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Queue an analysis for payload["sessionId"]. A session that already
+        has a job keeps it (enqueueing is idempotent); returns the job.
+        """
+        session_id = payload.get("sessionId") or uuid.uuid4().hex
+        now = time.time()
+        conn = self._transaction()
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO analysis_jobs (session_id, user_id, payload, status, max_attempts, "
+                "available_at, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (session_id, _text(payload.get("userId")), json.dumps(payload), max_attempts, now, now, now)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(session_id=session_id)
+
+    def lease(self, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Claim the oldest ready job (queued and due, or running with a lapsed
+        lease) for `owner`. Lapsed jobs with no attempts left go to dead.
+        Returns the job, or None.
+        """
+        now = time.time()
+        conn = self._transaction()
+        try:
+            conn.execute(
+                "UPDATE analysis_jobs SET status = 'dead', last_error = 'lease expired', lease_owner = NULL, "
+                "updated_at = ?, finished_at = ? "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now, now)
+            )
+            row = conn.execute(
+                "SELECT id FROM analysis_jobs "
+                "WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY available_at, id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE analysis_jobs SET status = 'running', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (owner, now + lease_seconds, now, row["id"])
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(job_id=row["id"]) if row is not None else None
+
+    def renew(self, job_id, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        cursor = self._conn().execute(
+            "UPDATE analysis_jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+            (time.time() + lease_seconds, job_id, owner)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, owner, result):
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE analysis_jobs SET status = 'done', result = ?, last_error = NULL, lease_owner = NULL, "
+            "updated_at = ?, finished_at = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+            (json.dumps(result), now, now, job_id, owner)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, owner, error, result=None):
+        """
+        Requeue with exponential backoff, or dead-letter once max_attempts
+        is reached. `result` (e.g. sample scores) is kept either way.
+        """
+        now = time.time()
+        conn = self._transaction()
+        try:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM analysis_jobs WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (job_id, owner)
+            ).fetchone()
+            if row is not None:
+                dead = row["attempts"] >= row["max_attempts"]
+                conn.execute(
+                    "UPDATE analysis_jobs SET status = ?, available_at = ?, last_error = ?, "
+                    "result = COALESCE(?, result), lease_owner = NULL, updated_at = ?, finished_at = ? WHERE id = ?",
+                    ("dead" if dead else "queued", now + self.retry_backoff * 2 ** (row["attempts"] - 1),
+                     str(error), json.dumps(result) if result is not None else None, now,
+                     now if dead else None, job_id)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row is not None
+
+    def retry(self, job_id=None, all_dead=False):
+        """
+        Requeue a dead job (or every dead job) with a fresh set of attempts.
+        """
+        now = time.time()
+        query = ("UPDATE analysis_jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ?, "
+                 "finished_at = NULL WHERE status = 'dead'")
+        params = [now, now]
+        if not all_dead:
+            query += " AND id = ?"
+            params.append(job_id)
+        return self._conn().execute(query, params).rowcount
+
+    def get(self, job_id=None, session_id=None, with_result=True):
+        if job_id is not None:
+            row = self._conn().execute("SELECT * FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+        else:
+            row = self._conn().execute("SELECT * FROM analysis_jobs WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        job = {key: row[key] for key in ("id", "session_id", "user_id", "status", "attempts", "max_attempts",
+                                         "last_error", "created_at", "updated_at", "finished_at")}
+        if with_result:
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        job["payload"] = json.loads(row["payload"])
+        return job
+
+    def stats(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        for status, n in self._conn().execute("SELECT status, COUNT(*) FROM analysis_jobs GROUP BY status"):
+            counts[status] = n
+        oldest = self._conn().execute("SELECT MIN(created_at) FROM analysis_jobs WHERE status = 'queued'").fetchone()[0]
+        counts["oldest_queued_age_s"] = round(time.time() - oldest, 1) if oldest else None
+        return counts
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+class AnalysisWorker:
+    """
+    `concurrency` threads leasing and running jobs against one QflowEngine,
+    plus a heartbeat thread renewing the leases of jobs in flight.
+    """
+
+    def __init__(self, queue_path=JOBS_PATH, concurrency=2, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 poll_seconds=DEFAULT_POLL_SECONDS, retry_backoff=RETRY_BACKOFF_SECONDS):
+        self.queue_path = queue_path
+        self.retry_backoff = retry_backoff
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.owner_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self.in_flight = {}
+        self._lock = threading.Lock()
+        self.stats = {"done": 0, "failed": 0}
+        self.engine = None
+
+    def _prewarm(self):
+        try:
+            from Qflow.flow import QflowEngine
+            self.engine = QflowEngine(log_sink=None)
+        except Exception as e:
+            # analyze_personality builds its own client (or falls back) per job
+            print(f"Could not prewarm QflowEngine: {e}", file=sys.stderr)
+
+    def run_job(self, queue, job, owner):
+        import analyze_personality
+
+        try:
+            result = analyze_personality.run_analysis(job["payload"], self.engine, record=False)
+        except Exception as e:
+            queue.fail(job["id"], owner, f"{type(e).__name__}: {e}")
+            self._count("failed")
+            return
+        if result.get("ai_analysis"):
+            queue.complete(job["id"], owner, result)
+            self._count("done")
+        else:
+            dead = job["attempts"] >= job["max_attempts"]
+            queue.fail(job["id"], owner, result.get("note") or "AI analysis unavailable", result)
+            self._count("failed")
+            if not dead:
+                return
+        if job["payload"].get("sessionId") and os.getenv("QFLOW_ANALYSIS_LOG"):
+            analyze_personality.record_analysis(job["session_id"], result, job["user_id"])
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _loop(self, index, drain):
+        queue = JobQueue(self.queue_path, self.retry_backoff)
+        owner = f"{self.owner_prefix}:{index}"
+        try:
+            while not self.stopping.is_set():
+                job = queue.lease(owner, self.lease_seconds)
+                if job is None:
+                    if drain:
+                        return
+                    self.stopping.wait(self.poll_seconds)
+                    continue
+                with self._lock:
+                    self.in_flight[job["id"]] = owner
+                try:
+                    self.run_job(queue, job, owner)
+                except Exception as e:
+                    # Queue errors leave the lease to lapse; the job is retried then
+                    print(f"Analysis job {job['id']} errored: {e}", file=sys.stderr)
+                finally:
+                    with self._lock:
+                        self.in_flight.pop(job["id"], None)
+        finally:
+            queue.close()
+
+    def _heartbeat(self):
+        queue = JobQueue(self.queue_path)
+        try:
+            while not self.stopping.wait(self.lease_seconds / 3):
+                with self._lock:
+                    leases = list(self.in_flight.items())
+                for job_id, owner in leases:
+                    queue.renew(job_id, owner, self.lease_seconds)
+        finally:
+            queue.close()
+
+    def run(self, drain=False):
+        """
+        Work until stop() (or, with drain, until no job is ready). Jobs in
+        flight at stop() finish first.
+        """
+        self._prewarm()
+        threads = [threading.Thread(target=self._loop, args=(i, drain), daemon=True) for i in range(self.concurrency)]
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+        self.stopping.set()
+        return self.stats
+
+    def stop(self, *_):
+        self.stopping.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durable personality analysis job queue")
+    parser.add_argument("--db", default=JOBS_PATH, help="Job queue database")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = sub.add_parser("enqueue", help="Queue the {sessionId, userId, responses} payload on stdin")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+
+    worker_parser = sub.add_parser("worker", help="Run queued analyses")
+    worker_parser.add_argument("--concurrency", type=int, help="Analyses run in parallel (default QFLOW_ANALYSIS_CONCURRENCY or 2)")
+    worker_parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS)
+    worker_parser.add_argument("--poll-seconds", type=float, default=DEFAULT_POLL_SECONDS)
+    worker_parser.add_argument("--retry-backoff", type=float, default=RETRY_BACKOFF_SECONDS,
+                               help="Seconds before the first retry; doubles per attempt")
+    worker_parser.add_argument("--drain", action="store_true", help="Exit once no job is ready")
+    worker_parser.add_argument("--metrics-port", type=int,
+                               help="Serve Prometheus metrics on this port (default QFLOW_ANALYSIS_METRICS_PORT)")
+
+    status_parser = sub.add_parser("status", help="Status (and result, once done) of one job")
+    status_target = status_parser.add_mutually_exclusive_group(required=True)
+    status_target.add_argument("--session")
+    status_target.add_argument("--job", type=int)
+    status_parser.add_argument("--no-result", action="store_true", help="Omit the stored result")
+
+    sub.add_parser("stats", help="Job counts by status")
+
+    retry_parser = sub.add_parser("retry", help="Requeue dead-lettered jobs")
+    retry_target = retry_parser.add_mutually_exclusive_group(required=True)
+    retry_target.add_argument("--job", type=int)
+    retry_target.add_argument("--all-dead", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        concurrency = args.concurrency
+        if concurrency is None:
+            try:
+                concurrency = int(os.getenv("QFLOW_ANALYSIS_CONCURRENCY", 2))
+            except ValueError:
+                print(f"Ignoring non-integer QFLOW_ANALYSIS_CONCURRENCY={os.getenv('QFLOW_ANALYSIS_CONCURRENCY')!r}",
+                      file=sys.stderr)
+                concurrency = 2
+        worker = AnalysisWorker(args.db, concurrency, args.lease_seconds, args.poll_seconds,
+                                args.retry_backoff)
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        from Qflow import metrics
+        if args.metrics_port:
+            try:
+                metrics.start_http_server(args.metrics_port)
+            except OSError as e:
+                print(f"Could not serve metrics on port {args.metrics_port}: {e}", file=sys.stderr)
+        else:
+            metrics.start_http_server_from_env(variable="QFLOW_ANALYSIS_METRICS_PORT")
+        print(json.dumps(worker.run(drain=args.drain)), file=sys.stderr)
+        return 0
+
+    queue = JobQueue(args.db)
+    try:
+        if args.command == "enqueue":
+            try:
+                payload = json.loads(sys.stdin.read())
+                if not isinstance(payload.get("responses"), list):
+                    raise ValueError("no responses")
+            except (ValueError, AttributeError) as e:
+                print(json.dumps({"error": f"Invalid payload: {e}"}))
+                return 1
+            job = queue.enqueue(payload, args.max_attempts)
+            print(json.dumps({key: job[key] for key in ("id", "session_id", "status", "attempts")}))
+        elif args.command == "status":
+            job = queue.get(job_id=args.job, session_id=args.session, with_result=not args.no_result)
+            if job is None:
+                print(json.dumps({"status": "unknown"}))
+                return 0
+            job.pop("payload")
+            print(json.dumps(job))
+        elif args.command == "stats":
+            print(json.dumps(queue.stats()))
+        else:
+            print(json.dumps({"requeued": queue.retry(args.job, args.all_dead)}))
+    finally:
+        queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
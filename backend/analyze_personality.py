@@ -12,6 +12,7 @@ import random
 from dotenv import load_dotenv
 import threading
 import time
+import contextlib
 
 # Load .env file from root directory
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -118,6 +119,9 @@ DIMENSION_DEFINITIONS = {
     "Worry": "Propensity to feel mental distress or agitation due to concern about impending or anticipated events"
 }
 
+# Words kept per answer in the analysis prompt once the session's budget runs low
+ANALYSIS_ANSWER_WORDS = {"economy": 150, "minimal": 60}
+
 def clean_text_for_api(text: str) -> str:
     """Clean text to remove problematic Unicode characters and emojis."""
     import re
@@ -152,9 +156,12 @@ def generate_sample_scores() -> Dict[str, int]:
         scores[dimension] = final_score
     return scores
 
-def analyze_personality_with_ai(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+def analyze_personality_with_ai(responses: List[Dict[str, Any]], engine=None, budget=None) -> Dict[str, Any]:
     """
     Try to analyze personality scores using Claude API with timeout.
+    A prewarmed QflowEngine can be passed to reuse its provider client.
+    budget is the conversation's spend (its last progress budget); a session
+    near or over its limit is analyzed from trimmed answers on the budget model.
     """
     try:
         
@@ -174,7 +181,9 @@ def analyze_personality_with_ai(responses: List[Dict[str, Any]]) -> Dict[str, An
         print(f"Using API key starting with: {api_key[:10]}...", file=sys.stderr)
         
         # Initialize QflowSystem to use Claude API
-        qflow = QflowSystem()
+        qflow = QflowSystem(engine=engine)
+        qflow.budget.restore(budget)
+        answer_words = ANALYSIS_ANSWER_WORDS.get(qflow.budget.mode())
         print("QflowSystem initialized successfully", file=sys.stderr)
         
         # Prepare the analysis prompt with cleaned text
@@ -183,6 +192,8 @@ def analyze_personality_with_ai(responses: List[Dict[str, Any]]) -> Dict[str, An
             # Clean text to remove problematic Unicode characters
             question_text = clean_text_for_api(response['questionText'])
             user_response = clean_text_for_api(response['userResponse'])
+            if answer_words and len(user_response.split()) > answer_words:
+                user_response = " ".join(user_response.split()[:answer_words]) + " ..."
             
             responses_text += f"Question {i}: {question_text}\n"
             responses_text += f"User Response: {user_response}\n"
@@ -232,7 +243,7 @@ Ensure all 70 dimensions are included in the scores object.
             {"role": "system", "content": "You are a professional personality analyst. Provide detailed, accurate personality assessments based on user responses."},
             {"role": "user", "content": analysis_prompt}
         ]
-        analysis_result = qflow._make_api_call(messages, temperature=0.3)
+        analysis_result = qflow._make_api_call(messages, temperature=0.3, call_type="analysis")
         
         print("Received response from Claude API", file=sys.stderr)
         print(f"Response length: {len(analysis_result)} characters", file=sys.stderr)
@@ -271,6 +282,7 @@ Ensure all 70 dimensions are included in the scores object.
         
         # Mark as AI analysis
         result['ai_analysis'] = True
+        result['budget'] = qflow.budget.to_dict()
         print("AI analysis completed successfully", file=sys.stderr)
         return result
         
@@ -280,12 +292,14 @@ Ensure all 70 dimensions are included in the scores object.
         print(f"Traceback: {traceback.format_exc()}", file=sys.stderr)
         return None
 
-def analyze_personality(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+def analyze_personality(responses: List[Dict[str, Any]], engine=None, budget=None) -> Dict[str, Any]:
     """
     Analyze personality scores. Try AI first, fall back to sample data.
     
     Args:
         responses: List of user responses with questions and answers
+        engine: Optional QflowEngine whose client is reused
+        budget: Optional session budget from the conversation's progress
         
     Returns:
         Dict containing personality scores and analysis
@@ -293,13 +307,18 @@ def analyze_personality(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
     
     # Try AI analysis first
     print("Attempting AI-powered personality analysis...", file=sys.stderr)
-    ai_result = analyze_personality_with_ai(responses)
+    ai_result = analyze_personality_with_ai(responses, engine, budget)
     if ai_result and 'scores' in ai_result:
         print("AI analysis successful!", file=sys.stderr)
         return ai_result
     
     # Fallback to sample scores if AI fails
     print("AI analysis failed, using sample personality scores", file=sys.stderr)
+    try:
+        from Qflow import metrics
+        metrics.record_fallback("analyze_personality", "sample_scores")
+    except ImportError:
+        pass
     
     # Generate sample scores
     sample_scores = generate_sample_scores()
@@ -339,6 +358,52 @@ Note: This is a demonstration analysis. AI analysis was attempted but is current
         "note": "This is demonstration data. AI analysis was attempted but failed."
     }
 
+def record_analysis(session_id: str, result: Dict[str, Any], user_id=None):
+    """Append one session's scores to the JSONL log named by QFLOW_ANALYSIS_LOG."""
+    try:
+        from datetime import datetime
+        from Qflow.log_sink import JsonlLogSink
+        sink = JsonlLogSink(os.getenv('QFLOW_ANALYSIS_LOG'), fsync_every=1)
+        try:
+            sink.append({
+                "session_id": session_id,
+                "user_id": user_id,
+                "timestamp": datetime.now().isoformat(timespec="milliseconds"),
+                "ai_analysis": bool(result.get('ai_analysis')),
+                "scores": {dim: result.get('scores', {}).get(dim) for dim in PERSONALITY_DIMENSIONS}
+            })
+        finally:
+            sink.close()
+    except (ImportError, OSError) as e:
+        print(f"Could not record analysis for session {session_id}: {e}", file=sys.stderr)
+
+def run_analysis(data: Dict[str, Any], engine=None, record: bool = True) -> Dict[str, Any]:
+    """
+    Analyze one {sessionId, responses} payload and return the full result with
+    dimension metadata. Shared by the CLI, the prewarmed workers in qflow_pool.py
+    and the analysis_jobs.py worker (which records only a job's final result).
+    """
+    print(f"Processing {len(data['responses'])} responses", file=sys.stderr)
+    
+    # Analyze personality
+    try:
+        from Qflow.tracing import trace
+        turn_trace = trace("qflow.analyze", **{"qflow.responses": len(data['responses'])})
+    except ImportError:
+        turn_trace = contextlib.nullcontext()
+    with turn_trace:
+        result = analyze_personality(data['responses'], engine, data.get('budget'))
+    
+    # Add metadata
+    result['dimensions'] = PERSONALITY_DIMENSIONS
+    result['dimension_definitions'] = DIMENSION_DEFINITIONS
+    result['total_dimensions'] = len(PERSONALITY_DIMENSIONS)
+    
+    # Append the scores to the research analysis log when configured
+    if record and data.get('sessionId') and os.getenv('QFLOW_ANALYSIS_LOG'):
+        record_analysis(data['sessionId'], result, data.get('userId'))
+    return result
+
 def main():
     """Main function to process stdin and return analysis."""
     try:
@@ -351,16 +416,15 @@ def main():
             print(json.dumps({"error": "No responses provided"}))
             sys.exit(1)
         
-        print(f"Processing {len(data['responses'])} responses", file=sys.stderr)
-        
-        # Analyze personality
-        result = analyze_personality(data['responses'])
-        
-        # Add metadata
-        result['dimensions'] = PERSONALITY_DIMENSIONS
-        result['dimension_definitions'] = DIMENSION_DEFINITIONS
-        result['total_dimensions'] = len(PERSONALITY_DIMENSIONS)
-        
+        result = run_analysis(data)
+
+        # Attach the metrics summary block for one-shot runs when enabled
+        try:
+            from Qflow import metrics
+            metrics.attach_summary(result)
+        except ImportError:
+            pass
+
         # Output result
         print(json.dumps(result, indent=2))
         
@@ -0,0 +1,4 @@
+"""
+Performance benchmarks and load tests for the Qflow conversation system.
+Run from the backend directory, e.g. ``python -m benchmarks.bench_qflow``.
+"""
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Turn-latency benchmark suite for Qflow.
+
+Runs QflowSystem.load_questions_from_excel, select_next_question,
+generate_ai_reply, analyze_personality and full qflow_conversation turns
+against a bundled stub LLM (see stub_llm.py) with configurable latency and
+jitter, plus a cold-start measurement of importing Qflow and constructing
+QflowSystem in a fresh interpreter. Reports p50/p95/p99 per scenario.
+
+Usage (from backend/):
+    python -m benchmarks.bench_qflow --iterations 50 --latency-ms 200 --jitter-ms 50
+    python -m benchmarks.bench_qflow --baseline benchmarks/baseline.json --tolerance 0.2
+    python -m benchmarks.bench_qflow --seed 0 --save-baseline benchmarks/baseline.json
+
+benchmarks/baseline.json is the committed reference run (defaults, --seed 0,
+stub latency 0); refresh it with --save-baseline when a change is meant to
+move the numbers.
+
+Deterministic runs: record provider calls once, then replay them (no network,
+fixed seed) with the recorded latency or none:
+    QFLOW_CASSETTE=bench.jsonl QFLOW_CASSETTE_MODE=record python -m benchmarks.bench_qflow --latency-ms 200
+    QFLOW_CASSETTE=bench.jsonl QFLOW_CASSETTE_LATENCY=zero python -m benchmarks.bench_qflow
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import contextlib
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from benchmarks.stub_llm import StubLLMServer, provider_env
+from benchmarks.stats import summarize
+
+QUESTIONS_FILE = os.path.join(backend_dir, "Qflow", "life_narrative_32_questions.xlsx")
+
+CANNED_ANSWERS = [
+    "I grew up in a small town and spent most summers helping at my grandparents' farm.",
+    "Honestly I would probably wait and see how things develop before saying anything.",
+    "My closest friends would describe me as loyal, a bit stubborn, and usually the planner of the group.",
+    "When plans fall apart I get frustrated for a moment, then I start looking for a workaround.",
+    "I think the biggest turning point was moving abroad for university and having to start over.",
+]
+
+SCENARIOS = ["load_questions_from_excel", "select_next_question", "generate_ai_reply",
+             "analyze_personality", "process_response"]
+
+
+def _timed(fn, iterations):
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_startup(env, iterations):
+    """
+    Cold start: a fresh interpreter importing Qflow and building QflowSystem.
+    """
+    code = "from Qflow import QflowSystem; QflowSystem()"
+    child_env = dict(os.environ, **env)
+
+    def run(_):
+        subprocess.run([sys.executable, "-c", code], cwd=backend_dir, env=child_env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    return _timed(run, iterations)
+
+
+def bench_load_questions(iterations):
+    from Qflow import QflowSystem
+    qflow = QflowSystem()
+    return _timed(lambda _: qflow.load_questions_from_excel(QUESTIONS_FILE), iterations)
+
+
+def bench_select_next_question(iterations):
+    from Qflow import QflowSystem
+    qflow = QflowSystem()
+    qflow.load_questions_from_excel(QUESTIONS_FILE)
+
+    def run(i):
+        if not qflow.unused_questions:
+            qflow.reset_conversation()
+        result = qflow.select_next_question(CANNED_ANSWERS[i % len(CANNED_ANSWERS)])
+        qflow.current_question_index = result["question_index"]
+        qflow.mark_current_question_as_used()
+
+    return _timed(run, iterations)
+
+
+def bench_generate_ai_reply(iterations):
+    from Qflow import QflowSystem
+    qflow = QflowSystem()
+    qflow.load_questions_from_excel(QUESTIONS_FILE)
+
+    def run(i):
+        next_question = qflow.question_bank[i % len(qflow.question_bank)]["question"]
+        qflow.generate_ai_reply(CANNED_ANSWERS[i % len(CANNED_ANSWERS)], next_question)
+
+    return _timed(run, iterations)
+
+
+def bench_analyze_personality(iterations):
+    from analyze_personality import analyze_personality
+    from Qflow import QflowSystem
+    qflow = QflowSystem()
+    qflow.load_questions_from_excel(QUESTIONS_FILE)
+    responses = [{
+        "questionText": q["question"],
+        "userResponse": CANNED_ANSWERS[i % len(CANNED_ANSWERS)],
+        "clusterId": q["cluster_id"]
+    } for i, q in enumerate(qflow.question_bank)]
+
+    return _timed(lambda _: analyze_personality(responses), iterations)
+
+
+def bench_process_response(iterations):
+    """
+    Full CLI-equivalent turns: engine load (question bank, index), session
+    setup from the persisted state plus the turn itself, carrying state between
+    turns the way routes/lifeNarrative.js does. The module-level engine cache
+    is cleared before each turn so every sample pays the per-process load.
+    """
+    from Qflow import qflow_conversation
+    from Qflow.qflow_conversation import process_response
+    state = {"used": [], "current": None}
+
+    def run(i):
+        qflow_conversation._engine = None
+        answer = "yes" if state["current"] is None else CANNED_ANSWERS[i % len(CANNED_ANSWERS)]
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            process_response(answer, json.dumps(state["used"]), state["current"])
+        result = json.loads(out.getvalue().strip().splitlines()[-1])
+        if result.get("finished") or "error" in result:
+            state["used"], state["current"] = [], None
+        else:
+            state["current"] = result.get("question_index")
+            state["used"] = result.get("progress", {}).get("used_question_indices", state["used"])
+
+    return _timed(run, iterations)
+
+
+def run_suite(args):
+    report = {
+        "config": {
+            "iterations": args.iterations,
+            "startup_iterations": args.startup_iterations,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "provider": args.provider
+        },
+        "results": {}
+    }
+
+    with StubLLMServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed) as stub:
+        env = provider_env(stub.url, args.provider)
+        os.environ.update(env)
+
+        benches = {
+            "load_questions_from_excel": bench_load_questions,
+            "select_next_question": bench_select_next_question,
+            "generate_ai_reply": bench_generate_ai_reply,
+            "analyze_personality": bench_analyze_personality,
+            "process_response": bench_process_response,
+        }
+        selected = args.only or SCENARIOS
+
+        if args.startup_iterations and not args.only:
+            print("Measuring cold start...", file=sys.stderr)
+            report["results"]["startup"] = summarize(bench_startup(env, args.startup_iterations))
+
+        # Benchmarked code logs heavily to stderr; keep the report readable
+        for name in selected:
+            print(f"Running {name}...", file=sys.stderr)
+            with contextlib.redirect_stderr(io.StringIO()):
+                samples = benches[name](args.iterations)
+            report["results"][name] = summarize(samples)
+
+        report["stub_requests"] = stub.requests
+
+    return report
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """
+    Flag scenarios whose p50 or p95 exceed the baseline by more than tolerance.
+    """
+    regressions = []
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if previous.get(key) and current.get(key) is not None:
+                ratio = current[key] / previous[key]
+                current.setdefault("vs_baseline", {})[key] = ratio
+                if ratio > 1.0 + tolerance:
+                    regressions.append(f"{name} {key}: {previous[key]:.1f} -> {current[key]:.1f} ms ({ratio:.2f}x)")
+    return regressions
+
+
+def print_table(report):
+    print(f"{'scenario':<28}{'n':>6}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}", file=sys.stderr)
+    for name, r in report["results"].items():
+        if r["n"]:
+            print(f"{name:<28}{r['n']:>6}{r['p50_ms']:>11.2f}{r['p95_ms']:>11.2f}{r['p99_ms']:>11.2f}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qflow turn-latency benchmarks against a stub LLM")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--startup-iterations", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Stub LLM base latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Stub LLM uniform jitter")
+    parser.add_argument("--provider", choices=["openai", "anthropic"], default="openai")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the stub's jitter")
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, help="Run only these scenarios")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Baseline report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", help="Write this run as the new baseline")
+    args = parser.parse_args()
+
+    report = run_suite(args)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    print_table(report)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    return not regressions
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Question-selection report: cluster-pruned candidates vs. every unused question.
+
+Drives select_next_question through complete synthetic sessions against the
+stub LLM, once with pruning off (QFLOW_CANDIDATE_CLUSTERS=0, the default)
+and once with the given cluster count. For each mode it reports
+selection latency, candidates and prompt size per call, and the spread of
+cluster coverage (max - min) halfway through a session.
+
+The bundled banks have one question per cluster; --clusters N regroups the
+bank into N contiguous clusters to show coverage balancing (the stub always
+picks the first candidate, so unpruned runs drain clusters in bank order).
+
+Usage (from backend/):
+    python -m benchmarks.bench_selection --sessions 20 --candidate-clusters 8
+    python -m benchmarks.bench_selection --clusters 8 --candidate-clusters 3 --latency-ms 300
+"""
+
+import io
+import os
+import sys
+import json
+import random
+import argparse
+import contextlib
+import time
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from benchmarks.stub_llm import StubLLMServer, provider_env, estimate_tokens, _INDEX_LINE
+from benchmarks.stats import summarize
+from benchmarks.bench_qflow import QUESTIONS_FILE, CANNED_ANSWERS
+
+
+def run_mode(candidate_clusters, sessions, clusters, seed):
+    from Qflow import QflowSystem
+
+    random.seed(seed)
+    qflow = QflowSystem(candidate_clusters=candidate_clusters)
+    qflow.load_questions_from_excel(QUESTIONS_FILE)
+    engine = qflow.engine
+    if clusters:
+        # The bank is frozen once loaded; regroup by installing a rebuilt one
+        n = len(engine.question_bank)
+        engine.set_question_bank([dict(q, cluster_id=idx * clusters // n) for idx, q in enumerate(engine.question_bank)])
+
+    prompts = []
+    make_api_call = engine._make_api_call
+
+    def recording_call(messages, temperature=0.7, call_type="other", **kwargs):
+        if call_type == "select_question":
+            user = " ".join(m["content"] for m in messages if m["role"] != "system")
+            text = " ".join(m["content"] for m in messages)
+            candidates = len(_INDEX_LINE.findall(user.split("Available questions to choose from:", 1)[-1]))
+            prompts.append((len(text), estimate_tokens(text), candidates))
+        return make_api_call(messages, temperature=temperature, call_type=call_type, **kwargs)
+
+    engine._make_api_call = recording_call
+
+    latencies, spreads = [], []
+    half = len(qflow.question_bank) // 2
+    for s in range(sessions):
+        qflow.reset_conversation()
+        turn = 0
+        while qflow.unused_questions:
+            answer = CANNED_ANSWERS[(s + turn) % len(CANNED_ANSWERS)]
+            started = time.perf_counter()
+            result = qflow.select_next_question(answer)
+            latencies.append(time.perf_counter() - started)
+            qflow.current_question_index = result["question_index"]
+            qflow.mark_current_question_as_used()
+            turn += 1
+            if turn == half:
+                coverage = qflow.cluster_index.coverage(qflow.used_questions).values()
+                spreads.append(max(coverage) - min(coverage))
+
+    if latencies and not prompts:
+        # Every selection fell back without reaching the provider; the numbers would be meaningless
+        raise RuntimeError("No select_question prompts were recorded; selection never reached the provider")
+    n = len(prompts)
+    return {
+        "candidate_clusters": candidate_clusters,
+        "selections": len(latencies),
+        "latency": summarize(latencies),
+        "mean_candidates": sum(p[2] for p in prompts) / n,
+        "mean_prompt_chars": sum(p[0] for p in prompts) / n,
+        "mean_prompt_tokens": sum(p[1] for p in prompts) / n,
+        "total_prompt_tokens": sum(p[1] for p in prompts),
+        "mid_session_coverage_spread": sum(spreads) / len(spreads) if spreads else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cluster-pruned question selection against the full candidate list")
+    parser.add_argument("--sessions", type=int, default=10, help="Complete sessions per mode")
+    parser.add_argument("--candidate-clusters", type=int, default=8, help="Clusters offered per selection when pruning")
+    parser.add_argument("--clusters", type=int, default=0, help="Regroup the bank into this many clusters (0 = as loaded)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--provider", choices=["openai", "anthropic"], default="openai")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {"config": vars(args)}
+    with StubLLMServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed) as stub:
+        os.environ.update(provider_env(stub.url, args.provider))
+        for name, k in (("full", 0), ("pruned", args.candidate_clusters)):
+            print(f"Running {name} selection...", file=sys.stderr)
+            with contextlib.redirect_stderr(io.StringIO()):
+                report[name] = run_mode(k, args.sessions, args.clusters, args.seed)
+
+    full, pruned = report["full"], report["pruned"]
+    report["prompt_tokens_ratio"] = pruned["mean_prompt_tokens"] / full["mean_prompt_tokens"] if full["mean_prompt_tokens"] else None
+    report["p50_latency_ratio"] = (pruned["latency"]["p50_ms"] / full["latency"]["p50_ms"]
+                                   if full["latency"]["p50_ms"] else None)
+
+    for name in ("full", "pruned"):
+        r = report[name]
+        print(f"{name:<8} candidates {r['mean_candidates']:6.1f}  prompt {r['mean_prompt_tokens']:7.0f} tok  "
+              f"p50 {r['latency']['p50_ms']:8.2f} ms  p95 {r['latency']['p95_ms']:8.2f} ms  "
+              f"coverage spread {r['mid_session_coverage_spread'] or 0:.2f}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
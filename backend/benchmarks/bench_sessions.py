@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Memory per live session: engine-shared QflowSystem sessions vs. one
+self-contained QflowSystem (own client and question bank) per session.
+
+Each mode builds N sessions, plays a few turns on each so they carry real
+state, and measures the traced allocation growth with tracemalloc. The
+shared mode loads the bank once into a QflowEngine and hands out sessions
+with engine.new_session(); the standalone mode is what every process did
+before the engine existed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_sessions --sessions 1000 --standalone-sessions 20
+"""
+
+import io
+import os
+import sys
+import gc
+import json
+import argparse
+import contextlib
+import tracemalloc
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from benchmarks.stub_llm import StubLLMServer, provider_env
+from benchmarks.bench_qflow import QUESTIONS_FILE
+
+PLAYED_TURNS = 5
+
+
+def _play(qflow, turns):
+    """
+    Mark a few questions answered, as a session mid-conversation would have.
+    """
+    for idx in range(turns):
+        qflow.current_question_index = idx
+        qflow.mark_current_question_as_used()
+        qflow.log_interaction(qflow.question_bank[idx]["question"], "An answer.", idx)
+
+
+def _measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [build(i) for i in range(count)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(sessions) == count
+    return after - before
+
+
+def run_shared(count, turns):
+    from Qflow import QflowEngine
+
+    def build(i):
+        qflow = engine.new_session()
+        _play(qflow, turns)
+        return qflow
+
+    engine = QflowEngine(log_sink=None)
+    engine.load_questions_from_excel(QUESTIONS_FILE)
+    total = _measure(build, count)
+    return {"sessions": count, "total_bytes": total, "bytes_per_session": total / count}
+
+
+def run_standalone(count, turns):
+    from Qflow import QflowSystem
+
+    def build(i):
+        qflow = QflowSystem(log_sink=None)
+        qflow.load_questions_from_excel(QUESTIONS_FILE)
+        _play(qflow, turns)
+        return qflow
+
+    total = _measure(build, count)
+    return {"sessions": count, "total_bytes": total, "bytes_per_session": total / count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per live Qflow session")
+    parser.add_argument("--sessions", type=int, default=1000, help="Sessions sharing one engine")
+    parser.add_argument("--standalone-sessions", type=int, default=20,
+                        help="Self-contained sessions (each loads its own bank and client)")
+    parser.add_argument("--turns", type=int, default=PLAYED_TURNS, help="Answered questions per session")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {"config": vars(args)}
+    with StubLLMServer() as stub:
+        os.environ.update(provider_env(stub.url, "openai"))
+        os.environ.pop("QFLOW_CONVERSATION_LOG", None)
+        with contextlib.redirect_stderr(io.StringIO()):
+            report["shared"] = run_shared(args.sessions, args.turns)
+            report["standalone"] = run_standalone(args.standalone_sessions, args.turns)
+
+    shared, standalone = report["shared"], report["standalone"]
+    report["memory_ratio"] = standalone["bytes_per_session"] / shared["bytes_per_session"]
+    for name in ("shared", "standalone"):
+        r = report[name]
+        print(f"{name:<11} {r['sessions']:6d} sessions  {r['bytes_per_session'] / 1024:9.1f} KiB/session", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+generate_ai_reply with and without the local transition library.
+
+Plays the same responses through generate_ai_reply twice against the stub
+LLM: once provider-only, once with a TransitionLibrary on the engine (the
+built-in templates, or a built library with --library). Reports per-mode
+latency percentiles, the share of turns served locally and the latency the
+metrics summary estimates was saved.
+
+Usage (from backend/):
+    python -m benchmarks.bench_transitions --turns 200 --latency-ms 300
+    python -m benchmarks.bench_transitions --library transitions.json
+"""
+
+import io
+import os
+import sys
+import json
+import argparse
+import contextlib
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from benchmarks.stub_llm import StubLLMServer, provider_env
+from benchmarks.stats import summarize
+from benchmarks.bench_qflow import QUESTIONS_FILE, CANNED_ANSWERS, _timed
+
+# Responses the library should hand back to the provider
+HARD_ANSWERS = [
+    "Why do you want to know that? Is it going to be used for anything?",
+    "I loved my school but I hated how lonely the last two years were, and I still miss my friends from before.",
+    ("My father died when I was twelve and everything after that was hard. My mother struggled, we lost the house, "
+     "I was angry and scared most of the time and I felt alone at school. I was bullied, my grades dropped, and it "
+     "took me years to stop feeling ashamed about how bad things got at home. Even now I find it difficult to talk "
+     "about, and some days the grief still comes back without warning."),
+]
+
+
+def run(mode, turns, library_path=None):
+    from Qflow import QflowEngine, TransitionLibrary
+    from Qflow import metrics
+
+    library = None
+    if mode == "library":
+        library = TransitionLibrary.load(library_path) if library_path else TransitionLibrary()
+    engine = QflowEngine(log_sink=None, transitions=library)
+    engine.load_questions_from_excel(QUESTIONS_FILE)
+    qflow = engine.new_session()
+    answers = CANNED_ANSWERS + HARD_ANSWERS
+
+    def turn(i):
+        qflow.current_question_index = i % len(engine.question_bank)
+        qflow.generate_ai_reply(answers[i % len(answers)], engine.question_bank[qflow.current_question_index]["question"])
+
+    metrics.REGISTRY.reset()
+    samples = _timed(turn, turns)
+    return {"latency": summarize(samples), "transitions": metrics.summary()["transitions"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local vs provider transitions")
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Stub LLM latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--library", help="Transition library JSON (default: built-in templates)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {"config": vars(args)}
+    with StubLLMServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=0) as stub:
+        os.environ.update(provider_env(stub.url, "openai"))
+        for variable in ("QFLOW_CONVERSATION_LOG", "QFLOW_TRANSITIONS", "QFLOW_CASSETTE"):
+            os.environ.pop(variable, None)
+        with contextlib.redirect_stderr(io.StringIO()):
+            report["provider"] = run("provider", args.turns)
+            report["library"] = run("library", args.turns, args.library)
+
+    # Saved time is judged against the provider-only run's mean turn latency
+    transitions = report["library"]["transitions"]
+    provider_mean = report["provider"]["latency"]["mean_ms"] / 1000.0
+    transitions["estimated_seconds_saved"] = round(
+        transitions["local"] * provider_mean - transitions["local_seconds"], 4)
+    for name in ("provider", "library"):
+        latency = report[name]["latency"]
+        print(f"{name:<9} p50 {latency['p50_ms']:8.2f} ms  p95 {latency['p95_ms']:8.2f} ms", file=sys.stderr)
+    print(f"local share {transitions['local_share']:.0%}, ~{transitions['estimated_seconds_saved']:.1f} s saved "
+          f"over {args.turns} turns", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
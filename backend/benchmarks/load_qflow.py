@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Concurrent-session load generator for qflow_conversation.py.
+
+Simulates N synthetic participants that each go through the same process
+launches routes/lifeNarrative.js makes: --start, --respond yes, one
+--respond per question (carrying --used_indices / --current_question_index)
+and finally analyze_personality.py on stdin. Answers are canned and every
+provider call goes to the bundled stub LLM.
+
+Load is ramped in steps (e.g. 10, 50, 200 concurrent participants). For each
+step the report gives session and turn throughput, latency percentiles per
+call kind, error and fallback rates and peak memory: the largest single
+child RSS and the peak summed RSS of all live children.
+
+Usage (from backend/):
+    python -m benchmarks.load_qflow --steps 10 50 200 --latency-ms 300 --jitter-ms 100
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from benchmarks.stub_llm import StubLLMServer, provider_env
+from benchmarks.stats import summarize
+from benchmarks.bench_qflow import CANNED_ANSWERS
+
+QFLOW_SCRIPT = os.path.join(backend_dir, "Qflow", "qflow_conversation.py")
+ANALYZE_SCRIPT = os.path.join(backend_dir, "analyze_personality.py")
+
+# Canned transition replies generate_ai_reply falls back to when the provider call fails
+TRANSITION_FALLBACKS = (
+    "Thank you for sharing that insight. Let me ask you about another situation.",
+    "I appreciate your perspective on that. Here's another question I'm curious about.",
+    "That's helpful to understand. Let me explore another dimension with you.",
+)
+
+
+class MemoryMonitor:
+    """
+    Samples the summed RSS of all live child processes from /proc.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.pids = set()
+        self.peak_mb = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def add(self, pid):
+        with self._lock:
+            self.pids.add(pid)
+
+    def discard(self, pid):
+        with self._lock:
+            self.pids.discard(pid)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                pids = list(self.pids)
+            total_kb = 0
+            for pid in pids:
+                try:
+                    with open(f"/proc/{pid}/status") as f:
+                        for line in f:
+                            if line.startswith("VmRSS:"):
+                                total_kb += int(line.split()[1])
+                                break
+                except OSError:
+                    continue
+            self.peak_mb = max(self.peak_mb, total_kb / 1024)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_child(args, env, monitor, stdin_data=None):
+    """
+    Run one Python child, returning (returncode, stdout, seconds, max_rss_mb).
+    Reaped with os.wait4 so the child's own peak RSS is available.
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable] + args,
+        cwd=backend_dir,
+        env=env,
+        stdin=subprocess.PIPE if stdin_data is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    monitor.add(process.pid)
+    try:
+        if stdin_data is not None:
+            process.stdin.write(stdin_data)
+            process.stdin.close()
+        output = process.stdout.read()
+        process.stdout.close()
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        monitor.discard(process.pid)
+    # ru_maxrss is in kilobytes on Linux
+    return process.returncode, output.decode("utf-8", "replace"), time.perf_counter() - started, usage.ru_maxrss / 1024
+
+
+class Participant:
+    """
+    One synthetic participant walking through a complete interview.
+    """
+
+    def __init__(self, participant_id, env, monitor, max_turns, think_time):
+        self.id = participant_id
+        self.env = env
+        self.monitor = monitor
+        self.max_turns = max_turns
+        self.think_time = think_time
+        self.rng = random.Random(participant_id)
+        self.calls = []  # (kind, seconds, ok, fallback, max_rss_mb)
+
+    def _call(self, kind, args, stdin_data=None):
+        code, output, seconds, rss = run_child(args, self.env, self.monitor, stdin_data)
+        result = None
+        if code == 0:
+            try:
+                lines = output.strip().splitlines()
+                result = lines[-1] if kind == "start" else json.loads(output if kind == "analyze" else lines[-1])
+            except (ValueError, IndexError):
+                result = None
+        ok = result is not None and not (isinstance(result, dict) and "error" in result)
+        fallback = False
+        if ok and isinstance(result, dict) and result.get("metrics"):
+            # QFLOW_METRICS=summary: fallbacks counted at the source, including
+            # the random question-selection fallback that leaves no trace in the message
+            fallback = bool(result["metrics"].get("fallbacks"))
+        elif ok and kind == "respond":
+            fallback = result.get("message", "").startswith(TRANSITION_FALLBACKS)
+        elif ok and kind == "analyze":
+            fallback = not result.get("ai_analysis", False)
+        self.calls.append((kind, seconds, ok, fallback, rss))
+        return result if ok else None
+
+    def _pause(self):
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, self.think_time))
+
+    def run(self):
+        if self._call("start", [QFLOW_SCRIPT, "--start"]) is None:
+            return False
+
+        result = self._call("respond", [QFLOW_SCRIPT, "--respond", "yes"])
+        if result is None:
+            return False
+
+        used = result.get("progress", {}).get("used_question_indices", [])
+        current = result.get("question_index")
+        transcript = []
+
+        for turn in range(self.max_turns):
+            self._pause()
+            answer = CANNED_ANSWERS[(self.id + turn) % len(CANNED_ANSWERS)]
+            question_text = result.get("message", "").rsplit("\n", 1)[-1]
+            transcript.append({"questionText": question_text, "userResponse": answer,
+                               "clusterId": result.get("cluster_id")})
+            args = [QFLOW_SCRIPT, "--respond", answer]
+            if used:
+                args += ["--used_indices", json.dumps(used)]
+            if current is not None:
+                args += ["--current_question_index", str(current)]
+            result = self._call("respond", args)
+            if result is None:
+                return False
+            if result.get("finished"):
+                break
+            used = result.get("progress", {}).get("used_question_indices", used)
+            current = result.get("question_index")
+
+        payload = json.dumps({"responses": transcript}).encode("utf-8")
+        return self._call("analyze", [ANALYZE_SCRIPT], payload) is not None
+
+
+def run_step(concurrency, env, max_turns, think_time, first_id):
+    participants = [Participant(first_id + i, env, None, max_turns, think_time) for i in range(concurrency)]
+    with MemoryMonitor() as monitor:
+        for p in participants:
+            p.monitor = monitor
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            completed = list(executor.map(lambda p: p.run(), participants))
+        wall = time.perf_counter() - started
+
+    calls = [c for p in participants for c in p.calls]
+    by_kind = {}
+    for kind, seconds, ok, fallback, _ in calls:
+        by_kind.setdefault(kind, []).append(seconds)
+    ok_calls = [c for c in calls if c[2]]
+
+    return {
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "sessions_completed": sum(completed),
+        "sessions_failed": concurrency - sum(completed),
+        "sessions_per_minute": sum(completed) / wall * 60 if wall else 0.0,
+        "calls": len(calls),
+        "calls_per_second": len(calls) / wall if wall else 0.0,
+        "error_rate": (len(calls) - len(ok_calls)) / len(calls) if calls else 0.0,
+        "fallback_rate": sum(1 for c in ok_calls if c[3]) / len(ok_calls) if ok_calls else 0.0,
+        "latency": {kind: summarize(samples) for kind, samples in by_kind.items()},
+        "peak_total_rss_mb": monitor.peak_mb,
+        "max_child_rss_mb": max((c[4] for c in calls), default=0.0)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for qflow_conversation.py")
+    parser.add_argument("--steps", type=int, nargs="+", default=[5, 20, 50], help="Concurrent participants per step")
+    parser.add_argument("--turns", type=int, default=32, help="Maximum answers per participant")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between answers (s)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Stub LLM injected failure rate")
+    parser.add_argument("--provider", choices=["openai", "anthropic"], default="openai")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {"config": vars(args), "steps": []}
+    with StubLLMServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate) as stub:
+        env = dict(os.environ, QFLOW_METRICS="summary", **provider_env(stub.url, args.provider))
+        next_id = 0
+        for concurrency in args.steps:
+            print(f"Step: {concurrency} concurrent participant(s)...", file=sys.stderr)
+            step = run_step(concurrency, env, args.turns, args.think_time, next_id)
+            next_id += concurrency
+            report["steps"].append(step)
+            respond = step["latency"].get("respond", {})
+            print(f"  {step['calls_per_second']:.1f} calls/s, respond p95 {respond.get('p95_ms') or 0:.0f} ms, "
+                  f"errors {step['error_rate']:.1%}, fallbacks {step['fallback_rate']:.1%}, "
+                  f"peak RSS {step['peak_total_rss_mb']:.0f} MB", file=sys.stderr)
+        report["stub_requests"] = stub.requests
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Small helpers shared by the benchmark scripts.
+"""
+
+import math
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of a list of numbers (pct in 0..100).
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples_seconds):
+    """
+    Latency summary in milliseconds for a list of durations in seconds.
+    """
+    if not samples_seconds:
+        return {"n": 0, "mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ms = [s * 1000.0 for s in samples_seconds]
+    return {
+        "n": len(ms),
+        "mean_ms": sum(ms) / len(ms),
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": max(ms)
+    }
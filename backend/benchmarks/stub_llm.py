@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI/Anthropic-compatible stub LLM server for benchmarks.
+
+Serves POST .../chat/completions (OpenAI) and POST .../messages (Anthropic)
+with a configurable latency and jitter, returning responses shaped like what
+the Qflow prompts expect: a selection JSON for select_next_question, a score
+JSON for analyze_personality and a short transition ending with the next
+question otherwise. Token usage is estimated at 4 characters per token.
+
+Usage:
+    python -m benchmarks.stub_llm --port 8765 --latency-ms 300 --jitter-ms 100
+"""
+
+import re
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_INDEX_LINE = re.compile(r"^\s*(\d+):", re.MULTILINE)
+_DIMENSIONS = re.compile(r"Personality Dimensions to Score:\s*(.*?)\s*Please respond in this exact JSON format", re.S)
+_NEXT_QUESTION = re.compile(r"The next question is:\s*(.*?)\s*$", re.S)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def stub_completion(messages):
+    """
+    Produce a plausible completion for one of the Qflow prompts.
+    """
+    system = " ".join(m["content"] for m in messages if m["role"] == "system")
+    user = " ".join(m["content"] for m in messages if m["role"] != "system")
+
+    if "selected_question_index" in system:
+        indices = _INDEX_LINE.findall(user.split("Available questions to choose from:", 1)[-1])
+        choice = indices[0] if indices else "0"
+        return json.dumps({"selected_question_index": choice, "reasoning": "Stub selection of the first candidate."})
+
+    dimensions = _DIMENSIONS.search(user)
+    if dimensions:
+        names = [d.strip() for d in dimensions.group(1).split(",") if d.strip()]
+        return json.dumps({
+            "scores": {name: 50 + (i * 7) % 40 for i, name in enumerate(names)},
+            "summary": "Stub personality summary.",
+            "strengths": ["Stub strength"],
+            "development_areas": ["Stub area"]
+        })
+
+    next_question = _NEXT_QUESTION.search(system.strip())
+    if next_question:
+        return f"Thank you for sharing that. {next_question.group(1).strip()}"
+    return "Thank you for taking the time to share your thoughts with me."
+
+
+class StubLLMServer:
+    """
+    Threaded stub server. Each request sleeps latency_ms +/- jitter_ms
+    (uniform) before answering, optionally failing with error_rate.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _delay(self):
+        with self._lock:
+            self.requests += 1
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            fail = self.rng.random() < self.error_rate
+        time.sleep(max(0.0, self.latency_ms + jitter) / 1000.0)
+        return fail
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out as separate writes on a keep-alive
+                # connection; without this, Nagle + delayed ACK add ~40 ms a call
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                messages = list(request.get("messages", []))
+                if request.get("system"):
+                    messages.insert(0, {"role": "system", "content": request["system"]})
+
+                if server._delay():
+                    self._send(500, {"error": {"type": "server_error", "message": "Stub injected failure"}})
+                    return
+
+                text = stub_completion(messages)
+                prompt_tokens = estimate_tokens(" ".join(str(m.get("content", "")) for m in messages))
+                completion_tokens = estimate_tokens(text)
+                model = request.get("model", "stub")
+
+                if self.path.rstrip("/").endswith("/messages"):
+                    self._send(200, {
+                        "id": "msg_stub",
+                        "type": "message",
+                        "role": "assistant",
+                        "model": model,
+                        "content": [{"type": "text", "text": text}],
+                        "stop_reason": "end_turn",
+                        "stop_sequence": None,
+                        "usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens}
+                    })
+                elif self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(200, {
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop"
+                        }],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens
+                        }
+                    })
+                else:
+                    self._send(404, {"error": {"type": "not_found", "message": self.path}})
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def provider_env(url, provider="openai"):
+    """
+    Environment that points QflowSystem at a stub server for the given provider.
+    The OpenAI SDK appends /chat/completions to its base URL, the Anthropic SDK
+    appends /v1/messages.
+    """
+    if provider == "anthropic":
+        return {"LLM_BASE_URL": url, "LLM_MODEL": "claude-stub", "API_KEY": "stub-key"}
+    return {"LLM_BASE_URL": f"{url}/v1", "LLM_MODEL": "gpt-stub", "API_KEY": "stub-key"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI/Anthropic-compatible stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    print(f"Stub LLM listening on {server.url}", file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Online correlations between the 70 AI personality dimensions and the
+HEXACO-100 / BFI-2 domain scores.
+
+A pair is one user's AI analysis (QFLOW_ANALYSIS_LOG, written by
+analyze_personality.py with the user's id) together with that user's latest
+questionnaire result for an instrument (test_results, scored through
+instrument_scoring). Each instrument has its own block of accumulators:
+n, the means of both sides, the sums of squared deviations and the 70 x K
+co-moment matrix. New pairs are folded in batch-wise with the vectorized
+parallel (Chan/Welford) update, so no history is rescanned:
+
+    C  += C_batch + outer(mean_x_batch - mean_x, mean_y_batch - mean_y) * n * n_b / (n + n_b)
+
+A pair is counted once, when its later half arrives: a new analysis pairs
+with the user's latest stored results, and a new test result pairs with the
+user's latest AI scores. Sample-score fallbacks (ai_analysis false) are
+skipped. State (accumulators, latest vectors per user as float32 and the two
+watermarks) is a small SQLite file; `matrix` prints r = C / sqrt(M2_x M2_y)
+from it directly.
+
+Usage (from backend/):
+    python dimension_correlations.py update --analysis-log logs/analysis.jsonl
+    python dimension_correlations.py matrix --test hexaco-test [--format csv]
+    python dimension_correlations.py top --limit 20
+"""
+
+import os
+import sys
+import csv
+import json
+import sqlite3
+import argparse
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from Qflow.log_sink import read_entries_from
+from analyze_personality import PERSONALITY_DIMENSIONS
+from instrument_scoring import DB_PATH, INSTRUMENTS, get_instrument
+
+STATE_PATH = os.path.join(os.path.dirname(DB_PATH), "dimension_correlations.db")
+BATCH_ROWS = 5000
+N_DIMS = len(PERSONALITY_DIMENSIONS)
+
+
+class CoMoments:
+    """
+    Streaming means, M2s and cross co-moments for paired rows (x: 70 dims,
+    y: one instrument's K domains).
+    """
+
+    def __init__(self, k):
+        self.n = 0
+        self.mean_x = np.zeros(N_DIMS)
+        self.mean_y = np.zeros(k)
+        self.m2_x = np.zeros(N_DIMS)
+        self.m2_y = np.zeros(k)
+        self.c = np.zeros((N_DIMS, k))
+
+    def update(self, x, y):
+        """
+        Fold a batch of paired rows (b x 70, b x K) in with one merge.
+        """
+        b = len(x)
+        if not b:
+            return
+        mx, my = x.mean(axis=0), y.mean(axis=0)
+        dx, dy = x - mx, y - my
+        n = self.n + b
+        delta_x, delta_y = mx - self.mean_x, my - self.mean_y
+        weight = self.n * b / n
+        self.c += dx.T @ dy + np.outer(delta_x, delta_y) * weight
+        self.m2_x += (dx * dx).sum(axis=0) + delta_x ** 2 * weight
+        self.m2_y += (dy * dy).sum(axis=0) + delta_y ** 2 * weight
+        self.mean_x += delta_x * b / n
+        self.mean_y += delta_y * b / n
+        self.n = n
+
+    def correlation(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r = self.c / np.sqrt(np.outer(self.m2_x, self.m2_y))
+        return np.where(np.isfinite(r), r, np.nan)
+
+    def to_blob(self):
+        return np.concatenate([[self.n], self.mean_x, self.mean_y, self.m2_x, self.m2_y, self.c.ravel()]).tobytes()
+
+    @classmethod
+    def from_blob(cls, k, blob):
+        data = np.frombuffer(blob, dtype=np.float64)
+        moments = cls(k)
+        moments.n = int(data[0])
+        offset = 1
+        for name, size in (("mean_x", N_DIMS), ("mean_y", k), ("m2_x", N_DIMS), ("m2_y", k)):
+            setattr(moments, name, data[offset:offset + size].copy())
+            offset += size
+        moments.c = data[offset:offset + N_DIMS * k].reshape(N_DIMS, k).copy()
+        return moments
+
+
+class CorrelationState:
+    """
+    Accumulators per instrument, latest vectors per user and watermarks, in SQLite.
+    """
+
+    def __init__(self, path=STATE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS watermark (source TEXT PRIMARY KEY, position INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS moments (test_id TEXT PRIMARY KEY, data BLOB)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS latest (user_id TEXT, kind TEXT, vector BLOB, PRIMARY KEY (user_id, kind))"
+        )
+        self.conn.commit()
+        self.domains = {test_id: list(get_instrument(test_id).domains) for test_id in INSTRUMENTS}
+        self.moments = {test_id: CoMoments(len(domains)) for test_id, domains in self.domains.items()}
+        for test_id, blob in self.conn.execute("SELECT test_id, data FROM moments"):
+            if test_id in self.domains:
+                self.moments[test_id] = CoMoments.from_blob(len(self.domains[test_id]), blob)
+
+    def position(self, source):
+        row = self.conn.execute("SELECT position FROM watermark WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else 0
+
+    def latest(self, user_id, kind):
+        row = self.conn.execute("SELECT vector FROM latest WHERE user_id = ? AND kind = ?", (user_id, kind)).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32).astype(np.float64) if row else None
+
+    def set_latest(self, user_id, kind, vector):
+        self.conn.execute("INSERT OR REPLACE INTO latest (user_id, kind, vector) VALUES (?, ?, ?)",
+                          (user_id, kind, np.asarray(vector, dtype=np.float32).tobytes()))
+
+    def commit(self, source, position):
+        """
+        Persist accumulators with the watermark in the same transaction as the
+        latest-vector updates made since the last commit.
+        """
+        for test_id, moments in self.moments.items():
+            self.conn.execute("INSERT OR REPLACE INTO moments (test_id, data) VALUES (?, ?)",
+                              (test_id, moments.to_blob()))
+        self.conn.execute("INSERT OR REPLACE INTO watermark (source, position) VALUES (?, ?)", (source, position))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class _Pairs:
+    """
+    Collects paired rows per instrument and flushes them as one batch update.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.rows = {test_id: ([], []) for test_id in INSTRUMENTS}
+        self.count = 0
+
+    def add(self, test_id, x, y):
+        if np.isnan(x).any() or np.isnan(y).any():
+            return
+        xs, ys = self.rows[test_id]
+        xs.append(x)
+        ys.append(y)
+        self.count += 1
+
+    def flush(self):
+        for test_id, (xs, ys) in self.rows.items():
+            if xs:
+                self.state.moments[test_id].update(np.array(xs), np.array(ys))
+                xs.clear()
+                ys.clear()
+
+
+def _ai_vector(record):
+    scores = record.get("scores") or {}
+    values = []
+    for dim in PERSONALITY_DIMENSIONS:
+        try:
+            values.append(float(scores.get(dim)))
+        except (TypeError, ValueError):
+            values.append(np.nan)
+    return np.array(values)
+
+
+def update_from_analyses(state, analysis_log, batch_rows=BATCH_ROWS):
+    """
+    Pair new AI analyses with each user's latest questionnaire domains.
+    """
+    source = f"analysis:{os.path.abspath(analysis_log)}"
+    pairs = _Pairs(state)
+    position = state.position(source)
+    seen = 0
+    for position, record in read_entries_from(analysis_log, state.position(source)):
+        user_id = record.get("user_id")
+        if user_id is None or not record.get("ai_analysis"):
+            continue
+        user_id = str(user_id)
+        x = _ai_vector(record)
+        for test_id in INSTRUMENTS:
+            y = state.latest(user_id, test_id)
+            if y is not None:
+                pairs.add(test_id, x, y)
+        state.set_latest(user_id, "ai", x)
+        seen += 1
+        if seen % batch_rows == 0:
+            pairs.flush()
+            state.commit(source, position)
+    pairs.flush()
+    state.commit(source, position)
+    return seen, pairs.count
+
+
+def update_from_test_results(state, db_path=DB_PATH, batch_rows=BATCH_ROWS):
+    """
+    Score new test_results rows and pair them with each user's latest AI scores.
+    """
+    source = f"test_results:{os.path.abspath(db_path)}"
+    position = state.position(source)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    seen = paired = 0
+    try:
+        while True:
+            rows = conn.execute(
+                "SELECT id, user_id, test_id, results_data FROM test_results WHERE id > ? ORDER BY id LIMIT ?",
+                (position, batch_rows)
+            ).fetchall()
+            if not rows:
+                break
+            by_test = {}
+            for row_id, user_id, test_id, results_data in rows:
+                if test_id not in INSTRUMENTS:
+                    continue
+                try:
+                    responses = json.loads(results_data).get("responses")
+                except (ValueError, AttributeError):
+                    continue
+                if isinstance(responses, dict):
+                    by_test.setdefault(test_id, []).append((str(user_id), responses))
+
+            pairs = _Pairs(state)
+            for test_id, entries in by_test.items():
+                instrument = get_instrument(test_id)
+                domain_means = instrument.score_matrix(instrument.response_matrix([r for _, r in entries]))[0]
+                for (user_id, _), y in zip(entries, domain_means):
+                    x = state.latest(user_id, "ai")
+                    if x is not None:
+                        pairs.add(test_id, x, y)
+                    state.set_latest(user_id, test_id, y)
+                seen += len(entries)
+            pairs.flush()
+            paired += pairs.count
+            position = rows[-1][0]
+            state.commit(source, position)
+    finally:
+        conn.close()
+    return seen, paired
+
+
+def correlation_table(state, test_id):
+    moments = state.moments[test_id]
+    return {
+        "test_id": test_id,
+        "n": moments.n,
+        "dimensions": PERSONALITY_DIMENSIONS,
+        "domains": state.domains[test_id],
+        "r": [[None if np.isnan(v) else round(float(v), 4) for v in row] for row in moments.correlation()]
+    }
+
+
+def top_pairs(state, limit=20, min_n=3):
+    """
+    Strongest |r| across every instrument with at least min_n pairs.
+    """
+    ranked = []
+    for test_id, moments in state.moments.items():
+        if moments.n < min_n:
+            continue
+        r = moments.correlation()
+        for i, j in zip(*np.nonzero(~np.isnan(r))):
+            ranked.append((abs(r[i, j]), test_id, PERSONALITY_DIMENSIONS[i], state.domains[test_id][j], float(r[i, j]), moments.n))
+    ranked.sort(reverse=True)
+    return [{"test_id": t, "dimension": d, "domain": k, "r": round(r, 4), "n": n} for _, t, d, k, r, n in ranked[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online AI-dimension x questionnaire-domain correlations")
+    parser.add_argument("--state", default=STATE_PATH, help="Accumulator state database")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    update_parser = sub.add_parser("update", help="Fold new analyses and test results into the accumulators")
+    update_parser.add_argument("--analysis-log", default=os.getenv("QFLOW_ANALYSIS_LOG"),
+                               help="analyze_personality output log (defaults to QFLOW_ANALYSIS_LOG)")
+    update_parser.add_argument("--db", default=DB_PATH)
+    update_parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+
+    matrix_parser = sub.add_parser("matrix", help="Current 70 x K correlation matrix")
+    matrix_parser.add_argument("--test", required=True, choices=sorted(INSTRUMENTS))
+    matrix_parser.add_argument("--format", choices=["json", "csv"], default="json")
+
+    top_parser = sub.add_parser("top", help="Strongest correlations across instruments")
+    top_parser.add_argument("--limit", type=int, default=20)
+    top_parser.add_argument("--min-n", type=int, default=3)
+
+    args = parser.parse_args()
+    state = CorrelationState(args.state)
+    try:
+        if args.command == "update":
+            summary = {}
+            if args.analysis_log and os.path.exists(args.analysis_log):
+                summary["analyses"], summary["pairs_from_analyses"] = update_from_analyses(state, args.analysis_log, args.batch_rows)
+            summary["test_results"], summary["pairs_from_test_results"] = update_from_test_results(state, args.db, args.batch_rows)
+            summary["n"] = {test_id: moments.n for test_id, moments in state.moments.items()}
+            print(json.dumps(summary))
+        elif args.command == "matrix":
+            table = correlation_table(state, args.test)
+            if args.format == "json":
+                print(json.dumps(table))
+            else:
+                writer = csv.writer(sys.stdout)
+                writer.writerow(["dimension"] + table["domains"])
+                for dim, row in zip(table["dimensions"], table["r"]):
+                    writer.writerow([dim] + ["" if v is None else v for v in row])
+        else:
+            print(json.dumps(top_pairs(state, args.limit, args.min_n), indent=2))
+    finally:
+        state.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Research export of life-narrative transcripts.
+
+Joins the Qflow conversation log (QFLOW_CONVERSATION_LOG, JSONL or SQLite)
+with the analyze_personality output log (QFLOW_ANALYSIS_LOG, JSONL) and
+writes one row per answered question, with the session's 70 dimension scores,
+to Parquet (or Arrow IPC) files partitioned by analysis date:
+
+    <out>/dt=YYYY-MM-DD/part-<run>-<n>.parquet
+
+Runs are incremental. A state database in the output directory keeps a
+watermark per source log, plus the turns of sessions that have not been
+scored yet. A session is exported once its analysis appears, and its staged
+turns are then dropped. Memory stays bounded: staged turns live on disk and
+rows are flushed every --batch-rows.
+
+Usage (from backend/):
+    python export_research.py --conversation-log logs/conversations.jsonl \\
+        --analysis-log logs/analysis.jsonl --out exports/transcripts
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import uuid
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from Qflow.log_sink import read_entries_from
+from analyze_personality import PERSONALITY_DIMENSIONS
+
+STATE_FILE = "_export_state.db"
+DEFAULT_BATCH_ROWS = 5000
+STAGE_BATCH = 1000
+
+TURN_COLUMNS = ("session_id", "question_index", "cluster_id", "question", "user_response", "ai_transition", "timestamp")
+
+SCHEMA = pa.schema(
+    [
+        ("session_id", pa.string()),
+        ("question_index", pa.int32()),
+        ("cluster_id", pa.string()),
+        ("question", pa.string()),
+        ("response_text", pa.string()),
+        ("transition", pa.string()),
+        ("answered_at", pa.timestamp("ms")),
+        ("analyzed_at", pa.timestamp("ms")),
+        ("ai_analysis", pa.bool_()),
+    ]
+    + [(dim, pa.float32()) for dim in PERSONALITY_DIMENSIONS]
+)
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _score(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ExportState:
+    """
+    Watermarks and not-yet-scored turns, kept in SQLite next to the output.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS watermark (source TEXT PRIMARY KEY, position INTEGER)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS staged_turns ("
+            "session_id TEXT, question_index INTEGER, cluster_id TEXT, question TEXT, "
+            "user_response TEXT, ai_transition TEXT, timestamp TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS staged_turns_session ON staged_turns (session_id)")
+        self.conn.commit()
+
+    def position(self, source):
+        row = self.conn.execute("SELECT position FROM watermark WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else 0
+
+    def set_position(self, source, position):
+        self.conn.execute("INSERT OR REPLACE INTO watermark (source, position) VALUES (?, ?)", (source, position))
+
+    def stage_turns(self, rows):
+        placeholders = ", ".join("?" for _ in TURN_COLUMNS)
+        self.conn.executemany(f"INSERT INTO staged_turns ({', '.join(TURN_COLUMNS)}) VALUES ({placeholders})", rows)
+
+    def turns_for(self, session_id):
+        return self.conn.execute(
+            f"SELECT {', '.join(TURN_COLUMNS)} FROM staged_turns WHERE session_id = ? ORDER BY timestamp, rowid",
+            (session_id,)
+        )
+
+    def drop_sessions(self, session_ids):
+        self.conn.executemany("DELETE FROM staged_turns WHERE session_id = ?", [(s,) for s in session_ids])
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class PartitionWriter:
+    """
+    Buffers rows per date partition and writes each flush as new part files.
+    """
+
+    def __init__(self, out_dir, file_format, run_id):
+        self.out_dir = out_dir
+        self.file_format = file_format
+        self.run_id = run_id
+        self.sequence = 0
+        self.buffers = {}
+        self.rows = 0
+        self.files = []
+
+    def add(self, partition, row):
+        self.buffers.setdefault(partition, []).append(row)
+        self.rows += 1
+
+    def flush(self):
+        for partition, rows in self.buffers.items():
+            table = pa.Table.from_pylist(rows, schema=SCHEMA)
+            directory = os.path.join(self.out_dir, f"dt={partition}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{self.run_id}-{self.sequence:05d}.{self.file_format}")
+            tmp_path = path + ".tmp"
+            if self.file_format == "parquet":
+                pq.write_table(table, tmp_path, compression="zstd")
+            else:
+                with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+                    writer.write_table(table)
+            # Readers never see a half-written part
+            os.replace(tmp_path, path)
+            self.files.append(path)
+            self.sequence += 1
+        self.buffers = {}
+        self.rows = 0
+
+
+def stage_conversation_log(state, path):
+    """
+    Copy new conversation log entries into the state database. Returns the count.
+    """
+    source = f"conversation:{os.path.abspath(path)}"
+    position = state.position(source)
+    staged = 0
+    batch = []
+    for position, entry in read_entries_from(path, position):
+        if not entry.get("session_id"):
+            continue
+        cluster_id = entry.get("cluster_id")
+        batch.append((
+            entry["session_id"], entry.get("question_index"),
+            str(cluster_id) if cluster_id is not None else None,
+            entry.get("question"), entry.get("user_response"), entry.get("ai_transition"), entry.get("timestamp")
+        ))
+        if len(batch) >= STAGE_BATCH:
+            state.stage_turns(batch)
+            state.set_position(source, position)
+            state.commit()
+            staged += len(batch)
+            batch = []
+    if batch:
+        state.stage_turns(batch)
+        staged += len(batch)
+    state.set_position(source, position)
+    state.commit()
+    return staged
+
+
+def export_scored_sessions(state, analysis_path, writer, batch_rows):
+    """
+    Emit rows for every newly scored session, committing the analysis watermark
+    only after the rows it covers are on disk. Returns (sessions, rows).
+    """
+    source = f"analysis:{os.path.abspath(analysis_path)}"
+    position = state.position(source)
+    pending_sessions = []
+    sessions = rows = 0
+
+    def flush(upto):
+        writer.flush()
+        state.drop_sessions(pending_sessions)
+        state.set_position(source, upto)
+        state.commit()
+        pending_sessions.clear()
+
+    for position, record in read_entries_from(analysis_path, position):
+        session_id = record.get("session_id")
+        if not session_id:
+            continue
+        analyzed_at = _parse_time(record.get("timestamp"))
+        partition = (analyzed_at or datetime.now()).strftime("%Y-%m-%d")
+        scores = record.get("scores") or {}
+        score_columns = {dim: _score(scores.get(dim)) for dim in PERSONALITY_DIMENSIONS}
+
+        emitted = 0
+        for turn in state.turns_for(session_id):
+            turn = dict(zip(TURN_COLUMNS, turn))
+            row = {
+                "session_id": session_id,
+                "question_index": turn["question_index"],
+                "cluster_id": turn["cluster_id"],
+                "question": turn["question"],
+                "response_text": turn["user_response"],
+                "transition": turn["ai_transition"],
+                "answered_at": _parse_time(turn["timestamp"]),
+                "analyzed_at": analyzed_at,
+                "ai_analysis": bool(record.get("ai_analysis"))
+            }
+            row.update(score_columns)
+            writer.add(partition, row)
+            emitted += 1
+
+        if emitted:
+            sessions += 1
+            rows += emitted
+        pending_sessions.append(session_id)
+        if writer.rows >= batch_rows:
+            flush(position)
+
+    flush(position)
+    return sessions, rows
+
+
+def run_export(conversation_log, analysis_log, out_dir, file_format="parquet", batch_rows=DEFAULT_BATCH_ROWS):
+    os.makedirs(out_dir, exist_ok=True)
+    state = ExportState(os.path.join(out_dir, STATE_FILE))
+    writer = PartitionWriter(out_dir, file_format, f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}")
+    try:
+        staged = stage_conversation_log(state, conversation_log) if os.path.exists(conversation_log) else 0
+        sessions, rows = (export_scored_sessions(state, analysis_log, writer, batch_rows)
+                          if os.path.exists(analysis_log) else (0, 0))
+        waiting = state.conn.execute("SELECT COUNT(DISTINCT session_id) FROM staged_turns").fetchone()[0]
+    finally:
+        state.close()
+    return {
+        "staged_turns": staged,
+        "exported_sessions": sessions,
+        "exported_rows": rows,
+        "sessions_awaiting_analysis": waiting,
+        "files": writer.files
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental Parquet/Arrow export of transcripts and personality scores")
+    parser.add_argument("--conversation-log", default=os.getenv("QFLOW_CONVERSATION_LOG", "").split(":", 1)[-1] or None,
+                        help="Conversation log (defaults to QFLOW_CONVERSATION_LOG)")
+    parser.add_argument("--analysis-log", default=os.getenv("QFLOW_ANALYSIS_LOG"),
+                        help="analyze_personality output log (defaults to QFLOW_ANALYSIS_LOG)")
+    parser.add_argument("--out", required=True, help="Output directory (partitioned dataset)")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS, help="Rows buffered before a flush")
+    args = parser.parse_args()
+
+    if not args.conversation_log or not args.analysis_log:
+        parser.error("--conversation-log and --analysis-log are required (or set the QFLOW_* variables)")
+
+    summary = run_export(args.conversation_log, args.analysis_log, args.out, args.format, args.batch_rows)
+    print(f"Exported {summary['exported_rows']} row(s) from {summary['exported_sessions']} session(s); "
+          f"{summary['sessions_awaiting_analysis']} session(s) awaiting analysis", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
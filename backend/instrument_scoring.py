@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Server-side scoring of the HEXACO-100 and BFI-2 item banks.
+
+Each instrument (frontend/tests/<bank>.json) is compiled once into a keying
+matrix: one column per domain and per facet, with a reverse-keying mask.
+Scoring one or many participants is then a single NumPy operation on an
+(n_participants x n_items) response matrix:
+
+    keyed  = where(reverse, 6 - R, R)          # 1-5 Likert
+    means  = (keyed * answered) @ K / answered @ K
+
+Unanswered or out-of-range items are NaN and drop out of both the sums and
+the item counts, so a scale's mean is over the items actually answered; a
+scale with fewer than --min-items answers scores as null.
+
+The results match the client-side scoring in frontend/utils/bfi2-test.js and
+hexaco-test.js (same keying, means and percentile rule) and are written back
+in the same shape those pages store in test_results.results_data.
+
+Usage (from backend/):
+    python instrument_scoring.py rescore                 # report what would change
+    python instrument_scoring.py rescore --write         # update every row in one pass
+    echo '{"test_id": "bfi2-test", "responses": {"1": 4, ...}}' | python instrument_scoring.py score
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+ITEM_BANK_DIR = os.path.join(current_dir, "..", "frontend", "tests")
+DB_PATH = os.path.join(current_dir, "..", "indivar.db")
+
+SCALE_MIN = 1
+SCALE_MAX = 5
+
+# test_id (as stored in test_results) -> item bank file and the result shape
+# its page writes: BFI-2 stores {score, percentile}, HEXACO stores {raw, count}
+INSTRUMENTS = {
+    "bfi2-test": ("bfi2.json", "score"),
+    "hexaco-test": ("hexaco_100.json", "raw"),
+}
+
+
+class Instrument:
+    """
+    One item bank compiled into keying matrices. Scales are listed in item
+    order of first appearance, as the client-side pages list them.
+    """
+
+    def __init__(self, test_id, items, style="score"):
+        items = sorted(items, key=lambda item: item["item_number"])
+        self.test_id = test_id
+        self.style = style
+        self.item_numbers = [str(item["item_number"]) for item in items]
+        self.item_column = {number: col for col, number in enumerate(self.item_numbers)}
+        self.reverse = np.array([bool(item.get("reverse_scored")) for item in items])
+
+        self.domains = list(dict.fromkeys(item["domain"] for item in items))
+        self.facets = list(dict.fromkeys((item["domain"], item["facet"]) for item in items))
+        self.domain_keys = np.zeros((len(items), len(self.domains)))
+        self.facet_keys = np.zeros((len(items), len(self.facets)))
+        for row, item in enumerate(items):
+            self.domain_keys[row, self.domains.index(item["domain"])] = 1.0
+            self.facet_keys[row, self.facets.index((item["domain"], item["facet"]))] = 1.0
+
+    @classmethod
+    def load(cls, test_id, item_bank_dir=ITEM_BANK_DIR):
+        filename, style = INSTRUMENTS[test_id]
+        with open(os.path.join(item_bank_dir, filename), encoding="utf-8") as f:
+            return cls(test_id, json.load(f), style)
+
+    def __len__(self):
+        return len(self.item_numbers)
+
+    def response_matrix(self, responses_list):
+        """
+        (n, n_items) float matrix from {"<item_number>": answer} dicts; NaN
+        where an item is unanswered or not a valid 1-5 answer.
+        """
+        matrix = np.full((len(responses_list), len(self)), np.nan)
+        for row, responses in enumerate(responses_list):
+            for number, answer in (responses or {}).items():
+                col = self.item_column.get(str(number))
+                if col is None:
+                    continue
+                try:
+                    matrix[row, col] = float(answer)
+                except (TypeError, ValueError):
+                    pass
+        matrix[(matrix < SCALE_MIN) | (matrix > SCALE_MAX)] = np.nan
+        return matrix
+
+    def score_matrix(self, matrix, min_items=1):
+        """
+        Domain and facet means for every row at once.
+        Returns (domain_means, domain_counts, facet_means, facet_counts).
+        """
+        keyed = np.where(self.reverse, SCALE_MIN + SCALE_MAX - matrix, matrix)
+        answered = ~np.isnan(keyed)
+        keyed = np.where(answered, keyed, 0.0)
+        keys = np.hstack([self.domain_keys, self.facet_keys])
+
+        sums = keyed @ keys
+        counts = answered.astype(float) @ keys
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(counts >= max(1, min_items), sums / counts, np.nan)
+
+        n_domains = len(self.domains)
+        return means[:, :n_domains], counts[:, :n_domains], means[:, n_domains:], counts[:, n_domains:]
+
+    def score(self, responses_list, min_items=1):
+        """
+        Score many {"<item_number>": answer} dicts; one result dict per input
+        with "scores", "facetScores" and "missingItems".
+        """
+        matrix = self.response_matrix(responses_list)
+        domain_means, domain_counts, facet_means, facet_counts = self.score_matrix(matrix, min_items)
+        missing = np.isnan(matrix).sum(axis=1)
+
+        results = []
+        for row in range(len(responses_list)):
+            scores = {domain: self._scale(domain_means[row, d], domain_counts[row, d])
+                      for d, domain in enumerate(self.domains)}
+            facet_scores = {domain: {} for domain in self.domains}
+            for f, (domain, facet) in enumerate(self.facets):
+                facet_scores[domain][facet] = self._scale(facet_means[row, f], facet_counts[row, f])
+            results.append({"scores": scores, "facetScores": facet_scores, "missingItems": int(missing[row])})
+        return results
+
+    def _scale(self, mean, count):
+        mean = None if np.isnan(mean) else float(mean)
+        if self.style == "raw":
+            return {"raw": mean, "count": int(count)}
+        return {"score": mean, "percentile": percentile(mean)}
+
+
+def percentile(mean):
+    """
+    The pages' simplified 1-5 -> 0-100 mapping (JavaScript Math.round).
+    """
+    if mean is None:
+        return None
+    return int(np.floor((mean - SCALE_MIN) / (SCALE_MAX - SCALE_MIN) * 100 + 0.5))
+
+
+_instruments = {}
+
+
+def get_instrument(test_id):
+    """
+    Compiled instrument for a test_id, built once per process.
+    """
+    if test_id not in _instruments:
+        _instruments[test_id] = Instrument.load(test_id)
+    return _instruments[test_id]
+
+
+def _merge(stored, rescored):
+    """
+    Overwrite the numeric fields of stored scales, keeping anything else the
+    page saved (e.g. descriptions). Returns True if a value changed.
+    """
+    changed = False
+    for name, values in rescored.items():
+        target = stored.setdefault(name, {})
+        for key, value in values.items():
+            if isinstance(value, dict):
+                changed = _merge(target, {key: value}) or changed
+            elif target.get(key) != value:
+                target[key] = value
+                changed = True
+    return changed
+
+
+def rescore_database(db_path=DB_PATH, write=False, min_items=1):
+    """
+    Rescore every test_results row for a known instrument in one pass: one
+    read, one score_matrix call per instrument, one update transaction.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = {}
+        skipped = 0
+        for row_id, test_id, results_data in conn.execute("SELECT id, test_id, results_data FROM test_results"):
+            try:
+                data = json.loads(results_data)
+            except ValueError:
+                skipped += 1
+                continue
+            if test_id not in INSTRUMENTS or not isinstance(data.get("responses"), dict):
+                skipped += 1
+                continue
+            rows.setdefault(test_id, []).append((row_id, data))
+
+        updates = []
+        summary = {"rows": 0, "changed": 0, "skipped": skipped, "by_test": {}}
+        for test_id, entries in rows.items():
+            instrument = get_instrument(test_id)
+            results = instrument.score([data["responses"] for _, data in entries], min_items)
+            changed = 0
+            for (row_id, data), result in zip(entries, results):
+                data.setdefault("scores", {})
+                data.setdefault("facetScores", {})
+                row_changed = _merge(data["scores"], result["scores"])
+                row_changed = _merge(data["facetScores"], result["facetScores"]) or row_changed
+                if row_changed:
+                    changed += 1
+                    updates.append((json.dumps(data), row_id))
+            summary["by_test"][test_id] = {"rows": len(entries), "changed": changed}
+            summary["rows"] += len(entries)
+            summary["changed"] += changed
+
+        if write and updates:
+            with conn:
+                conn.executemany("UPDATE test_results SET results_data = ? WHERE id = ?", updates)
+        summary["written"] = len(updates) if write else 0
+        return summary
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized HEXACO-100 / BFI-2 scoring")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rescore_parser = sub.add_parser("rescore", help="Rescore every stored test result")
+    rescore_parser.add_argument("--db", default=DB_PATH)
+    rescore_parser.add_argument("--write", action="store_true", help="Write changed rows back (default: report only)")
+    rescore_parser.add_argument("--min-items", type=int, default=1, help="Answered items needed to score a scale")
+
+    score_parser = sub.add_parser("score", help="Score {test_id, responses} JSON from stdin")
+    score_parser.add_argument("--min-items", type=int, default=1)
+
+    args = parser.parse_args()
+
+    if args.command == "rescore":
+        summary = rescore_database(args.db, args.write, args.min_items)
+        print(json.dumps(summary, indent=2))
+        return 0
+
+    try:
+        data = json.loads(sys.stdin.read())
+        if not isinstance(data, dict):
+            raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+        instrument = get_instrument(data["test_id"])
+        responses = data.get("responses") or {}
+        if not isinstance(responses, dict):
+            raise ValueError(f"responses must be a JSON object, got {type(responses).__name__}")
+    except (ValueError, KeyError) as e:
+        print(json.dumps({"error": f"Invalid input: {e}"}))
+        return 1
+    print(json.dumps(instrument.score([responses], args.min_items)[0], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
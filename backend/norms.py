@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Population norms for the HEXACO-100 and BFI-2 scales.
+
+Keeps, per instrument and per domain/facet, the count, running mean and sum
+of squared deviations (merged batch-wise with Chan's parallel update), the
+min/max and a histogram of scale scores. Norms are updated incrementally: a
+watermark on test_results.id means each run only reads, parses and scores
+rows inserted since the last one (scoring goes through instrument_scoring,
+one matrix operation per instrument per batch).
+
+Scale scores are means of 1-5 Likert items, so they fall on a coarse grid;
+a fixed histogram with 0.01-wide bins is an exact quantile sketch for them
+(a t-digest would only approximate the same distribution). Percentile
+lookups read a cumulative histogram cached per scale, so each lookup is
+O(1) regardless of population size.
+
+State lives in its own SQLite file (default: norms.db next to indivar.db).
+Rows deleted from test_results after they were counted stay counted.
+
+Usage (from backend/):
+    python norms.py update
+    python norms.py lookup --test bfi2-test --scale Extraversion --score 3.4
+    python norms.py summary
+    python norms.py serve        # JSON lines on stdin: {"test_id", "scale", "score"}
+"""
+
+import os
+import sys
+import json
+import math
+import sqlite3
+import argparse
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from instrument_scoring import DB_PATH, INSTRUMENTS, SCALE_MIN, SCALE_MAX, get_instrument
+
+NORMS_PATH = os.path.join(os.path.dirname(DB_PATH), "norms.db")
+BIN_WIDTH = 0.01
+N_BINS = int(round((SCALE_MAX - SCALE_MIN) / BIN_WIDTH)) + 1
+BATCH_ROWS = 5000
+
+
+def scale_names(instrument):
+    """
+    Domains by name, facets as "Domain/Facet", in the instrument's order.
+    """
+    return list(instrument.domains) + [f"{domain}/{facet}" for domain, facet in instrument.facets]
+
+
+def _bins(values):
+    return np.clip(np.rint((values - SCALE_MIN) / BIN_WIDTH), 0, N_BINS - 1).astype(np.int64)
+
+
+class ScaleNorms:
+    """
+    Accumulators for every scale of one instrument, as parallel arrays.
+    """
+
+    def __init__(self, scales):
+        n = len(scales)
+        self.scales = list(scales)
+        self.index = {name: i for i, name in enumerate(self.scales)}
+        self.count = np.zeros(n, dtype=np.int64)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.min = np.full(n, np.inf)
+        self.max = np.full(n, -np.inf)
+        self.hist = np.zeros((n, N_BINS), dtype=np.int64)
+        self._cdf = None
+
+    def update(self, values):
+        """
+        Fold an (n_rows x n_scales) score matrix (NaN = unscored) into the
+        accumulators.
+        """
+        valid = ~np.isnan(values)
+        batch_count = valid.sum(axis=0)
+        if not batch_count.any():
+            return
+        with np.errstate(invalid="ignore"):
+            batch_mean = np.where(batch_count > 0, np.nansum(values, axis=0) / np.maximum(batch_count, 1), 0.0)
+        batch_m2 = np.nansum((values - batch_mean) ** 2, axis=0)
+
+        total = self.count + batch_count
+        delta = batch_mean - self.mean
+        safe_total = np.maximum(total, 1)
+        self.mean = self.mean + delta * batch_count / safe_total
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * self.count * batch_count / safe_total
+        self.count = total
+        self.min = np.fmin(self.min, np.nanmin(np.where(valid, values, np.inf), axis=0))
+        self.max = np.fmax(self.max, np.nanmax(np.where(valid, values, -np.inf), axis=0))
+
+        # One bincount over (scale, bin) pairs for the whole batch
+        cols = np.nonzero(valid)[1]
+        flat = cols * N_BINS + _bins(values[valid])
+        self.hist += np.bincount(flat, minlength=len(self.scales) * N_BINS).reshape(len(self.scales), N_BINS)
+        self._cdf = None
+
+    def percentile(self, scale, score):
+        """
+        Mid-rank percentile (0-100) of score among everyone scored so far;
+        None if the scale has no data. A non-finite score is a ValueError.
+        """
+        if not math.isfinite(score):
+            raise ValueError(f"Score must be a finite number, got {score!r}")
+        i = self.index[scale]
+        n = self.count[i]
+        if not n:
+            return None
+        if self._cdf is None:
+            self._cdf = np.cumsum(self.hist, axis=1)
+        b = int(_bins(np.float64(score)))
+        below = self._cdf[i, b - 1] if b > 0 else 0
+        return float((below + 0.5 * self.hist[i, b]) / n * 100)
+
+    def quantile(self, scale, q):
+        i = self.index[scale]
+        if not self.count[i]:
+            return None
+        if self._cdf is None:
+            self._cdf = np.cumsum(self.hist, axis=1)
+        b = int(np.searchsorted(self._cdf[i], q * self.count[i], side="left"))
+        return SCALE_MIN + min(b, N_BINS - 1) * BIN_WIDTH
+
+    def summary(self, scale):
+        i = self.index[scale]
+        n = int(self.count[i])
+        if not n:
+            return {"count": 0}
+        return {
+            "count": n,
+            "mean": float(self.mean[i]),
+            "sd": float(np.sqrt(self.m2[i] / (n - 1))) if n > 1 else 0.0,
+            "min": float(self.min[i]),
+            "max": float(self.max[i]),
+            "median": self.quantile(scale, 0.5)
+        }
+
+
+class NormStore:
+    """
+    Per-instrument ScaleNorms persisted in SQLite, plus the test_results watermark.
+    """
+
+    def __init__(self, path=NORMS_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS watermark (source TEXT PRIMARY KEY, position INTEGER)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scale_norms ("
+            "test_id TEXT, scale TEXT, count INTEGER, mean REAL, m2 REAL, min REAL, max REAL, hist BLOB, "
+            "PRIMARY KEY (test_id, scale))"
+        )
+        self.conn.commit()
+        self.norms = {test_id: self._load(test_id) for test_id in INSTRUMENTS}
+
+    def _load(self, test_id):
+        norms = ScaleNorms(scale_names(get_instrument(test_id)))
+        for scale, count, mean, m2, lo, hi, hist in self.conn.execute(
+                "SELECT scale, count, mean, m2, min, max, hist FROM scale_norms WHERE test_id = ?", (test_id,)):
+            i = norms.index.get(scale)
+            if i is None:
+                continue
+            norms.count[i], norms.mean[i], norms.m2[i], norms.min[i], norms.max[i] = count, mean, m2, lo, hi
+            norms.hist[i] = np.frombuffer(hist, dtype=np.int64)
+        return norms
+
+    def position(self, source):
+        row = self.conn.execute("SELECT position FROM watermark WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else 0
+
+    def save(self, source, position):
+        """
+        Persist every instrument's accumulators and the watermark atomically.
+        """
+        with self.conn:
+            for test_id, norms in self.norms.items():
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO scale_norms (test_id, scale, count, mean, m2, min, max, hist) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(test_id, scale, int(norms.count[i]), float(norms.mean[i]), float(norms.m2[i]),
+                      float(norms.min[i]), float(norms.max[i]), norms.hist[i].tobytes())
+                     for i, scale in enumerate(norms.scales) if norms.count[i]]
+                )
+            self.conn.execute("INSERT OR REPLACE INTO watermark (source, position) VALUES (?, ?)", (source, position))
+
+    def update_from(self, db_path=DB_PATH, batch_rows=BATCH_ROWS):
+        """
+        Fold test_results rows with id above the watermark into the norms.
+        Returns the number of rows scored.
+        """
+        source = f"test_results:{os.path.abspath(db_path)}"
+        position = self.position(source)
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        scored = 0
+        try:
+            while True:
+                rows = conn.execute(
+                    "SELECT id, test_id, results_data FROM test_results WHERE id > ? ORDER BY id LIMIT ?",
+                    (position, batch_rows)
+                ).fetchall()
+                if not rows:
+                    break
+                by_test = {}
+                for row_id, test_id, results_data in rows:
+                    if test_id not in self.norms:
+                        continue
+                    try:
+                        responses = json.loads(results_data).get("responses")
+                    except (ValueError, AttributeError):
+                        continue
+                    if isinstance(responses, dict):
+                        by_test.setdefault(test_id, []).append(responses)
+                for test_id, responses in by_test.items():
+                    instrument = get_instrument(test_id)
+                    domain_means, _, facet_means, _ = instrument.score_matrix(instrument.response_matrix(responses))
+                    self.norms[test_id].update(np.hstack([domain_means, facet_means]))
+                    scored += len(responses)
+                position = rows[-1][0]
+                self.save(source, position)
+        finally:
+            conn.close()
+        return scored
+
+    def percentile(self, test_id, scale, score):
+        return self.norms[test_id].percentile(scale, score)
+
+    def summary(self):
+        return {test_id: {scale: norms.summary(scale) for scale in norms.scales}
+                for test_id, norms in self.norms.items()}
+
+    def close(self):
+        self.conn.close()
+
+
+def serve(store, stdin=sys.stdin, stdout=sys.stdout):
+    """
+    Resident lookups: one {"test_id", "scale", "score"} request per line, one
+    {"percentile": ...} (or {"error": ...}) line back; an "id" field is echoed.
+    """
+    for line in stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            score = float(request["score"])
+            if not math.isfinite(score):
+                raise ValueError(f"score must be a finite number, got {request['score']!r}")
+            response = {"percentile": store.percentile(request["test_id"], request["scale"], score)}
+            if "id" in request:
+                response["id"] = request["id"]
+        except (ValueError, KeyError, TypeError) as e:
+            response = {"error": f"Invalid request: {e}"}
+        stdout.write(json.dumps(response) + "\n")
+        stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental HEXACO-100 / BFI-2 population norms")
+    parser.add_argument("--norms", default=NORMS_PATH, help="Norms state database")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    update_parser = sub.add_parser("update", help="Fold new test_results rows into the norms")
+    update_parser.add_argument("--db", default=DB_PATH)
+    update_parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+
+    lookup_parser = sub.add_parser("lookup", help="Percentile of one score")
+    lookup_parser.add_argument("--test", required=True, choices=sorted(INSTRUMENTS))
+    lookup_parser.add_argument("--scale", required=True, help='Domain, or "Domain/Facet"')
+    lookup_parser.add_argument("--score", required=True, type=float)
+
+    sub.add_parser("summary", help="Count, mean, sd, range and median per scale")
+    sub.add_parser("serve", help="Answer JSON-line percentile lookups on stdin")
+
+    args = parser.parse_args()
+    store = NormStore(args.norms)
+    try:
+        if args.command == "update":
+            scored = store.update_from(args.db, args.batch_rows)
+            print(json.dumps({"scored_rows": scored}))
+        elif args.command == "lookup":
+            if args.scale not in store.norms[args.test].index:
+                print(json.dumps({"error": f"Unknown scale {args.scale!r} for {args.test}"}))
+                return 1
+            if not math.isfinite(args.score):
+                print(json.dumps({"error": f"Score must be a finite number, got {args.score!r}"}))
+                return 1
+            print(json.dumps({"percentile": store.percentile(args.test, args.scale, args.score)}))
+        elif args.command == "summary":
+            print(json.dumps(store.summary(), indent=2))
+        else:
+            serve(store)
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
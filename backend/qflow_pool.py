@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Prewarmed pool of Qflow / personality-analysis workers.
+
+Each worker is a Python interpreter that has already imported Qflow and
+analyze_personality, loaded the question bank and built the provider client
+(a process-wide QflowEngine) before it reports ready, so a request never
+pays for interpreter startup or QflowSystem construction.
+
+The supervisor keeps between --min-workers and --max-workers workers alive:
+it starts more while queued requests outnumber the idle and starting ones,
+and retires workers that have been idle for --idle-seconds once the pool is
+above the minimum. A worker is recycled (retired, and replaced if needed)
+after --max-requests requests or when its RSS passes --max-rss-mb.
+
+Requests and results are JSON lines. A request is
+    {"id": ..., "command": "start"}
+    {"id": ..., "command": "respond", "response": "...", "used_indices": [...],
+     "current_question_index": n, "session_id": "...", "budget": {...}}
+    {"id": ..., "command": "analyze", "payload": {"sessionId": ..., "responses": [...]}}
+    {"id": ..., "command": "status"}                  (answered by the supervisor)
+and each result is {"id": ..., "ok": true, "result": {...}} or
+{"id": ..., "ok": false, "error": "..."}.
+
+Usage (from backend/):
+    python qflow_pool.py serve --min-workers 2 --max-workers 8 < requests.jsonl
+"""
+
+import sys
+import os
+import json
+import time
+import select
+import argparse
+import subprocess
+from collections import deque
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+DEFAULT_MIN_WORKERS = 1
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_REQUESTS = 500
+DEFAULT_MAX_RSS_MB = 512
+DEFAULT_IDLE_SECONDS = 60.0
+# Workers that die before reporting ready (bad bank or config) are respawned
+# with exponential backoff; after this many in a row, queued requests fail
+MAX_WARMUP_FAILURES = 3
+WARMUP_BACKOFF_SECONDS = 1.0
+MAX_WARMUP_BACKOFF_SECONDS = 60.0
+
+
+def _rss_mb():
+    """
+    Resident set size of this process in MB, from /proc (None elsewhere).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+##########################
+# --- Worker process --- #
+
+def _handle(command, request, engine):
+    from Qflow.qflow_conversation import prepare_session, advance_conversation
+    from Qflow.tracing import trace
+    from analyze_personality import run_analysis
+
+    if command == "start":
+        return {"message": engine.new_session().start_greeting()}
+    if command == "respond":
+        with trace("qflow.turn", **{"qflow.command": "respond"}):
+            qflow, error = prepare_session(request.get("used_indices"), request.get("current_question_index"),
+                                           request.get("session_id"), request.get("budget"))
+            if error is not None:
+                raise RuntimeError(error["error"])
+            return advance_conversation(qflow, request["response"])
+    if command == "analyze":
+        payload = request.get("payload") or {}
+        if "responses" not in payload:
+            raise ValueError("No responses provided")
+        return run_analysis(payload, engine)
+    raise ValueError(f"Unknown command: {command}")
+
+
+def worker_main(slot=0):
+    """
+    Warm up, report ready, then serve requests from stdin until EOF. With
+    QFLOW_METRICS_PORT set, metrics are served on that port + slot.
+    """
+    # Protocol lines go to the real stdout; anything library code prints
+    # lands on stderr instead of corrupting them
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    sys.stdout = sys.stderr
+
+    started = time.perf_counter()
+    from Qflow.qflow_conversation import get_engine
+    import analyze_personality  # noqa: F401  (imported now so the first analysis is warm)
+
+    engine, error = get_engine()
+    if error is not None:
+        out.write(json.dumps({"ready": False, "error": error["error"]}) + "\n")
+        out.flush()
+        return 1
+    from Qflow import metrics
+    metrics.start_http_server_from_env(offset=slot)
+    out.write(json.dumps({"ready": True, "pid": os.getpid(), "warmup_seconds": time.perf_counter() - started}) + "\n")
+    out.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request_started = time.perf_counter()
+        request = {}
+        try:
+            request = json.loads(line)
+            result = {"ok": True, "result": _handle(request.get("command"), request, engine)}
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        result["id"] = request.get("id")
+        result["pid"] = os.getpid()
+        result["rss_mb"] = _rss_mb()
+        result["elapsed"] = time.perf_counter() - request_started
+        out.write(json.dumps(result, default=str) + "\n")
+        out.flush()
+    return 0
+
+
+##############################
+# --- Supervisor (parent) --- #
+
+class _Worker:
+    """
+    Parent-side handle on one worker process and its current request.
+    """
+
+    def __init__(self, process, slot):
+        self.process = process
+        self.slot = slot
+        self.pid = process.pid
+        self.fd = process.stdout.fileno()
+        self.buffer = b""
+        self.state = "starting"  # starting -> idle <-> busy -> retiring
+        self.request = None
+        self.requests = 0
+        self.rss_mb = None
+        self.spawned_at = time.monotonic()
+        self.idle_since = None
+
+
+class QflowWorkerPool:
+    """
+    Supervisor for prewarmed Qflow workers. Single-threaded: call submit()
+    to queue requests and poll() to make progress; finished results are
+    collected with drain_completed().
+    """
+
+    def __init__(self, min_workers=DEFAULT_MIN_WORKERS, max_workers=DEFAULT_MAX_WORKERS,
+                 max_requests=DEFAULT_MAX_REQUESTS, max_rss_mb=DEFAULT_MAX_RSS_MB,
+                 idle_seconds=DEFAULT_IDLE_SECONDS):
+        if min_workers < 0 or max_workers < max(1, min_workers):
+            raise ValueError("Need 0 <= min_workers <= max_workers and max_workers >= 1")
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.max_requests = max_requests
+        self.max_rss_mb = max_rss_mb
+        self.idle_seconds = idle_seconds
+        self.workers = []
+        self.queue = deque()
+        self._completed = []
+        self._closing = False
+        self._warmup_failures = 0
+        self._warmup_error = None
+        self._spawn_not_before = 0.0
+        self.stats = {"spawned": 0, "recycled": 0, "scaled_down": 0, "crashed": 0, "shutdown": 0, "completed": 0}
+
+    def start(self):
+        self._scale()
+        return self
+
+    # --- Worker lifecycle --- #
+
+    def _spawn(self):
+        # Lowest slot no running worker holds, so metrics ports stay in
+        # QFLOW_METRICS_PORT .. + max_workers - 1 across recycling
+        taken = {w.slot for w in self.workers}
+        slot = next(i for i in range(len(self.workers) + 1) if i not in taken)
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", "--slot", str(slot)],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.workers.append(_Worker(process, slot))
+        self.stats["spawned"] += 1
+
+    def _retire(self, worker, reason):
+        """
+        Close the worker's stdin; it exits after its current request.
+        """
+        if worker.state == "retiring":
+            return
+        worker.state = "retiring"
+        self.stats[reason] += 1
+        try:
+            worker.process.stdin.close()
+        except OSError:
+            pass
+        print(f"Retiring Qflow worker {worker.pid} ({reason}, {worker.requests} request(s), "
+              f"{worker.rss_mb or 0:.0f} MB)", file=sys.stderr)
+
+    def _warmup_failed(self, worker, error):
+        """
+        Count a worker that died or failed before reporting ready and push
+        back the next spawn.
+        """
+        self._warmup_failures += 1
+        self._warmup_error = error
+        delay = min(MAX_WARMUP_BACKOFF_SECONDS, WARMUP_BACKOFF_SECONDS * 2 ** (self._warmup_failures - 1))
+        self._spawn_not_before = time.monotonic() + delay
+        print(f"Qflow worker {worker.pid} failed to warm up ({self._warmup_failures} in a row): {error}; "
+              f"next spawn in {delay:.0f}s", file=sys.stderr)
+
+    def _reap(self, worker):
+        if worker.process.poll() is None:
+            worker.process.kill()
+        worker.process.wait()
+        worker.process.stdout.close()
+        self.workers.remove(worker)
+        if worker.state == "starting":
+            self._warmup_failed(worker, f"exited with code {worker.process.returncode}")
+        if worker.state != "retiring":
+            self.stats["crashed"] += 1
+        if worker.request is not None:
+            self._completed.append({"id": worker.request.get("id"), "ok": False,
+                                    "error": f"Qflow worker {worker.pid} exited mid-request"})
+            self.stats["completed"] += 1
+
+    def _scale(self):
+        """
+        Keep at least min_workers alive, grow towards max_workers while the
+        queue outnumbers idle and warming workers, shrink idle ones back.
+        """
+        if self._closing:
+            return
+        live = [w for w in self.workers if w.state != "retiring"]
+        spare = sum(1 for w in live if w.state in ("starting", "idle"))
+        now = time.monotonic()
+        while (now >= self._spawn_not_before
+               and (len(live) < self.min_workers or (len(self.queue) > spare and len(live) < self.max_workers))):
+            self._spawn()
+            live.append(self.workers[-1])
+            spare += 1
+            if self._warmup_failures:
+                # While workers keep failing, probe with one at a time
+                break
+
+        if self._warmup_failures >= MAX_WARMUP_FAILURES and not any(w.state in ("idle", "busy") for w in live):
+            # Nothing can serve the queue; fail it rather than leave callers waiting
+            while self.queue:
+                request = self.queue.popleft()
+                self._completed.append({"id": request.get("id"), "ok": False,
+                                        "error": f"No Qflow worker could warm up: {self._warmup_error}"})
+                self.stats["completed"] += 1
+
+        if self.queue:
+            return
+        for worker in sorted(live, key=lambda w: w.idle_since or now):
+            if len(live) <= self.min_workers:
+                break
+            if worker.state == "idle" and now - worker.idle_since >= self.idle_seconds:
+                self._retire(worker, "scaled_down")
+                live.remove(worker)
+
+    # --- Requests --- #
+
+    def submit(self, request):
+        if request.get("command") == "status":
+            self._completed.append({"id": request.get("id"), "ok": True, "result": self.status()})
+            return
+        self.queue.append(request)
+        self._dispatch()
+        self._scale()
+
+    def _dispatch(self):
+        for worker in list(self.workers):
+            if not self.queue:
+                return
+            if worker.state == "idle":
+                request = self.queue.popleft()
+                try:
+                    worker.process.stdin.write(json.dumps(request) + "\n")
+                    worker.process.stdin.flush()
+                except OSError as e:
+                    # Died while idle: put the request back for another worker
+                    print(f"Qflow worker {worker.pid} is gone ({e}); requeueing request", file=sys.stderr)
+                    self.queue.appendleft(request)
+                    self._reap(worker)
+                    continue
+                worker.state = "busy"
+                worker.request = request
+
+    def _on_line(self, worker, line):
+        message = json.loads(line)
+        if worker.state == "starting":
+            if message.get("ready"):
+                worker.state = "idle"
+                worker.idle_since = time.monotonic()
+                self._warmup_failures = 0
+                self._spawn_not_before = 0.0
+            else:
+                self._warmup_failed(worker, message.get("error"))
+                self._retire(worker, "crashed")
+            return
+
+        worker.request = None
+        worker.requests += 1
+        worker.rss_mb = message.pop("rss_mb", None)
+        self._completed.append(message)
+        self.stats["completed"] += 1
+        if worker.state == "retiring":
+            return
+        worker.state = "idle"
+        worker.idle_since = time.monotonic()
+        if worker.requests >= self.max_requests or (self.max_rss_mb and (worker.rss_mb or 0) > self.max_rss_mb):
+            self._retire(worker, "recycled")
+
+    def poll(self, timeout=None, extra_fds=()):
+        """
+        Process worker output for up to timeout seconds, then dispatch and
+        rescale. Returns the subset of extra_fds that are readable.
+        """
+        by_fd = {w.fd: w for w in self.workers}
+        ready, _, _ = select.select(list(by_fd) + list(extra_fds), [], [], timeout)
+        for fd in ready:
+            worker = by_fd.get(fd)
+            if worker is None:
+                continue
+            data = os.read(fd, 65536)
+            if not data:
+                self._reap(worker)
+                continue
+            worker.buffer += data
+            while b"\n" in worker.buffer:
+                line, worker.buffer = worker.buffer.split(b"\n", 1)
+                if line.strip():
+                    self._on_line(worker, line)
+        self._dispatch()
+        self._scale()
+        return [fd for fd in ready if fd in extra_fds]
+
+    def drain_completed(self):
+        completed, self._completed = self._completed, []
+        return completed
+
+    def busy(self):
+        return bool(self.queue) or any(w.request is not None for w in self.workers)
+
+    def status(self):
+        counts = {}
+        for worker in self.workers:
+            counts[worker.state] = counts.get(worker.state, 0) + 1
+        return {
+            "workers": counts,
+            "queue_depth": len(self.queue),
+            "min_workers": self.min_workers,
+            "max_workers": self.max_workers,
+            **self.stats
+        }
+
+    def close(self):
+        self._closing = True
+        self.queue.clear()
+        for worker in list(self.workers):
+            self._retire(worker, "shutdown")
+        while self.workers:
+            self.poll(timeout=1.0)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def serve(args):
+    """
+    Read JSON-line requests from stdin and write results to stdout as they
+    finish (not in request order).
+    """
+    pool = QflowWorkerPool(args.min_workers, args.max_workers, args.max_requests, args.max_rss_mb, args.idle_seconds)
+    stdin_fd = sys.stdin.fileno()
+    buffer = b""
+    open_input = True
+    with pool:
+        while open_input or pool.busy():
+            readable = pool.poll(timeout=1.0, extra_fds=[stdin_fd] if open_input else [])
+            if readable:
+                data = os.read(stdin_fd, 65536)
+                if not data:
+                    open_input = False
+                buffer += data
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    if not line.strip():
+                        continue
+                    try:
+                        pool.submit(json.loads(line))
+                    except ValueError as e:
+                        pool._completed.append({"id": None, "ok": False, "error": f"Invalid request: {e}"})
+            for result in pool.drain_completed():
+                print(json.dumps(result, default=str), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prewarmed pool of Qflow / analysis workers")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", help="Answer JSON-line requests from stdin")
+    serve_parser.add_argument("--min-workers", type=int,
+                              default=int(os.getenv("QFLOW_POOL_MIN_WORKERS", DEFAULT_MIN_WORKERS)))
+    serve_parser.add_argument("--max-workers", type=int,
+                              default=int(os.getenv("QFLOW_POOL_MAX_WORKERS", DEFAULT_MAX_WORKERS)))
+    serve_parser.add_argument("--max-requests", type=int,
+                              default=int(os.getenv("QFLOW_POOL_MAX_REQUESTS", DEFAULT_MAX_REQUESTS)),
+                              help="Recycle a worker after this many requests")
+    serve_parser.add_argument("--max-rss-mb", type=float,
+                              default=float(os.getenv("QFLOW_POOL_MAX_RSS_MB", DEFAULT_MAX_RSS_MB)),
+                              help="Recycle a worker once its RSS exceeds this (0 disables)")
+    serve_parser.add_argument("--idle-seconds", type=float,
+                              default=float(os.getenv("QFLOW_POOL_IDLE_SECONDS", DEFAULT_IDLE_SECONDS)),
+                              help="Retire workers above the minimum after this long idle")
+
+    # Internal: one prewarmed worker, started by the supervisor
+    worker_parser = sub.add_parser("worker")
+    worker_parser.add_argument("--slot", type=int, default=0, help="Offset of this worker's metrics port")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+        return 0
+    return worker_main(args.slot)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,8 @@ const fs = require('fs');
 const multer = require('multer');
 const { spawn } = require('child_process');
 const { v4: uuidv4 } = require('uuid');
+const qflowPool = require('../utils/qflowPool');
+const analysisJobs = require('../utils/analysisJobs');
 
 // Load life narrative questions
 const questionsPath = path.join(__dirname, '..', 'life_narrative_questions.json');
@@ -64,8 +66,10 @@ router.post('/start', async (req, res) => {
             userId,
             sessionId,
             currentQuestionIndex: null,
+            currentClusterId: null,
             responses: [],
             usedQuestions: [],
+            budget: null,
             startTime: new Date(),
             isCompleted: false,
             personalityAnalysis: null
@@ -109,54 +113,9 @@ router.post('/respond', async (req, res) => {
         }
 
         // Process response using Qflow system
-        const result = await processQflowResponse(response, session.usedQuestions, session.currentQuestionIndex);
+        const result = await processQflowResponse(response, session.usedQuestions, session.currentQuestionIndex, sessionId, session.budget);
         
-        // Update session with response
-        if (session.currentQuestionIndex !== null) {
-            session.responses.push({
-                questionIndex: session.currentQuestionIndex,
-                question: questions[session.currentQuestionIndex]?.question || 'Question not found',
-                response: response,
-                timestamp: new Date()
-            });
-        }
-
-        // Update session state
-        if (result.question_index !== null) {
-            session.currentQuestionIndex = result.question_index;
-        }
-        
-        if (result.progress && result.progress.used_question_indices) {
-            session.usedQuestions = result.progress.used_question_indices;
-        }
-
-        // Check if conversation is completed
-        if (result.finished) {
-            session.isCompleted = true;
-            session.endTime = new Date();
-            
-            // Trigger personality analysis
-            try {
-                const analysisResult = await analyzePersonality(session.responses);
-                session.personalityAnalysis = analysisResult;
-            } catch (analysisError) {
-                console.error('Error analyzing personality:', analysisError);
-            }
-        }
-
-        // Format response for frontend
-        const responseData = {
-            message: result.message,
-            progress: {
-                current: result.progress?.used_questions || 0,
-                total: questions.length,
-                used_questions: result.progress?.used_questions || 0
-            },
-            completed: result.finished || false,
-            sessionId: sessionId,
-            questionIndex: result.question_index,
-            clusterId: result.cluster_id
-        };
+        const responseData = await applyQflowResult(session, sessionId, response, result);
 
         res.json(responseData);
 
@@ -204,6 +163,54 @@ router.post('/transcribe', upload.single('audio'), async (req, res) => {
     }
 });
 
+// Transcribe a spoken answer and advance the conversation in one Python process
+router.post('/voice-respond', upload.single('audio'), async (req, res) => {
+    try {
+        const { sessionId } = req.body;
+
+        if (!sessionId || !req.file) {
+            return res.status(400).json({ error: 'Session ID and audio file are required' });
+        }
+
+        const session = userSessions.get(sessionId);
+        if (!session) {
+            fs.unlink(req.file.path, () => {});
+            return res.status(404).json({ error: 'Session not found' });
+        }
+
+        if (session.isCompleted) {
+            fs.unlink(req.file.path, () => {});
+            return res.status(400).json({ error: 'Session already completed' });
+        }
+
+        const voiceResult = await processVoiceTurn(req.file.path, session.usedQuestions, session.currentQuestionIndex, sessionId, session.budget);
+
+        fs.unlink(req.file.path, (unlinkError) => {
+            if (unlinkError) {
+                console.error('Error cleaning up audio file:', unlinkError);
+            }
+        });
+
+        if (!voiceResult.success) {
+            return res.status(500).json({
+                error: voiceResult.error || 'Voice turn failed',
+                transcript: voiceResult.transcript,
+                success: false
+            });
+        }
+
+        const responseData = await applyQflowResult(session, sessionId, voiceResult.transcript, voiceResult.turn);
+        responseData.transcript = voiceResult.transcript;
+        responseData.language = voiceResult.language;
+
+        res.json(responseData);
+
+    } catch (error) {
+        console.error('Error processing voice response:', error);
+        res.status(500).json({ error: 'Failed to process voice response' });
+    }
+});
+
 // Get session status
 router.get('/session/:sessionId', (req, res) => {
     try {
@@ -248,10 +255,36 @@ router.get('/results/:sessionId', async (req, res) => {
 
         let personalityResults = session.personalityAnalysis;
         
+        // With the analysis queue, report progress until the worker has stored a result
+        if (!personalityResults && session.responses.length > 0 && analysisJobs.enabled()) {
+            try {
+                let job = await analysisJobs.status(sessionId);
+                if (job.status === 'unknown') {
+                    job = await analysisJobs.enqueue(analysisPayload(session.responses, sessionId, session.userId, session.budget));
+                }
+                if (job.status !== 'done' && job.status !== 'dead') {
+                    return res.status(202).json({
+                        sessionId,
+                        status: job.status,
+                        attempts: job.attempts,
+                        responseCount: session.responses.length
+                    });
+                }
+                // Dead-lettered jobs keep their last sample-score result; don't cache it
+                personalityResults = job.result || generateMockResults();
+                if (job.status === 'done') {
+                    session.personalityAnalysis = personalityResults;
+                }
+            } catch (queueError) {
+                console.error('Error reading analysis job:', queueError);
+                personalityResults = generateMockResults();
+            }
+        }
+
         // If analysis hasn't been done yet, perform it now
         if (!personalityResults && session.responses.length > 0) {
             try {
-                personalityResults = await analyzePersonality(session.responses);
+                personalityResults = await analyzePersonality(session.responses, sessionId, session.userId, session.budget);
                 session.personalityAnalysis = personalityResults;
             } catch (analysisError) {
                 console.error('Error analyzing personality:', analysisError);
@@ -274,7 +307,78 @@ router.get('/results/:sessionId', async (req, res) => {
 
 // Helper Functions
 
+// Record the answered question, advance session state from a Qflow result and
+// format the response for the frontend
+async function applyQflowResult(session, sessionId, response, result) {
+    // Update session with response
+    if (session.currentQuestionIndex !== null) {
+        session.responses.push({
+            questionIndex: session.currentQuestionIndex,
+            question: questions[session.currentQuestionIndex]?.question || 'Question not found',
+            clusterId: session.currentClusterId ?? null,
+            response: response,
+            timestamp: new Date()
+        });
+    }
+
+    // Update session state
+    if (result.question_index !== null) {
+        session.currentQuestionIndex = result.question_index;
+        session.currentClusterId = result.cluster_id;
+    }
+    
+    if (result.progress && result.progress.used_question_indices) {
+        session.usedQuestions = result.progress.used_question_indices;
+    }
+
+    // Token/latency spend so far; handed back next turn so the budget accumulates
+    if (result.progress && result.progress.budget) {
+        session.budget = result.progress.budget;
+    }
+
+    // Check if conversation is completed
+    if (result.finished) {
+        session.isCompleted = true;
+        session.endTime = new Date();
+        
+        // Trigger personality analysis (queued for the worker when the analysis queue is on)
+        if (analysisJobs.enabled()) {
+            analysisJobs.enqueue(analysisPayload(session.responses, sessionId, session.userId, session.budget)).catch((queueError) => {
+                console.error('Error queueing personality analysis:', queueError);
+            });
+        } else {
+            try {
+                const analysisResult = await analyzePersonality(session.responses, sessionId, session.userId, session.budget);
+                session.personalityAnalysis = analysisResult;
+            } catch (analysisError) {
+                console.error('Error analyzing personality:', analysisError);
+            }
+        }
+    }
+
+    // Format response for frontend
+    const responseData = {
+        message: result.message,
+        progress: {
+            current: result.progress?.used_questions || 0,
+            total: questions.length,
+            used_questions: result.progress?.used_questions || 0,
+            budget: result.progress?.budget || null
+        },
+        completed: result.finished || false,
+        sessionId: sessionId,
+        questionIndex: result.question_index,
+        clusterId: result.cluster_id
+    };
+
+    return responseData;
+}
+
 async function startQflowConversation() {
+    if (qflowPool.enabled()) {
+        const result = await qflowPool.request('start');
+        return result.message;
+    }
     return new Promise((resolve, reject) => {
         const pythonProcess = spawn('python', [
             path.join(__dirname, '..', 'Qflow', 'qflow_conversation.py'),
@@ -303,7 +407,16 @@ async function startQflowConversation() {
     });
 }
 
-async function processQflowResponse(userResponse, usedQuestions, currentQuestionIndex) {
+async function processQflowResponse(userResponse, usedQuestions, currentQuestionIndex, sessionId, budget) {
+    if (qflowPool.enabled()) {
+        return qflowPool.request('respond', {
+            response: userResponse,
+            used_indices: usedQuestions && usedQuestions.length > 0 ? usedQuestions : null,
+            current_question_index: currentQuestionIndex,
+            session_id: sessionId || null,
+            budget: budget || null
+        });
+    }
     return new Promise((resolve, reject) => {
         const args = [
             path.join(__dirname, '..', 'Qflow', 'qflow_conversation.py'),
@@ -319,6 +432,14 @@ async function processQflowResponse(userResponse, usedQuestions, currentQuestion
             args.push('--current_question_index', currentQuestionIndex.toString());
         }
 
+        if (sessionId) {
+            args.push('--session_id', sessionId);
+        }
+
+        if (budget) {
+            args.push('--budget', JSON.stringify(budget));
+        }
+
         const pythonProcess = spawn('python', args);
 
         let output = '';
@@ -385,15 +506,88 @@ async function transcribeAudio(audioPath) {
     });
 }
 
-async function analyzePersonality(responses) {
+async function processVoiceTurn(audioPath, usedQuestions, currentQuestionIndex, sessionId, budget) {
+    return new Promise((resolve) => {
+        const args = [
+            path.join(__dirname, '..', 'voice_turn.py'),
+            audioPath
+        ];
+
+        if (usedQuestions && usedQuestions.length > 0) {
+            args.push('--used_indices', JSON.stringify(usedQuestions));
+        }
+
+        if (currentQuestionIndex !== null) {
+            args.push('--current_question_index', currentQuestionIndex.toString());
+        }
+
+        if (sessionId) {
+            args.push('--session_id', sessionId);
+        }
+
+        if (budget) {
+            args.push('--budget', JSON.stringify(budget));
+        }
+
+        const pythonProcess = spawn('python', args);
+
+        let output = '';
+        let errorOutput = '';
+
+        pythonProcess.stdout.on('data', (data) => {
+            output += data.toString();
+        });
+
+        pythonProcess.stderr.on('data', (data) => {
+            errorOutput += data.toString();
+        });
+
+        pythonProcess.on('close', (code) => {
+            try {
+                resolve(JSON.parse(output.trim()));
+            } catch (parseError) {
+                console.error('Error parsing voice turn result:', parseError);
+                console.error('Raw output:', output);
+                console.error('Error output:', errorOutput);
+                resolve({
+                    success: false,
+                    error: 'Failed to parse voice turn result'
+                });
+            }
+        });
+    });
+}
+
+// analyze_personality.py (and the analysis queue) read {sessionId, userId, budget, responses: [{questionText, userResponse, clusterId}]}
+function analysisPayload(responses, sessionId, userId, budget) {
+    return {
+        sessionId,
+        userId,
+        budget: budget || null,
+        responses: responses.map(r => ({
+            questionText: r.question,
+            userResponse: r.response,
+            clusterId: r.clusterId ?? null
+        }))
+    };
+}
+
+async function analyzePersonality(responses, sessionId, userId, budget) {
     return new Promise((resolve, reject) => {
-        // Prepare responses for analysis
-        const responseTexts = responses.map(r => r.response).join('\n\n');
-        
+        const payload = analysisPayload(responses, sessionId, userId, budget);
+
+        if (qflowPool.enabled()) {
+            qflowPool.request('analyze', { payload }).then(resolve, (error) => {
+                console.error('Error in pooled personality analysis:', error);
+                resolve(generateMockResults());
+            });
+            return;
+        }
+
         const pythonProcess = spawn('python', [
-            path.join(__dirname, '..', 'analyze_personality.py'),
-            responseTexts
+            path.join(__dirname, '..', 'analyze_personality.py')
         ]);
+        pythonProcess.stdin.end(JSON.stringify(payload));
 
         let output = '';
         let errorOutput = '';
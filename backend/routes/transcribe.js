@@ -1,5 +1,7 @@
 const express = require('express');
 const multer = require('multer');
+const path = require('path');
+const { spawn } = require('child_process');
 const router = express.Router();
 
 // Configure multer for file uploads
@@ -30,18 +32,18 @@ router.post('/', upload.single('audio'), async (req, res) => {
             size: req.file.size
         });
         
-        // For now, return a placeholder transcript
-        // In a real implementation, you would:
-        // 1. Save the audio file temporarily
-        // 2. Use a speech-to-text service like OpenAI Whisper, Google Speech-to-Text, etc.
-        // 3. Return the actual transcript
-        
-        const transcript = "This is a placeholder transcript. Please implement actual speech-to-text functionality.";
-        
-        res.json({
-            transcript: transcript,
-            success: true
-        });
+        // The upload is already in memory, so stream it straight to the
+        // transcriber's stdin instead of writing a temporary file
+        const result = await transcribeBuffer(req.file.buffer);
+
+        if (!result.success) {
+            return res.status(500).json({
+                error: 'Transcription failed',
+                message: result.error
+            });
+        }
+
+        res.json(result);
         
     } catch (error) {
         console.error('Transcription error:', error);
@@ -52,4 +54,43 @@ router.post('/', upload.single('audio'), async (req, res) => {
     }
 });
 
+function transcribeBuffer(buffer) {
+    return new Promise((resolve) => {
+        const pythonProcess = spawn('python', [
+            path.join(__dirname, '..', 'transcribe_audio.py'),
+            '--stdin'
+        ]);
+
+        let output = '';
+        let errorOutput = '';
+
+        pythonProcess.stdout.on('data', (data) => {
+            output += data.toString();
+        });
+
+        pythonProcess.stderr.on('data', (data) => {
+            errorOutput += data.toString();
+        });
+
+        pythonProcess.stdin.on('error', (error) => {
+            console.error('Error writing audio to transcriber:', error);
+        });
+
+        pythonProcess.on('close', () => {
+            try {
+                resolve(JSON.parse(output.trim()));
+            } catch (parseError) {
+                console.error('Error parsing transcription result:', parseError);
+                console.error('Error output:', errorOutput);
+                resolve({
+                    success: false,
+                    error: 'Failed to parse transcription result'
+                });
+            }
+        });
+
+        pythonProcess.stdin.end(buffer);
+    });
+}
+
 module.exports = router; 
\ No newline at end of file
@@ -5,58 +5,325 @@ Audio transcription script using local Whisper model
 
 import sys
 import json
-import whisper
-import torch
 import os
+import argparse
+import hashlib
+import tempfile
+import subprocess
+import threading
 from pathlib import Path
 import numpy as np
 import math
 
-def transcribe_audio(audio_path):
+try:
+    import fcntl
+except ImportError:  # Windows: stats updates are best-effort without a lock
+    fcntl = None
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MODEL_NAME = "base"  # Using base model for faster processing
+SAMPLE_RATE = 16000  # Whisper expects 16kHz audio
+CHUNK_SECONDS = 30
+
+# Transcription cache defaults (overridable through the environment)
+CACHE_DIR = os.getenv("TRANSCRIBE_CACHE_DIR", os.path.join(current_dir, ".transcription_cache"))
+CACHE_MAX_BYTES = int(os.getenv("TRANSCRIBE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class TranscriptionCache:
     """
-    Transcribe audio file using local Whisper model, chunking if longer than 30 seconds
+    On-disk cache of transcription results keyed on the audio content hash
+    plus the model and decoding options. Entries are small JSON files; the
+    least recently used ones are evicted once the directory exceeds max_bytes.
     """
-    try:
-        # Load the Whisper model (will download on first use)
-        print("Loading Whisper model...", file=sys.stderr)
-        model = whisper.load_model("base")  # Using base model for faster processing
-        
-        # Load and preprocess the audio
-        print("Loading audio file...", file=sys.stderr)
-        audio = whisper.load_audio(audio_path)
-        sample_rate = 16000  # Whisper expects 16kHz audio
-        chunk_length = 30 * sample_rate  # 30 seconds in samples
-        num_chunks = math.ceil(len(audio) / chunk_length)
-        print(f"Audio length: {len(audio) / sample_rate:.2f} seconds, splitting into {num_chunks} chunk(s)...", file=sys.stderr)
-
-        full_transcript = []
-        detected_lang = None
-        for i in range(num_chunks):
-            start = i * chunk_length
-            end = min((i + 1) * chunk_length, len(audio))
-            chunk = audio[start:end]
-            chunk = whisper.pad_or_trim(chunk)
-
-            print(f"Processing chunk {i+1}/{num_chunks}...", file=sys.stderr)
-            mel = whisper.log_mel_spectrogram(chunk).to(model.device)
-
-            if i == 0:
-                print("Detecting language...", file=sys.stderr)
-                _, probs = model.detect_language(mel)
-                detected_lang = max(probs, key=probs.get)
-                print(f"Detected language: {detected_lang}", file=sys.stderr)
-
-            print("Transcribing chunk...", file=sys.stderr)
-            options = whisper.DecodingOptions(fp16=False)
-            result = whisper.decode(model, mel, options)
-            full_transcript.append(result.text.strip())
 
+    STATS_FILE = "stats.json"
+    LOCK_FILE = ".lock"
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(audio_digest: str, model_name: str, options: dict) -> str:
+        payload = json.dumps({"audio": audio_digest, "model": model_name, "options": options}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str):
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Touch the entry so eviction order follows last use, not creation
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key: str, result: dict):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError as e:
+            print(f"Warning: could not write transcription cache entry: {e}", file=sys.stderr)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for path in self.directory.glob("*.json"):
+            if path.name == self.STATS_FILE:
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
+    def record(self, hit: bool) -> dict:
+        """
+        Update the persistent hit/miss counters and return the current totals.
+        """
+        stats_path = self.directory / self.STATS_FILE
+        with open(self.directory / self.LOCK_FILE, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(stats_path, "r", encoding="utf-8") as f:
+                    stats = json.load(f)
+            except (OSError, ValueError):
+                stats = {"hits": 0, "misses": 0}
+            stats["hits" if hit else "misses"] += 1
+            tmp_path = stats_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, stats_path)
+
+        lookups = stats["hits"] + stats["misses"]
         return {
-            "transcript": " ".join(full_transcript),
-            "language": detected_lang,
-            "success": True
+            "hit": hit,
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0
         }
-        
+
+
+def hash_audio_file(audio_path, block_size=1024 * 1024):
+    """
+    SHA-256 of the raw audio bytes, read in blocks so large uploads are not held in memory.
+    """
+    digest = hashlib.sha256()
+    with open(audio_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_audio(audio_source):
+    """
+    Content hash of an audio source given either as a file path or as raw bytes.
+    """
+    if isinstance(audio_source, (bytes, bytearray)):
+        return hashlib.sha256(audio_source).hexdigest()
+    return hash_audio_file(audio_source)
+
+
+def _read_exactly(stream, size):
+    """
+    Read up to size bytes, looping over short pipe reads; returns less only at EOF.
+    """
+    buf = bytearray()
+    while len(buf) < size:
+        block = stream.read(size - len(buf))
+        if not block:
+            break
+        buf += block
+    return bytes(buf)
+
+
+def stream_audio_chunks(audio_source, chunk_seconds=CHUNK_SECONDS, sample_rate=SAMPLE_RATE):
+    """
+    Decode audio with ffmpeg and yield float32 chunks of chunk_seconds each.
+
+    Unlike whisper.load_audio, the recording is never materialised as one array:
+    ffmpeg writes 16-bit mono PCM to a pipe and only one chunk is held at a time,
+    so peak memory is independent of the recording length. audio_source may be a
+    file path or the encoded audio bytes, which are fed to ffmpeg on stdin.
+    """
+    from_bytes = isinstance(audio_source, (bytes, bytearray))
+    cmd = [
+        "ffmpeg",
+        "-threads", "0",
+        "-i", "pipe:0" if from_bytes else audio_source,
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sample_rate),
+        "-"
+    ]
+    if not from_bytes:
+        cmd.insert(1, "-nostdin")
+
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if from_bytes else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+    # Feed stdin and drain stderr on helper threads so neither pipe can fill up
+    # and deadlock ffmpeg while we are blocked reading PCM from stdout.
+    stderr_tail = []
+
+    def _drain_stderr():
+        for line in process.stderr:
+            stderr_tail.append(line)
+            del stderr_tail[:-20]
+
+    def _feed_stdin():
+        try:
+            process.stdin.write(audio_source)
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    threads = [threading.Thread(target=_drain_stderr, daemon=True)]
+    if from_bytes:
+        threads.append(threading.Thread(target=_feed_stdin, daemon=True))
+    for t in threads:
+        t.start()
+
+    chunk_bytes = chunk_seconds * sample_rate * 2  # int16 samples
+    try:
+        while True:
+            raw = _read_exactly(process.stdout, chunk_bytes)
+            if not raw:
+                break
+            yield np.frombuffer(raw, np.int16).astype(np.float32) / 32768.0
+            if len(raw) < chunk_bytes:
+                break
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+        for t in threads:
+            t.join(timeout=1)
+
+    if returncode != 0:
+        message = b"".join(stderr_tail).decode("utf-8", "replace").strip()
+        raise RuntimeError(f"Failed to load audio: {message}")
+
+
+def load_model(model_name=DEFAULT_MODEL_NAME):
+    """
+    Load the Whisper model (will download on first use). Imported lazily so
+    cache hits never pay for importing torch.
+    """
+    import whisper
+    print("Loading Whisper model...", file=sys.stderr)
+    return whisper.load_model(model_name)
+
+
+def run_transcription(model, audio_source):
+    """
+    Transcribe an audio path or bytes with an already loaded model, consuming
+    the decoded audio one 30 second chunk at a time.
+    """
+    import whisper
+
+    print("Decoding audio stream...", file=sys.stderr)
+    full_transcript = []
+    detected_lang = None
+    total_samples = 0
+    for i, chunk in enumerate(stream_audio_chunks(audio_source)):
+        total_samples += len(chunk)
+        chunk = whisper.pad_or_trim(chunk)
+
+        print(f"Processing chunk {i+1}...", file=sys.stderr)
+        mel = whisper.log_mel_spectrogram(chunk).to(model.device)
+
+        if i == 0:
+            print("Detecting language...", file=sys.stderr)
+            _, probs = model.detect_language(mel)
+            detected_lang = max(probs, key=probs.get)
+            print(f"Detected language: {detected_lang}", file=sys.stderr)
+
+        print("Transcribing chunk...", file=sys.stderr)
+        options = whisper.DecodingOptions(fp16=False)
+        result = whisper.decode(model, mel, options)
+        full_transcript.append(result.text.strip())
+
+    duration = total_samples / SAMPLE_RATE
+    print(f"Audio length: {duration:.2f} seconds in {math.ceil(duration / CHUNK_SECONDS)} chunk(s)", file=sys.stderr)
+
+    return {
+        "transcript": " ".join(full_transcript),
+        "language": detected_lang,
+        "duration": duration,
+        "success": True
+    }
+
+
+def transcribe_audio(audio_source, model_name=DEFAULT_MODEL_NAME, cache=None, model=None):
+    """
+    Transcribe audio using local Whisper model, chunking if longer than 30 seconds.
+    audio_source is a file path or the raw encoded audio bytes.
+    When a cache is given, identical audio transcribed with the same model and
+    options is served from disk without loading Whisper. A resident process can
+    pass an already loaded model to skip loading it per call.
+    """
+    cache_key = None
+    try:
+        if cache is not None:
+            options = {"fp16": False, "chunk_seconds": CHUNK_SECONDS}
+            cache_key = cache.make_key(hash_audio(audio_source), model_name, options)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                print("Transcription cache hit", file=sys.stderr)
+                cached["cache"] = cache.record(True)
+                return cached
+
+        if model is None:
+            model = load_model(model_name)
+        result = run_transcription(model, audio_source)
+
+        if cache is not None:
+            cache.put(cache_key, result)
+            result["cache"] = cache.record(False)
+        return result
+
     except Exception as e:
         print(f"Error during transcription: {str(e)}", file=sys.stderr)
         return {
@@ -69,33 +336,56 @@ def main():
     """
     Main function to handle command line arguments and transcribe audio
     """
-    if len(sys.argv) != 2:
-        print(json.dumps({
-            "transcript": "",
-            "error": "Usage: python transcribe_audio.py <audio_file_path>",
-            "success": False
-        }))
-        sys.exit(1)
-    
-    audio_path = sys.argv[1]
-    
-    # Check if audio file exists
-    if not os.path.exists(audio_path):
-        print(json.dumps({
-            "transcript": "",
-            "error": f"Audio file not found: {audio_path}",
-            "success": False
-        }))
-        sys.exit(1)
-    
+    parser = argparse.ArgumentParser(description="Transcribe audio with a local Whisper model")
+    parser.add_argument("audio_path", nargs="?", help="Path to the audio file")
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME, help="Whisper model name")
+    parser.add_argument("--stdin", action="store_true", help="Read the encoded audio bytes from stdin instead of a file")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the transcription cache")
+    args = parser.parse_args()
+
+    if args.stdin:
+        audio_source = sys.stdin.buffer.read()
+        if not audio_source:
+            print(json.dumps({
+                "transcript": "",
+                "error": "No audio data received on stdin",
+                "success": False
+            }))
+            sys.exit(1)
+    else:
+        if not args.audio_path:
+            print(json.dumps({
+                "transcript": "",
+                "error": "Usage: python transcribe_audio.py <audio_file_path> | --stdin [--model <name>] [--no-cache]",
+                "success": False
+            }))
+            sys.exit(1)
+
+        audio_source = args.audio_path
+
+        # Check if audio file exists
+        if not os.path.exists(audio_source):
+            print(json.dumps({
+                "transcript": "",
+                "error": f"Audio file not found: {audio_source}",
+                "success": False
+            }))
+            sys.exit(1)
+
     # Transcribe the audio
-    result = transcribe_audio(audio_path)
-    
+    cache = None
+    if not args.no_cache:
+        try:
+            cache = TranscriptionCache()
+        except OSError as e:
+            print(f"Warning: transcription cache disabled: {e}", file=sys.stderr)
+    result = transcribe_audio(audio_source, args.model, cache)
+
     # Output result as JSON
     print(json.dumps(result))
-    
+
     # Exit with appropriate code
     sys.exit(0 if result["success"] else 1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
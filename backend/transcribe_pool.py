@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Pre-fork Whisper transcription pool.
+
+The parent loads the Whisper model once and forks N workers that inherit the
+weights copy-on-write, so the pool costs roughly one model's worth of memory
+instead of N. Jobs are JSON lines ({"id": ..., "audio_path": ...}) dispatched
+round-robin; each worker holds at most --max-inflight jobs, and submission
+blocks on results once every worker is saturated (backpressure).
+
+Usage:
+    python transcribe_pool.py serve --workers 4 < jobs.jsonl > results.jsonl
+    python transcribe_pool.py benchmark --workers 4 a.wav b.wav ...
+"""
+
+import sys
+import os
+import gc
+import json
+import time
+import base64
+import select
+import argparse
+import subprocess
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from transcribe_audio import (
+    DEFAULT_MODEL_NAME,
+    TranscriptionCache,
+    load_model,
+    transcribe_audio
+)
+
+
+def _job_source(job):
+    if "audio_b64" in job:
+        return base64.b64decode(job["audio_b64"])
+    return job["audio_path"]
+
+
+def _set_worker_threads(threads):
+    if not threads:
+        return
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def worker_loop(model, model_name, job_fd, result_fd, use_cache=False):
+    """
+    Serve jobs from job_fd until EOF, writing one JSON result line per job.
+    """
+    cache = TranscriptionCache() if use_cache else None
+    with os.fdopen(job_fd, "r", encoding="utf-8") as jobs, os.fdopen(result_fd, "w", encoding="utf-8") as results:
+        for line in jobs:
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            started = time.perf_counter()
+            try:
+                result = transcribe_audio(_job_source(job), model_name, cache, model=model)
+            except Exception as e:
+                result = {"transcript": "", "error": str(e), "success": False}
+            result["id"] = job.get("id")
+            result["worker_pid"] = os.getpid()
+            result["elapsed"] = time.perf_counter() - started
+            results.write(json.dumps(result) + "\n")
+            results.flush()
+
+
+class _Worker:
+    """
+    Parent-side handle on one worker: its pid, job pipe and partial result buffer.
+    """
+
+    def __init__(self, pid, job_file, result_fd, process=None):
+        self.pid = pid
+        self.job_file = job_file
+        self.result_fd = result_fd
+        self.process = process
+        self.inflight = 0
+        self.buffer = b""
+
+
+class TranscriptionPool:
+    """
+    Pool of transcription workers sharing one model.
+
+    mode="fork" loads the model in the parent and forks workers that share the
+    weights pages copy-on-write. mode="spawn" starts independent interpreters
+    that each load their own copy; it exists as the baseline for benchmarks.
+    """
+
+    def __init__(self, num_workers=2, model_name=DEFAULT_MODEL_NAME, max_inflight=2,
+                 mode="fork", threads_per_worker=None, use_cache=False):
+        if mode not in ("fork", "spawn"):
+            raise ValueError(f"Unknown pool mode: {mode}")
+        self.num_workers = num_workers
+        self.model_name = model_name
+        self.max_inflight = max_inflight
+        self.mode = mode
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        self.use_cache = use_cache
+        self.workers = []
+        self._next = 0
+        self._completed = []
+
+    def start(self):
+        if self.mode == "fork":
+            self._start_forked()
+        else:
+            self._start_spawned()
+        return self
+
+    def _start_forked(self):
+        model = load_model(self.model_name)
+        # Move everything allocated so far into the permanent generation so the
+        # cyclic GC in each child never writes to (and un-shares) those pages.
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+
+        for _ in range(self.num_workers):
+            job_r, job_w = os.pipe()
+            result_r, result_w = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                # Child: drop every parent-side descriptor, including siblings'
+                os.close(job_w)
+                os.close(result_r)
+                for worker in self.workers:
+                    worker.job_file.close()
+                    os.close(worker.result_fd)
+                code = 0
+                try:
+                    _set_worker_threads(self.threads_per_worker)
+                    worker_loop(model, self.model_name, job_r, result_w, self.use_cache)
+                except BaseException as e:
+                    print(f"Transcription worker {os.getpid()} failed: {e}", file=sys.stderr)
+                    code = 1
+                finally:
+                    os._exit(code)
+
+            os.close(job_r)
+            os.close(result_w)
+            self.workers.append(_Worker(pid, os.fdopen(job_w, "w", encoding="utf-8"), result_r))
+
+        print(f"Forked {self.num_workers} transcription worker(s) sharing model '{self.model_name}'", file=sys.stderr)
+
+    def _start_spawned(self):
+        for _ in range(self.num_workers):
+            cmd = [sys.executable, os.path.abspath(__file__), "worker",
+                   "--model", self.model_name, "--threads", str(self.threads_per_worker)]
+            if self.use_cache:
+                cmd.append("--cache")
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+            self.workers.append(_Worker(process.pid, process.stdin, process.stdout.fileno(), process))
+
+        print(f"Started {self.num_workers} independent transcription worker(s)", file=sys.stderr)
+
+    def _collect(self, timeout=None):
+        """
+        Read whatever results are ready; blocks up to timeout if none are.
+        """
+        busy = {w.result_fd: w for w in self.workers if w.inflight > 0}
+        if not busy:
+            return
+        ready, _, _ = select.select(list(busy), [], [], timeout)
+        for fd in ready:
+            worker = busy[fd]
+            data = os.read(fd, 65536)
+            if not data:
+                raise RuntimeError(f"Transcription worker {worker.pid} exited with {worker.inflight} job(s) in flight")
+            worker.buffer += data
+            while b"\n" in worker.buffer:
+                line, worker.buffer = worker.buffer.split(b"\n", 1)
+                worker.inflight -= 1
+                self._completed.append(json.loads(line))
+
+    def submit(self, job):
+        """
+        Send a job to the next worker in rotation with spare capacity, blocking
+        on results while every worker is at max_inflight.
+        """
+        while True:
+            for offset in range(self.num_workers):
+                worker = self.workers[(self._next + offset) % self.num_workers]
+                if worker.inflight < self.max_inflight:
+                    self._next = (self._next + offset + 1) % self.num_workers
+                    worker.job_file.write(json.dumps(job) + "\n")
+                    worker.job_file.flush()
+                    worker.inflight += 1
+                    return
+            self._collect()
+
+    def drain_completed(self):
+        completed, self._completed = self._completed, []
+        return completed
+
+    def map(self, jobs):
+        """
+        Submit every job and yield results as they complete (not in submission order).
+        """
+        for job in jobs:
+            self.submit(job)
+            self._collect(timeout=0)
+            yield from self.drain_completed()
+        while any(w.inflight for w in self.workers):
+            self._collect()
+            yield from self.drain_completed()
+
+    def memory(self):
+        """
+        Per-worker memory in MB. RSS counts shared pages in full for every
+        worker; PSS splits them between sharers and is the honest total.
+        """
+        return [dict(pid=w.pid, **process_memory(w.pid)) for w in self.workers]
+
+    def close(self):
+        for worker in self.workers:
+            try:
+                worker.job_file.close()
+            except OSError:
+                pass
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.wait()
+                worker.process.stdout.close()
+            else:
+                os.waitpid(worker.pid, 0)
+                os.close(worker.result_fd)
+        self.workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def process_memory(pid):
+    """
+    RSS and PSS of a process in MB, read from /proc (Linux only).
+    """
+    memory = {"rss_mb": None, "pss_mb": None}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    memory["rss_mb"] = int(line.split()[1]) / 1024
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    memory["pss_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return memory
+
+
+def run_benchmark(audio_paths, num_workers, model_name, repeat, max_inflight):
+    """
+    Compare the forked pool against N independent processes on the same jobs.
+    Throughput is audio seconds transcribed per wall-clock second.
+    """
+    jobs = [{"id": i, "audio_path": path} for i, path in enumerate(audio_paths * repeat)]
+    report = {"workers": num_workers, "jobs": len(jobs), "modes": {}}
+
+    for mode in ("fork", "spawn"):
+        pool = TranscriptionPool(num_workers, model_name, max_inflight, mode=mode)
+        startup = time.perf_counter()
+        pool.start()
+        # One warm-up job per worker so first-inference setup counts as
+        # startup rather than against throughput
+        warmup = [{"id": "warmup", "audio_path": audio_paths[0]} for _ in range(num_workers)]
+        list(pool.map(warmup))
+        startup = time.perf_counter() - startup
+
+        started = time.perf_counter()
+        results = list(pool.map(jobs))
+        wall = time.perf_counter() - started
+
+        memory = pool.memory()
+        parent = process_memory(os.getpid()) if mode == "fork" else None
+        pool.close()
+
+        audio_seconds = sum(r.get("duration", 0.0) for r in results if r.get("success"))
+        report["modes"][mode] = {
+            "startup_seconds": startup,
+            "wall_seconds": wall,
+            "audio_seconds": audio_seconds,
+            "throughput": audio_seconds / wall if wall > 0 else 0.0,
+            "failures": sum(1 for r in results if not r.get("success")),
+            "workers": memory,
+            "parent": parent,
+            "total_pss_mb": sum(m["pss_mb"] or 0 for m in memory) + ((parent or {}).get("pss_mb") or 0)
+        }
+        print(f"{mode}: {report['modes'][mode]['throughput']:.2f} audio s / wall s", file=sys.stderr)
+
+    return report
+
+
+def serve(args):
+    with TranscriptionPool(args.workers, args.model, args.max_inflight, use_cache=not args.no_cache) as pool:
+        jobs = (json.loads(line) for line in sys.stdin if line.strip())
+        for result in pool.map(jobs):
+            print(json.dumps(result), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork Whisper transcription pool")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", help="Transcribe JSON-line jobs from stdin")
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    serve_parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    serve_parser.add_argument("--max-inflight", type=int, default=2)
+    serve_parser.add_argument("--no-cache", action="store_true")
+
+    bench_parser = sub.add_parser("benchmark", help="Compare the forked pool against independent processes")
+    bench_parser.add_argument("audio_paths", nargs="+")
+    bench_parser.add_argument("--workers", type=int, default=2)
+    bench_parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    bench_parser.add_argument("--repeat", type=int, default=3)
+    bench_parser.add_argument("--max-inflight", type=int, default=2)
+
+    # Internal: one independent worker, used as the benchmark baseline
+    worker_parser = sub.add_parser("worker")
+    worker_parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    worker_parser.add_argument("--threads", type=int, default=None)
+    worker_parser.add_argument("--cache", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+    elif args.command == "benchmark":
+        report = run_benchmark(args.audio_paths, args.workers, args.model, args.repeat, args.max_inflight)
+        print(json.dumps(report, indent=2))
+    else:
+        _set_worker_threads(args.threads)
+        model = load_model(args.model)
+        worker_loop(model, args.model, os.dup(sys.stdin.fileno()), os.dup(sys.stdout.fileno()), args.cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+const path = require('path');
+const { spawn } = require('child_process');
+
+// Client for analysis_jobs.py: personality analyses are queued in SQLite and
+// run by `python analysis_jobs.py worker`, so requests never wait on the LLM.
+// Enabled with QFLOW_ANALYSIS_QUEUE=1.
+const SCRIPT = path.join(__dirname, '..', 'analysis_jobs.py');
+
+function enabled() {
+    return process.env.QFLOW_ANALYSIS_QUEUE === '1' || process.env.QFLOW_ANALYSIS_QUEUE === 'true';
+}
+
+function run(args, input) {
+    return new Promise((resolve, reject) => {
+        const pythonProcess = spawn('python', [SCRIPT, ...args]);
+        let output = '';
+        let errorOutput = '';
+
+        pythonProcess.stdout.on('data', (data) => {
+            output += data.toString();
+        });
+        pythonProcess.stderr.on('data', (data) => {
+            errorOutput += data.toString();
+        });
+        pythonProcess.on('error', reject);
+        pythonProcess.on('close', (code) => {
+            try {
+                const result = JSON.parse(output.trim());
+                if (code !== 0 || result.error) {
+                    reject(new Error(result.error || `analysis_jobs.py exited with code ${code}`));
+                    return;
+                }
+                resolve(result);
+            } catch (parseError) {
+                reject(new Error(`Unparseable analysis_jobs.py output: ${errorOutput || output}`));
+            }
+        });
+        pythonProcess.stdin.end(input || '');
+    });
+}
+
+// Queue an analysis; idempotent per session. Resolves to {id, session_id, status, attempts}
+function enqueue(payload) {
+    return run(['enqueue'], JSON.stringify(payload));
+}
+
+// {status: queued|running|done|dead|unknown, attempts, last_error, result}
+function status(sessionId) {
+    return run(['status', '--session', String(sessionId)]);
+}
+
+module.exports = { enabled, enqueue, status };
@@ -0,0 +1,87 @@
+const path = require('path');
+const readline = require('readline');
+const { spawn } = require('child_process');
+
+// Client for qflow_pool.py: one long-lived supervisor process whose prewarmed
+// Python workers answer Qflow turns and personality analyses. Enabled with
+// QFLOW_POOL=1; pool sizing comes from the QFLOW_POOL_* variables.
+class QflowPool {
+    constructor() {
+        this.process = null;
+        this.pending = new Map();
+        this.nextId = 1;
+    }
+
+    enabled() {
+        return process.env.QFLOW_POOL === '1' || process.env.QFLOW_POOL === 'true';
+    }
+
+    start() {
+        if (this.process) {
+            return;
+        }
+        const child = spawn('python', [path.join(__dirname, '..', 'qflow_pool.py'), 'serve'], {
+            stdio: ['pipe', 'pipe', 'inherit']
+        });
+        this.process = child;
+
+        readline.createInterface({ input: child.stdout }).on('line', (line) => {
+            let message;
+            try {
+                message = JSON.parse(line);
+            } catch (parseError) {
+                console.error('Unparseable Qflow pool output:', line);
+                return;
+            }
+            const waiter = this.pending.get(message.id);
+            if (!waiter) {
+                return;
+            }
+            this.pending.delete(message.id);
+            if (message.ok) {
+                waiter.resolve(message.result);
+            } else {
+                waiter.reject(new Error(message.error || 'Qflow pool request failed'));
+            }
+        });
+
+        // Spawn failures (no python) and writes after the supervisor died
+        // surface here instead of crashing the server; 'close' follows an
+        // exit, but not always a failed spawn
+        child.on('error', (error) => {
+            console.error('Qflow pool process error:', error);
+            this.stop(child, `Qflow pool unavailable: ${error.message}`);
+        });
+        child.stdin.on('error', (error) => {
+            console.error('Qflow pool stdin error:', error);
+        });
+
+        child.on('close', (code) => {
+            console.error(`Qflow pool exited with code ${code}`);
+            this.stop(child, 'Qflow pool exited');
+        });
+    }
+
+    // Forget a dead supervisor and fail its pending requests; the next request starts a new one
+    stop(child, reason) {
+        if (this.process !== child) {
+            return;
+        }
+        this.process = null;
+        for (const waiter of this.pending.values()) {
+            waiter.reject(new Error(reason));
+        }
+        this.pending.clear();
+    }
+
+    request(command, fields = {}) {
+        this.start();
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve, reject });
+            this.process.stdin.write(JSON.stringify({ id, command, ...fields }) + '\n');
+        });
+    }
+}
+
+module.exports = new QflowPool();
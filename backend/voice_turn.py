@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Voice turn: transcribe a spoken answer and advance the Qflow conversation in
+one process.
+
+Replaces the transcribe_audio.py + qflow_conversation.py pair of launches per
+spoken answer. The question bank and session state are prepared on a
+background thread while the audio is still being decoded, so the turn costs
+max(transcription, session setup) + the Qflow turn rather than their sum.
+"""
+
+import sys
+import os
+import json
+import argparse
+import threading
+import contextvars
+from concurrent.futures import Future
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from transcribe_audio import DEFAULT_MODEL_NAME, TranscriptionCache, transcribe_audio
+from Qflow.qflow_conversation import prepare_session, advance_conversation
+from Qflow.tracing import trace, span
+from Qflow import metrics
+
+
+def _prepare_in_background(*args) -> Future:
+    """
+    Run prepare_session on a daemon thread, in a copy of the caller's context
+    (so its span joins the turn's trace). Unlike an executor thread, which is
+    joined at interpreter exit, it never keeps a failed turn's process alive.
+    """
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            future.set_result(context.run(prepare_session, *args))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="qflow-prepare-session", daemon=True).start()
+    return future
+
+
+def voice_turn(audio_source, used_indices=None, current_question_index=None,
+               model_name=DEFAULT_MODEL_NAME, cache=None, session_id=None, budget=None):
+    """
+    Transcribe audio_source (path or bytes) and feed the transcript into the
+    conversation. Returns {"success", "transcript", "language", "turn", ...}
+    where "turn" is the usual qflow_conversation response data.
+    """
+    session_future = _prepare_in_background(used_indices, current_question_index, session_id, budget)
+
+    with span("transcribe_audio", **{"whisper.model": model_name}) as transcribe_span:
+        transcription = transcribe_audio(audio_source, model_name, cache)
+        transcribe_span.set_attributes({
+            "audio.duration_s": transcription.get("duration"),
+            "transcribe.cache_hit": transcription.get("cache", {}).get("hit")
+        })
+    result = {
+        "transcript": transcription.get("transcript", ""),
+        "language": transcription.get("language"),
+        "success": False
+    }
+    if "cache" in transcription:
+        result["cache"] = transcription["cache"]
+
+    # A failed turn returns at once; the daemon setup thread doesn't hold up exit
+    if not transcription.get("success"):
+        result["error"] = transcription.get("error", "Transcription failed")
+        return result
+    if not result["transcript"].strip():
+        result["error"] = "No speech detected in the recording"
+        return result
+
+    qflow, error = session_future.result()
+    if error is not None:
+        result["error"] = error["error"]
+        return result
+
+    result["turn"] = advance_conversation(qflow, result["transcript"])
+    result["success"] = True
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Transcribe a spoken answer and advance the Qflow conversation')
+    parser.add_argument('audio_path', nargs='?', help='Path to the audio file')
+    parser.add_argument('--stdin', action='store_true', help='Read the encoded audio bytes from stdin')
+    parser.add_argument('--used_indices', help='JSON string of used question indices')
+    parser.add_argument('--current_question_index', type=int, help='Current question index')
+    parser.add_argument('--session_id', help='Session id recorded in the conversation log')
+    parser.add_argument('--budget', help='JSON budget from the previous turn\'s progress')
+    parser.add_argument('--model', default=DEFAULT_MODEL_NAME, help='Whisper model name')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the transcription cache')
+
+    args = parser.parse_args()
+
+    if args.stdin:
+        audio_source = sys.stdin.buffer.read()
+    elif args.audio_path and os.path.exists(args.audio_path):
+        audio_source = args.audio_path
+    else:
+        print(json.dumps({
+            "success": False,
+            "error": "Usage: python voice_turn.py <audio_file_path> | --stdin [--used_indices <indices>] [--current_question_index <index>]"
+        }))
+        return False
+
+    cache = None
+    if not args.no_cache:
+        try:
+            cache = TranscriptionCache()
+        except OSError as e:
+            print(f"Warning: transcription cache disabled: {e}", file=sys.stderr)
+
+    try:
+        with trace("qflow.voice_turn"):
+            result = voice_turn(audio_source, args.used_indices, args.current_question_index, args.model, cache, args.session_id,
+                                args.budget)
+    except Exception as e:
+        print(f"Error in voice_turn: {e}", file=sys.stderr)
+        import traceback
+        print(traceback.format_exc(), file=sys.stderr)
+        result = {"success": False, "error": str(e)}
+
+    print(json.dumps(metrics.attach_summary(result)))
+    return result["success"]
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)